@@ -0,0 +1,34 @@
+"""
+This file contains helpers for working with AQI values
+"""
+import numpy as np
+
+#upper (inclusive) aqi of every category but the last (same bins as get_category)
+CATEGORY_BREAKPOINTS = [50, 100, 150, 200, 300]
+CATEGORIES = ["Good", "Moderate", "Unhealthy for Sensitive Groups", "Unhealthy", "Very Unhealthy", "Hazardous"]
+_CATEGORY_BREAKPOINTS = np.array(CATEGORY_BREAKPOINTS)
+_CATEGORIES = np.array(CATEGORIES, dtype=object)
+
+
+def get_category(aqi):
+    """
+    Bins aqi values into their given categories
+    """
+    if aqi <= 50:
+        return "Good"
+    if aqi <= 100:
+        return "Moderate"
+    if aqi <= 150:
+        return "Unhealthy for Sensitive Groups"
+    if aqi <= 200:
+        return "Unhealthy"
+    if aqi <= 300:
+        return "Very Unhealthy"
+    return "Hazardous"
+
+
+def get_categories(aqi):
+    """
+    Bins an array (or nested list) of aqi values into their given categories, returning a list of the same shape
+    """
+    return _CATEGORIES[np.searchsorted(_CATEGORY_BREAKPOINTS, np.asarray(aqi), side='left')].tolist()
@@ -0,0 +1,127 @@
+"""
+This file contains the bucketed (compact) layout of the historic data. The measurements of one station
+over a month are packed into one document of parallel arrays (day of the month, aqi, category code,
+defining parameter, sites reporting, historic document id), so a 30 day series is read from 1-2 documents
+instead of 30, and long series take a fraction of the storage and index size of one document per day.
+The buckets are derived from the historic-data collection, which stays the source of truth (pagination,
+projections and rollups read it): posting data repacks the station/months it touched.
+Reads are served from the buckets when HISTORIC_BUCKETS is enabled
+"""
+from itertools import groupby
+from pymongo import ReplaceOne
+from .models import Historic, HistoricBucket
+from .aqi import CATEGORIES
+from .bulk import bulk_write
+from .dates import date_string, month_start, next_month_start
+
+CATEGORY_CODES = {category: code for code, category in enumerate(CATEGORIES)}
+BUCKET_LOCATION_FIELDS = ('Lat', 'Long', 'Full_AQSID', 'Coordinates')
+
+
+def bucket_key(d):
+    """
+    Returns the (month, lat, long) bucket holding the measurement
+    """
+    return (date_string(d['Date'])[:7], float(d['Location']['Lat']), float(d['Location']['Long']))
+
+
+def pack(month, rows):
+    """
+    Returns the bucket document of one station's rows of the month
+    """
+    rows = sorted(rows, key=lambda row: row['Date'])
+    location = rows[-1]['Location']
+    return {
+        'Month': month,
+        'Location': {field: location[field] for field in BUCKET_LOCATION_FIELDS if field in location},
+        'Days': [row['Date'].day for row in rows],
+        'AQI': [row['AQI'] for row in rows],
+        'Category': [CATEGORY_CODES[row['Category']] for row in rows],
+        'Defining_Parameter': [row.get('Defining_Parameter') for row in rows],
+        'Sites': [row.get('Number_of_Sites_Reporting') for row in rows],
+        'Ids': [row['_id'] for row in rows]
+    }
+
+
+def unpack(bucket, start=None, end=None):
+    """
+    Returns the measurement documents packed in the bucket, dated from start to end (YYYY-MM-DD),
+    with the ids of their historic documents (buckets packed before the ids were kept have none)
+    """
+    rows = []
+    ids = bucket.get('Ids') or [None] * len(bucket['Days'])
+    for day, aqi, category, parameter, sites, _id in zip(bucket['Days'], bucket['AQI'], bucket['Category'],
+                                                         bucket['Defining_Parameter'], bucket['Sites'], ids):
+        date = f"{bucket['Month']}-{day:02d}"
+        if (start is not None and date < start) or (end is not None and date > end):
+            continue
+        row = {'Date': date, 'AQI': aqi, 'Category': CATEGORIES[category], 'Location': bucket['Location']}
+        if _id is not None:
+            row['_id'] = _id
+        if parameter is not None:
+            row['Defining_Parameter'] = parameter
+        if sites is not None:
+            row['Number_of_Sites_Reporting'] = sites
+        rows.append(row)
+    return rows
+
+
+def refresh_buckets(keys, chunk_size=1_000):
+    """
+    Repacks the given (month, lat, long) buckets from the historic documents. Returns the number of rewritten buckets
+    """
+    keys = set(keys)
+    if not keys:
+        return 0
+    months = sorted({month for month, _, _ in keys})
+    rows = Historic.objects(Date__gte=month_start(months[0]), Date__lt=next_month_start(months[-1]),
+                            Location__Lat__in=list({lat for _, lat, _ in keys}),
+                            Location__Long__in=list({long for _, _, long in keys})
+                            ).as_pymongo()
+
+    groups = {}
+    for row in rows:
+        key = bucket_key(row)
+        if key in keys:
+            groups.setdefault(key, []).append(row)
+    operations = [ReplaceOne({'Month': month, 'Location.Lat': lat, 'Location.Long': long}, pack(month, rows), upsert=True)
+                    for (month, lat, long), rows in groups.items()]
+    bulk_write(HistoricBucket, operations, chunk_size)
+    return len(operations)
+
+
+def rebuild_buckets(chunk_size=1_000):
+    """
+    Packs every historic document into buckets, one month at a time. Returns the number of rewritten buckets
+    """
+    rewritten = 0
+    for month in sorted({date_string(date)[:7] for date in Historic.objects.distinct('Date')}):
+        rows = Historic.objects(Date__gte=month_start(month), Date__lt=next_month_start(month)
+                                ).only('Location.Lat', 'Location.Long').as_pymongo()
+        rewritten += refresh_buckets({(month, row['Location']['Lat'], row['Location']['Long']) for row in rows}, chunk_size)
+    return rewritten
+
+
+def read_series(lat, long, start, end):
+    """
+    Returns the measurement documents of the station at lat/long dated from start to end, sorted by date
+    """
+    buckets = HistoricBucket.objects(Month__gte=start[:7], Month__lte=end[:7],
+                                     Location__Lat=float(lat), Location__Long=float(long)
+                                     ).order_by('Month').exclude('id').as_pymongo()
+    return [row for bucket in buckets for row in unpack(bucket, start, end)]
+
+
+def read_bbox(start, end, bLat, tLat, lLong, rLong, batch_size=1_000):
+    """
+    Yields the measurement documents dated from start to end inside the box, sorted by date/lat/long.
+    The buckets are read in month order, so only the box's buckets of one month are held in memory
+    """
+    buckets = HistoricBucket.objects(Month__gte=start[:7], Month__lte=end[:7],
+                                     Location__Lat__gte=bLat, Location__Lat__lte=tLat,
+                                     Location__Long__gte=lLong, Location__Long__lte=rLong
+                                     ).order_by('Month').exclude('id').as_pymongo().batch_size(batch_size)
+    for month, month_buckets in groupby(buckets, key=lambda bucket: bucket['Month']):
+        rows = [row for bucket in month_buckets for row in unpack(bucket, start, end)]
+        rows.sort(key=lambda row: (row['Date'], row['Location']['Lat'], row['Location']['Long']))
+        yield from rows
@@ -0,0 +1,67 @@
+"""
+This file contains helpers for writing many documents with pymongo bulk writes
+instead of one round trip per document
+"""
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from .geo import point
+from .aqi import get_categories
+from .dates import to_datetime
+
+DUPLICATE_KEY = 11000 #mongodb error code for unique index violations
+
+
+def document_key(d):
+    """
+    Returns the filter matching the document for the given date/location payload
+    """
+    return {
+        'Date': to_datetime(d['Date']),
+        'Location.Lat': float(d['Location']['Lat']),
+        'Location.Long': float(d['Location']['Long'])
+    }
+
+
+def bulk_write(model, operations, chunk_size):
+    """
+    Runs the operations against the model's collection as unordered bulk writes of
+    at most chunk_size operations. Returns the matched/modified/upserted counts.
+    Operations losing an upsert race on a unique index are counted as duplicates,
+    any other write error is raised
+    """
+    collection = model._get_collection()
+    counts = {'matched': 0, 'modified': 0, 'upserted': 0, 'duplicates': 0}
+    for start in range(0, len(operations), chunk_size):
+        try:
+            result = collection.bulk_write(operations[start:start + chunk_size], ordered=False).bulk_api_result
+        except BulkWriteError as err:
+            if any(error['code'] != DUPLICATE_KEY for error in err.details['writeErrors']):
+                raise
+            result = err.details
+            counts['duplicates'] += len(result['writeErrors'])
+        counts['matched'] += result['nMatched']
+        counts['modified'] += result['nModified']
+        counts['upserted'] += result['nUpserted']
+    return counts
+
+
+def measurement_upserts(data, key=None):
+    """
+    Returns an upsert operation per aqi measurement keyed on its date and location (plus any extra key fields),
+    so posting the same measurement twice updates the stored document instead of duplicating it.
+    The site metadata is not stored with the measurement but in the station registry (see stations.py)
+    """
+    categories = get_categories([d['AQI'] for d in data])
+    operations = []
+    for d, category in zip(data, categories):
+        fields = {
+            'Defining_Parameter': d['Defining_Parameter'],
+            'AQI': d['AQI'],
+            'Category': category,
+            'Location.Coordinates': point(d['Location']['Lat'], d['Location']['Long'])
+        }
+        #the AQSID is optional, measurements without one are not joined with a station
+        if d['Location'].get('Full_AQSID'):
+            fields['Location.Full_AQSID'] = d['Location']['Full_AQSID']
+        operations.append(UpdateOne(dict(document_key(d), **(key or {})), {'$set': fields}, upsert=True))
+    return operations
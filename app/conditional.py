@@ -0,0 +1,138 @@
+"""
+This file contains the data versions of the collections and conditional GET support.
+Every write to a collection bumps its data version (a random token and the time of the write),
+kept in the 'data-versions' collection so every worker sees the writes of the others (a per worker
+cache backend would not). Read responses carry an ETag built from the data
+versions they depend on and their normalized query, and a Last-Modified of the latest write,
+so clients polling unchanged data get a 304 after one (indexed) read of the data versions.
+The versions read during a request are kept for the rest of it
+"""
+from datetime import datetime, timezone
+from functools import wraps
+from hashlib import sha1
+from uuid import uuid4
+from flask import request, make_response, has_request_context
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+from .models import DataVersion
+from .http_status import HttpStatus
+
+BBOX_ARGS = ('bLat', 'tLat', 'lLong', 'rLong')
+DATE_ARGS = ('start', 'end')
+IGNORED_ARGS = ('token', 'format') #the token does not change the data, the format is keyed with the Accept header
+
+
+def new_version():
+    return {'Token': uuid4().hex, 'Modified': int(datetime.now(timezone.utc).timestamp())}
+
+
+def request_versions():
+    #the data versions read (or written) during the current request, empty outside of requests
+    if not has_request_context():
+        return {}
+    if not hasattr(request, 'data_versions'):
+        request.data_versions = {}
+    return request.data_versions
+
+
+def data_versions(*collections):
+    """
+    Returns the {'token', 'modified'} data versions of the collections, keyed by collection,
+    reading the ones not read yet during the request with one query
+    """
+    known = request_versions()
+    missing = [collection for collection in collections if collection not in known]
+    if missing:
+        versions = DataVersion._get_collection()
+        found = {version['_id']: version for version in versions.find({'_id': {'$in': missing}})}
+        for collection in missing:
+            if collection not in found:
+                #the first version of a collection is created once, concurrent readers all get the winner's
+                try:
+                    versions.update_one({'_id': collection}, {'$setOnInsert': new_version()}, upsert=True)
+                except DuplicateKeyError:
+                    pass
+                found[collection] = versions.find_one({'_id': collection})
+            known[collection] = {'token': found[collection]['Token'], 'modified': found[collection]['Modified']}
+    return {collection: known[collection] for collection in collections}
+
+
+def data_version(collection):
+    """
+    Returns the {'token', 'modified'} data version of the collection
+    """
+    return data_versions(collection)[collection]
+
+
+def touch(*models):
+    """
+    Bumps the data versions of the models' collections after a write
+    """
+    version = new_version()
+    collections = [model._get_collection_name() for model in models]
+    DataVersion._get_collection().bulk_write([UpdateOne({'_id': collection}, {'$set': version}, upsert=True)
+                                                for collection in collections])
+    known = request_versions()
+    for collection in collections:
+        known[collection] = {'token': version['Token'], 'modified': version['Modified']}
+
+
+def normalized_query():
+    """
+    Returns the query args as a canonical string, so equivalent queries share cache keys and ETags:
+    args are sorted, bbox coordinates rounded to 6 decimals (stations have 4) and dates stripped
+    """
+    args = []
+    for arg, value in sorted(request.args.items(multi=True)):
+        if arg in IGNORED_ARGS:
+            continue
+        if arg in BBOX_ARGS:
+            try:
+                value = repr(round(float(value), 6) + 0.0)
+            except ValueError:
+                pass
+        elif arg in DATE_ARGS:
+            value = value.strip()
+        args.append(f'{arg}={value}')
+    return '&'.join(args)
+
+
+def conditional(*models, daily=False):
+    """
+    Decorates a resource GET so its 200 responses carry an ETag/Last-Modified derived from the data versions
+    of the models' collections, answering matching If-None-Match (or If-Modified-Since) requests with a 304.
+    Responses of daily resources (e.g. forecasts from today on) also change when the (UTC) day does
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            versions = list(data_versions(*[model._get_collection_name() for model in models]).values())
+            modified = max(version['modified'] for version in versions)
+            tokens = [version['token'] for version in versions]
+            if daily:
+                today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+                modified = max(modified, int(today.timestamp()))
+                tokens.append(today.strftime('%Y-%m-%d'))
+            tokens += [request.args.get('format', ''), request.headers.get('Accept', ''), normalized_query()]
+            etag = sha1('/'.join(tokens).encode()).hexdigest()
+            last_modified = datetime.fromtimestamp(modified, timezone.utc)
+
+            #If-Modified-Since is only used by clients without an ETag
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains(etag)
+            else:
+                not_modified = request.if_modified_since is not None and request.if_modified_since >= last_modified
+
+            if not_modified:
+                response = make_response('', HttpStatus.not_modified_304.value)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != HttpStatus.ok_200.value:
+                    return response
+            response.set_etag(etag)
+            response.last_modified = last_modified
+            #clients may keep the response but must revalidate it before reuse
+            response.cache_control.no_cache = True
+            return response
+        return decorated
+    return decorator
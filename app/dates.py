@@ -0,0 +1,58 @@
+"""
+This file contains helpers for the Date fields of the measurement collections. Dates are stored
+as native (BSON) dates at midnight UTC and exchanged with clients as YYYY-MM-DD strings
+"""
+from datetime import date, datetime, timedelta
+from marshmallow import ValidationError
+
+DATE_FORMAT = '%Y-%m-%d'
+MIN_DATE = date(1980, 1, 1) #first day of the historic data
+
+
+def to_datetime(value):
+    """
+    Returns the stored (midnight) datetime of a YYYY-MM-DD string, date or datetime
+    """
+    if isinstance(value, str):
+        return datetime.strptime(value, DATE_FORMAT)
+    if isinstance(value, datetime):
+        return datetime.combine(value.date(), datetime.min.time())
+    return datetime.combine(value, datetime.min.time())
+
+
+def date_string(value):
+    """
+    Returns the YYYY-MM-DD string of a date/datetime (strings are returned as they are)
+    """
+    if isinstance(value, str):
+        return value
+    return value.strftime(DATE_FORMAT)
+
+
+def today():
+    """
+    Returns the current (UTC) date as a YYYY-MM-DD string
+    """
+    return datetime.utcnow().strftime(DATE_FORMAT)
+
+
+def month_start(month):
+    """
+    Returns the datetime of the first day of a YYYY-MM month
+    """
+    return datetime.strptime(month, '%Y-%m')
+
+
+def next_month_start(month):
+    """
+    Returns the datetime of the first day of the month following a YYYY-MM month
+    """
+    return (month_start(month) + timedelta(days=32)).replace(day=1)
+
+
+def past_date(value):
+    """
+    Validates a date is between MIN_DATE and today, evaluated when validating (not when the schema is defined)
+    """
+    if not MIN_DATE <= value <= datetime.utcnow().date():
+        raise ValidationError(f'Must be between {MIN_DATE} and today.')
@@ -0,0 +1,125 @@
+"""
+This file contains the server-side forecast job. It replaces the client loop of
+/model-data -> /predict -> /forecasts with one in-process pass:
+one aggregation pulls the last 30 days of every station, the (N, 30, 1) model input is built
+and gap filled with numpy, inference runs batched and the forecasts are bulk written
+"""
+from datetime import datetime, timedelta
+from pymongo import UpdateOne
+from .models import Historic, Forecast
+from .inference import batch_predictor, preprocess, postprocess
+from .geo import point, DATE_LAT_LONG_INDEX
+from .aqi import get_categories
+from .bulk import bulk_write
+from .dates import to_datetime
+import numpy as np
+
+WINDOW_DAYS = 30 #days of history the model takes as input
+
+
+def load_windows(end_date):
+    """
+    Returns the station coordinates (N, 2), their AQSIDs (None if unknown) and their AQI values (N, 30) 
+    for the 30 days ending on end_date (missing days are NaN), from a single aggregation over historic-data
+    """
+    end_date = to_datetime(end_date)
+    start_date = end_date - timedelta(days=WINDOW_DAYS - 1)
+    pipeline = [
+        {'$match': {'Date': {'$gte': start_date, '$lte': end_date}}},
+        {'$group': {
+            '_id': {'Lat': '$Location.Lat', 'Long': '$Location.Long'},
+            'AQSID': {'$max': '$Location.Full_AQSID'},
+            'Dates': {'$push': '$Date'},
+            'AQI': {'$push': '$AQI'}
+        }}
+    ]
+    stations = list(Historic._get_collection().aggregate(pipeline, allowDiskUse=True, hint=DATE_LAT_LONG_INDEX))
+
+    coordinates = np.array([[s['_id']['Lat'], s['_id']['Long']] for s in stations], dtype=float).reshape(-1, 2)
+    aqsids = [s.get('AQSID') for s in stations]
+    windows = np.full((len(stations), WINDOW_DAYS), np.nan)
+    if not stations:
+        return coordinates, aqsids, windows
+
+    #scatters every (station, day, aqi) observation into the window matrix at once
+    counts = [len(s['Dates']) for s in stations]
+    rows = np.repeat(np.arange(len(stations)), counts)
+    dates = np.array([date for s in stations for date in s['Dates']], dtype='datetime64[D]')
+    days = (dates - np.datetime64(start_date.strftime('%Y-%m-%d'), 'D')).astype(int)
+    windows[rows, days] = [aqi for s in stations for aqi in s['AQI']]
+    return coordinates, aqsids, windows
+
+
+def fill_gaps(windows):
+    """
+    Fills missing days of every window with the last observed value 
+    (leading gaps take the first observed value)
+    """
+    observed = ~np.isnan(windows)
+    positions = np.arange(windows.shape[1])
+
+    #index of the last observed day at or before each day (forward fill)
+    last_observed = np.maximum.accumulate(np.where(observed, positions, 0), axis=1)
+    first_observed = observed.argmax(axis=1)[:, None]
+    last_observed = np.where(positions < first_observed, first_observed, last_observed)
+    return np.take_along_axis(windows, last_observed, axis=1)
+
+
+def run_forecasts(end_date=None, min_days=20, chunk_size=1_000):
+    """
+    Forecasts every station with at least min_days observations in the 30 days ending 
+    on end_date (defaults to yesterday) and upserts the predictions into the forecast collection
+    in bulk writes of chunk_size operations. Returns counts of the run
+    """
+    end_date = to_datetime(end_date or (datetime.utcnow() - timedelta(days=1)))
+    coordinates, aqsids, windows = load_windows(end_date)
+
+    keep = (~np.isnan(windows)).sum(axis=1) >= min_days
+    coordinates, windows = coordinates[keep], fill_gaps(windows[keep])
+    aqsids = [aqsid for aqsid, kept in zip(aqsids, keep) if kept]
+    result = {
+        'stations': int(keep.sum()),
+        'skipped': int((~keep).sum()),
+        'forecasts': 0,
+        'inserted': 0,
+        'updated': 0
+    }
+    if not len(windows):
+        return result
+
+    predictions = np.asarray(postprocess(batch_predictor.predict(preprocess(windows))))
+    predictions = predictions.reshape(len(windows), -1) #one column per day in advance
+
+    categories = get_categories(predictions)
+    upserts, pushes = [], []
+    for (lat, long), aqsid, station_predictions, station_categories in zip(coordinates.tolist(), aqsids, 
+                                                                            predictions.tolist(), categories):
+        for days_in_advance, (pred_aqi, category) in enumerate(zip(station_predictions, station_categories), start=1):
+            date = end_date + timedelta(days=days_in_advance)
+            key = {'Date': date, 'Location.Lat': lat, 'Location.Long': long}
+            #creates the forecast document if needed (with the AQSID the station metadata is joined on)
+            update = {'$setOnInsert': {
+                        'Real_AQI': -1, 
+                        'Real_Category': 'N/A',
+                        'Predictions': [],
+                        'Location.Coordinates': point(lat, long)
+                        }}
+            if aqsid is not None:
+                update['$set'] = {'Location.Full_AQSID': aqsid}
+            upserts.append(UpdateOne(key, update, upsert=True))
+            #then adds the prediction unless this run already did
+            pushes.append(UpdateOne(
+                                dict(key, **{'Predictions.Days_in_Advance': {'$ne': days_in_advance}}),
+                                {'$push': {'Predictions': {
+                                                'Days_in_Advance': days_in_advance,
+                                                'Pred_AQI': pred_aqi,
+                                                'Pred_Category': category
+                                                }}}))
+
+    #the (unordered) bulk writes of the pushes only start once every document exists
+    created = bulk_write(Forecast, upserts, chunk_size)
+    pushed = bulk_write(Forecast, pushes, chunk_size)
+    result['forecasts'] = len(pushes)
+    result['inserted'] = created['upserted']
+    result['updated'] = pushed['modified']
+    return result
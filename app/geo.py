@@ -0,0 +1,84 @@
+"""
+This file contains helpers for building geospatial (bounding box) queries
+against the GeoJSON 'Location.Coordinates' points stored on every document
+"""
+from flask import current_app
+from mongoengine.queryset.visitor import Q
+import math
+import numpy as np
+from .dates import date_string
+
+DATE_GEO_INDEX = [('Date', 1), ('Location.Coordinates', '2dsphere')]
+DATE_LAT_LONG_INDEX = [('Date', 1), ('Location.Lat', 1), ('Location.Long', 1)] #unique in historic-data
+DATE_LAT_LONG_ID_INDEX = DATE_LAT_LONG_INDEX + [('_id', 1)] #forecast (no unique key)
+
+EDGE_STEP = 1.0 #max degrees of longitude between polygon vertices
+EDGE_PADDING = 0.01 #degrees the polygon is grown by to cover geodesic edges
+GRID_SIZE = 1.0 #degrees of latitude/longitude per grid cell (rollups, tiles)
+
+
+def point(lat, long):
+    """
+    Returns a GeoJSON point for the given coordinates (GeoJSON orders them long, lat)
+    """
+    return {'type': 'Point', 'coordinates': [long, lat]}
+
+
+def grid_cell(lat, long):
+    """
+    Returns the (south, west) corner of the grid cell holding the given coordinates (scalars or arrays)
+    """
+    #adding 0.0 turns -0.0 into 0.0, so every cell has one (cache key) spelling
+    return (np.floor(np.asarray(lat) / GRID_SIZE) * GRID_SIZE + 0.0, 
+            np.floor(np.asarray(long) / GRID_SIZE) * GRID_SIZE + 0.0)
+
+
+def affected_cells(rows):
+    """
+    Returns the (YYYY-MM-DD date, cell lat, cell long) key of every measurement/document
+    """
+    if not rows:
+        return []
+    lats, longs = grid_cell([row['Location']['Lat'] for row in rows], [row['Location']['Long'] for row in rows])
+    return list(zip([date_string(row['Date']) for row in rows], lats.tolist(), longs.tolist()))
+
+
+def bbox_polygon(bLat, tLat, lLong, rLong):
+    """
+    Builds a GeoJSON polygon covering the given bounding box.
+    2dsphere edges are geodesics rather than lines of constant latitude, so the
+    top/bottom edges are densified and the polygon is padded slightly. Returns None
+    when the box cannot be represented by a single polygon (spans a pole or >= 180 degrees).
+    """
+    bLat, tLat = bLat - EDGE_PADDING, tLat + EDGE_PADDING
+    lLong, rLong = max(lLong - EDGE_PADDING, -180), min(rLong + EDGE_PADDING, 180)
+    if bLat <= -90 or tLat >= 90 or rLong - lLong >= 180:
+        return None
+
+    steps = max(1, math.ceil((rLong - lLong) / EDGE_STEP))
+    longs = [lLong + (rLong - lLong) * i / steps for i in range(steps + 1)]
+
+    #counter-clockwise ring: bottom edge heading east, top edge heading west
+    ring = [[long, bLat] for long in longs] + [[long, tLat] for long in reversed(longs)]
+    ring.append(ring[0])
+    return {'type': 'Polygon', 'coordinates': [ring]}
+
+
+def bbox_filter(bLat, tLat, lLong, rLong, lat_long_index=DATE_LAT_LONG_INDEX):
+    """
+    Returns the query filter and index hint for documents within the given bounding box.
+    The exact lat/long ranges are always applied; the $geoWithin predicate lets mongo
+    use the (Date, Location.Coordinates) 2dsphere index instead of scanning every station.
+    Without it, the collection's (Date, Location.Lat, Location.Long) index is hinted
+    """
+    bLat, tLat, lLong, rLong = float(bLat), float(tLat), float(lLong), float(rLong)
+    query = Q(Location__Lat__gte=bLat) \
+            & Q(Location__Lat__lte=tLat) \
+            & Q(Location__Long__gte=lLong) \
+            & Q(Location__Long__lte=rLong)
+
+    polygon = bbox_polygon(bLat, tLat, lLong, rLong)
+    if polygon is None or not current_app.config['GEO_QUERIES']:
+        return query, lat_long_index
+
+    return query & Q(Location__Coordinates__geo_within=polygon), DATE_GEO_INDEX
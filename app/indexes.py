@@ -0,0 +1,25 @@
+"""
+This file contains the index management of the collections. Indexes are declared in the models' meta
+(see models.py) but not built on first use of a collection (auto_create_index is off), as building them
+inside a request blocks it and a failed build (e.g. duplicates under a unique index) fails every request.
+They are built ahead of deployment with 'flask create-indexes' (see application.py)
+"""
+from .models import Historic, HistoricBucket, Rollup, Current, Snapshot, Station, Forecast, User, Request
+
+MODELS = (Historic, HistoricBucket, Rollup, Current, Snapshot, Station, Forecast, User, Request)
+
+
+def create_indexes(background=True):
+    """
+    Builds every declared index that does not exist yet (background builds do not lock the collection
+    on servers older than 4.2, newer servers always build without locking). Returns the index names per collection
+    """
+    created = {}
+    for model in MODELS:
+        collection = model._get_collection()
+        names = []
+        for spec in model._meta['index_specs']:
+            options = dict(spec)
+            names.append(collection.create_index(options.pop('fields'), background=background, **options))
+        created[collection.name] = names
+    return created
@@ -0,0 +1,171 @@
+"""
+This file contains the batched inference queue for the forecast model. Concurrent /predict
+calls are coalesced into one model call (up to INFERENCE_MAX_BATCH rows, waiting at most
+INFERENCE_MAX_WAIT_MS for company) and the outputs are scattered back to each caller.
+The model runtime (see model_runtime.py) is only loaded on first use, so workers that never
+serve /predict do not pay for it
+"""
+from threading import Event, Lock, Thread
+from .model_runtime import RUNTIMES
+import numpy as np
+import os
+import queue
+import time
+
+AQI_MEAN = 43.467599332161555 #statistics the model was trained with
+AQI_STD = 22.21508718833175
+
+_runtimes = {} #(runtime, model path) -> loaded runtime
+_runtimes_lock = Lock()
+
+
+def preprocess(data):
+    """
+    Standardizes 30 day AQI windows to have mean of ~0 and standard deviation of ~1 (model input)
+    """
+    preprocessed_data = ( np.array(data) - AQI_MEAN ) / AQI_STD
+    return preprocessed_data.reshape(len(data), 30, 1)
+
+
+def postprocess(data):
+    """
+    Converts predicted values to scale between 0-500
+    """
+    postprocessed_data = data * AQI_STD + AQI_MEAN
+    return postprocessed_data.astype('int').tolist()
+
+
+def load_runtime(runtime, path):
+    """
+    Returns the given model runtime for the model saved at path, loading it once per process
+    """
+    with _runtimes_lock:
+        if (runtime, path) not in _runtimes:
+            _runtimes[(runtime, path)] = RUNTIMES[runtime](path)
+        return _runtimes[(runtime, path)]
+
+
+class _Job:
+    def __init__(self, inputs):
+        self.inputs = inputs
+        self.result = None
+        self.error = None
+        self.done = Event()
+
+
+class BatchPredictor:
+    """
+    Micro-batching front of a predict function taking and returning arrays batched on axis 0
+    """
+
+    def __init__(self, predict_fn=None, max_batch=256, max_wait_ms=5, timeout=30):
+        self.predict_fn = predict_fn #defaults to the model runtime for model_path
+        self.runtime = 'keras'
+        self.model_path = None
+        self.max_batch = max_batch
+        self.max_wait_ms = max_wait_ms
+        self.timeout = timeout
+        self._queue = None
+        self._pid = None #the batching thread belongs to the process (worker) that started it
+        self._lock = Lock()
+        self._stats_lock = Lock()
+        self.requests = 0
+        self.batches = 0
+        self.rows = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def init_app(self, app):
+        self.runtime = app.config['MODEL_RUNTIME']
+        self.model_path = app.config['MODEL_PATH']
+        self.max_batch = app.config['INFERENCE_MAX_BATCH']
+        self.max_wait_ms = app.config['INFERENCE_MAX_WAIT_MS']
+        self.timeout = app.config['INFERENCE_TIMEOUT']
+
+    def preload(self):
+        """
+        Loads the model now instead of on the first prediction
+        """
+        if self.predict_fn is None:
+            load_runtime(self.runtime, self.model_path)
+
+    def predict(self, inputs):
+        """
+        Returns the predictions for the given inputs, sharing one model call with concurrent callers
+        """
+        self._ensure_started()
+        job = _Job(np.asarray(inputs))
+        self._queue.put(job)
+        if not job.done.wait(self.timeout):
+            raise TimeoutError('Inference timed out')
+        if job.error is not None:
+            raise job.error
+        return job.result
+
+    def stats(self):
+        """
+        Returns the batching counters and per-batch latency (ms) for monitoring
+        """
+        with self._stats_lock:
+            return {
+                'requests': self.requests,
+                'batches': self.batches,
+                'rows': self.rows,
+                'mean_batch_rows': self.rows / self.batches if self.batches else 0,
+                'mean_batch_latency_ms': 1000 * self.total_latency / self.batches if self.batches else 0,
+                'max_batch_latency_ms': 1000 * self.max_latency
+            }
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue()
+            Thread(target=self._run, name='batch-predictor', daemon=True).start()
+            self._pid = os.getpid()
+
+    def _run(self):
+        while True:
+            jobs = [self._queue.get()]
+            rows = len(jobs[0].inputs)
+            deadline = time.monotonic() + self.max_wait_ms / 1000
+            while rows < self.max_batch:
+                try:
+                    job = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                jobs.append(job)
+                rows += len(job.inputs)
+            self._run_batch(jobs, rows)
+
+    def _predict(self, inputs):
+        if self.predict_fn is not None:
+            return self.predict_fn(inputs)
+        return load_runtime(self.runtime, self.model_path).predict(inputs)
+
+    def _run_batch(self, jobs, rows):
+        start = time.perf_counter()
+        try:
+            outputs = self._predict(np.concatenate([job.inputs for job in jobs]))
+            offset = 0
+            for job in jobs:
+                job.result = outputs[offset:offset + len(job.inputs)]
+                offset += len(job.inputs)
+        except Exception as err:
+            for job in jobs:
+                job.error = err
+
+        latency = time.perf_counter() - start
+        with self._stats_lock:
+            self.requests += len(jobs)
+            self.batches += 1
+            self.rows += rows
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+        for job in jobs:
+            job.done.set()
+
+
+batch_predictor = BatchPredictor()
@@ -0,0 +1,134 @@
+"""
+This file contains the streaming upload mode of the measurement POST endpoints.
+Instead of one json array, the body can be newline delimited json (ndjson) or csv,
+optionally gzip compressed ('Content-Encoding: gzip'). Rows are parsed one at a time,
+then validated (see validation.py) and written in chunks, so memory use is bounded by the chunk size,
+and invalid rows are reported individually instead of rejecting the whole upload
+"""
+from flask import request
+import csv
+import gzip
+import json
+import zlib
+from pymongo.errors import PyMongoError
+from .schema import LocationSchema
+from .validation import measurement_validator
+from .responses import NDJSON_MIMETYPE
+
+CSV_MIMETYPE = 'text/csv'
+UPLOAD_MIMETYPES = (NDJSON_MIMETYPE, CSV_MIMETYPE)
+LOCATION_COLUMNS = set(LocationSchema().fields) #csv columns stored in the Location sub-document
+
+
+def is_upload():
+    """
+    Returns True if the request body is an ndjson/csv upload
+    """
+    return request.mimetype in UPLOAD_MIMETYPES
+
+
+def _lines(stream, compressed):
+    """
+    Yields the decoded lines of the (optionally gzip compressed) request body
+    """
+    if compressed:
+        stream = gzip.GzipFile(fileobj=stream, mode='rb')
+    for line in stream:
+        yield line.decode('utf-8')
+
+
+def _ndjson_rows(lines):
+    """
+    Yields (line number, parsed object, error messages) for every non-empty line
+    """
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as err:
+            yield line_number, None, {'_schema': [f'Invalid json: {err.msg}']}
+            continue
+        if not isinstance(row, dict):
+            yield line_number, None, {'_schema': ['Invalid input type.']}
+            continue
+        yield line_number, row, None
+
+
+def _csv_rows(lines):
+    """
+    Yields (line number, measurement, error messages) for every csv row, moving the
+    location columns into 'Location' and dropping empty cells
+    """
+    reader = csv.DictReader(lines)
+    for row in reader:
+        measurement = {'Location': {}}
+        for column, value in row.items():
+            if value in (None, '') or column is None:
+                continue
+            if column in LOCATION_COLUMNS:
+                measurement['Location'][column] = value
+            else:
+                measurement[column] = value
+        yield reader.line_num, measurement, None
+
+
+def read_measurements(stream, mimetype, compressed):
+    """
+    Yields (line number, parsed measurement, error messages) for every row of the upload.
+    Raises ValueError if the body itself cannot be read
+    """
+    parse = _csv_rows if mimetype == CSV_MIMETYPE else _ndjson_rows
+    try:
+        yield from parse(_lines(stream, compressed))
+    except (OSError, EOFError, zlib.error, UnicodeDecodeError, csv.Error) as err:
+        raise ValueError(f'Could not read upload: {err}')
+
+
+def ingest(rows, write, chunk_size, max_errors):
+    """
+    Validates the rows in chunks of chunk_size rows and writes the valid ones with write(chunk),
+    summing the returned counts. Returns the counts, the number of invalid rows and the errors
+    of the first max_errors invalid rows. The rows of a chunk failing to be written are reported
+    as invalid and the following chunks are still written. Chunks written before an unreadable body 
+    raises ValueError are kept (writes are idempotent upserts, so the upload can be retried)
+    """
+    counts, errors, lines, chunk = {}, [], [], []
+    invalid = 0
+
+    def report(line_number, row_errors):
+        nonlocal invalid
+        invalid += 1
+        if len(errors) < max_errors:
+            errors.append({'line': line_number, 'errors': row_errors})
+
+    def flush():
+        measurements, chunk_errors = measurement_validator.validate(chunk)
+        for k, row_errors in chunk_errors.items():
+            report(lines[k], row_errors)
+        if measurements:
+            try:
+                written = write(measurements)
+            except PyMongoError as err:
+                written = {}
+                for k, line_number in enumerate(lines):
+                    if k not in chunk_errors:
+                        report(line_number, {'_schema': [f'Could not be written: {err}']})
+            for key, value in written.items():
+                counts[key] = counts.get(key, 0) + value
+        lines.clear()
+        chunk.clear()
+
+    for line_number, row, row_errors in rows:
+        if row_errors is None:
+            lines.append(line_number)
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                flush()
+        else:
+            report(line_number, row_errors)
+    if chunk:
+        flush()
+    #invalid rows are counted and reported in line order
+    errors.sort(key=lambda error: error['line'])
+    return dict(counts, invalid=invalid, errors=errors)
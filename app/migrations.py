@@ -0,0 +1,115 @@
+"""
+This file contains data migrations for documents already stored in the MongoDB cluster.
+Each migration is idempotent and is run through a 'flask' cli command (see application.py)
+"""
+from itertools import islice
+from pymongo import UpdateOne
+from .models import Historic, Current, Forecast, Station
+from .bulk import bulk_write
+from .conditional import touch
+from .stations import STATION_FIELDS
+from .dates import to_datetime
+
+
+def migrate_geo_locations():
+    """
+    Adds a GeoJSON 'Location.Coordinates' point (built from Location.Lat/Long) to every
+    document that does not have one yet. Returns the number of updated documents per collection
+    """
+    updated = {}
+    for model in (Historic, Current, Forecast):
+        collection = model._get_collection()
+        result = collection.update_many(
+                        {'Location.Coordinates': {'$exists': False}},
+                        [{'$set': {'Location.Coordinates': {
+                                            'type': 'Point', 
+                                            'coordinates': ['$Location.Long', '$Location.Lat']
+                                            }}}]
+                        )
+        updated[collection.name] = result.modified_count
+    return updated
+
+
+def remove_duplicate_measurements(chunk_size=1_000):
+    """
+    Deletes all but the most recently inserted document for each (Version, Date, Location.Lat, Location.Long)
+    key so the unique measurement index can be built, chunk_size documents at a time.
+    Returns the number of deleted documents per collection
+    """
+    deleted = {}
+    for model in (Historic, Current):
+        collection = model._get_collection()
+        duplicates = collection.aggregate([
+                        {'$sort': {'_id': 1}},
+                        {'$group': {
+                            '_id': {'Version': '$Version', 'Date': '$Date', 
+                                    'Lat': '$Location.Lat', 'Long': '$Location.Long'},
+                            'ids': {'$push': '$_id'}
+                            }},
+                        {'$match': {'ids.1': {'$exists': True}}}
+                        ], allowDiskUse=True)
+        deleted[collection.name] = 0
+        stale_ids = []
+        for group in duplicates:
+            stale_ids.extend(group['ids'][:-1])
+            while len(stale_ids) >= chunk_size:
+                deleted[collection.name] += collection.delete_many({'_id': {'$in': stale_ids[:chunk_size]}}).deleted_count
+                del stale_ids[:chunk_size]
+        if stale_ids:
+            deleted[collection.name] += collection.delete_many({'_id': {'$in': stale_ids}}).deleted_count
+    return deleted
+
+
+def migrate_stations(chunk_size=1_000):
+    """
+    Moves the site metadata embedded in the measurement documents (of sites with an AQSID) to the
+    station registry, keeping the latest metadata of every site, then removes it from the documents.
+    Returns the number of registered stations and of updated documents per collection
+    """
+    stations = {}
+    for model in (Historic, Current, Forecast):
+        groups = model._get_collection().aggregate([
+                        {'$match': {'Location.Full_AQSID': {'$exists': True}}},
+                        {'$sort': {'Date': 1}},
+                        {'$group': dict(
+                            {'_id': '$Location.Full_AQSID',
+                             'Lat': {'$last': '$Location.Lat'}, 'Long': {'$last': '$Location.Long'}},
+                            **{field: {'$last': f'$Location.{field}'} for field in STATION_FIELDS}
+                            )}
+                        ], allowDiskUse=True)
+        for group in groups:
+            station = stations.setdefault(group.pop('_id'), {})
+            station.update({field: value for field, value in group.items() if value is not None})
+
+    bulk_write(Station, [UpdateOne({'AQSID': aqsid}, {'$set': station}, upsert=True)
+                            for aqsid, station in stations.items()], chunk_size)
+    touch(Station)
+    updated = {'stations': len(stations)}
+    for model in (Historic, Current, Forecast):
+        collection = model._get_collection()
+        result = collection.update_many(
+                        {'Location.Full_AQSID': {'$exists': True}},
+                        {'$unset': {f'Location.{field}': '' for field in STATION_FIELDS}}
+                        )
+        updated[collection.name] = result.modified_count
+    return updated
+
+
+def migrate_dates(chunk_size=1_000):
+    """
+    Converts the YYYY-MM-DD string dates of the measurement documents to native dates (midnight UTC),
+    chunk_size documents at a time. Returns the number of updated documents per collection
+    """
+    updated = {}
+    for model in (Historic, Current, Forecast):
+        collection = model._get_collection()
+        documents = collection.find({'Date': {'$type': 'string'}}, {'Date': 1}).batch_size(chunk_size)
+        updated[collection.name] = 0
+        while True:
+            chunk = list(islice(documents, chunk_size))
+            if not chunk:
+                break
+            operations = [UpdateOne({'_id': document['_id']}, {'$set': {'Date': to_datetime(document['Date'])}})
+                            for document in chunk]
+            updated[collection.name] += bulk_write(model, operations, chunk_size)['modified']
+    return updated
@@ -0,0 +1,181 @@
+"""
+This file contains the runtimes the forecast model can be served with (MODEL_RUNTIME):
+- keras: the saved .h5 model run through tensorflow
+- numpy: the model's weights exported to .npz (see export_numpy) and evaluated with numpy only,
+         so CPU-only inference nodes do not need tensorflow at all
+"""
+import json
+import numpy as np
+
+
+class ModelRuntime:
+    """
+    Interface of a model runtime: predict maps a batch of inputs (n, 30, 1) to a batch of outputs
+    """
+
+    def predict(self, inputs):
+        raise NotImplementedError
+
+
+class KerasRuntime(ModelRuntime):
+
+    def __init__(self, path):
+        import tensorflow as tf
+        self.model = tf.keras.models.load_model(path, compile=False)
+
+    def predict(self, inputs):
+        #calling the model directly skips most of the per-call overhead of model.predict
+        return np.asarray(self.model(inputs, training=False))
+
+
+def _softmax(x):
+    exp = np.exp(x - x.max(axis=-1, keepdims=True))
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0),
+    'tanh': np.tanh,
+    'sigmoid': lambda x: 1 / (1 + np.exp(-x)),
+    'hard_sigmoid': lambda x: np.clip(0.2 * x + 0.5, 0, 1),
+    'softplus': lambda x: np.logaddexp(x, 0),
+    'softmax': _softmax
+}
+
+
+def _activation(config, key='activation'):
+    name = config.get(key) or 'linear'
+    if name not in ACTIVATIONS:
+        raise ValueError(f'Unsupported activation: {name}')
+    return ACTIVATIONS[name]
+
+
+def _dense(x, weights, config):
+    x = x @ weights[0]
+    if config.get('use_bias', True):
+        x = x + weights[1]
+    return _activation(config)(x)
+
+
+def _recurrent(step):
+    """
+    Runs a recurrent cell (step) over the time axis of x (batch, time, features)
+    """
+    def layer(x, weights, config):
+        units = config['units']
+        state = [np.zeros((x.shape[0], units), dtype=x.dtype) for i in range(2)]
+        outputs = []
+        for t in range(x.shape[1]):
+            state = step(x[:, t, :], state, weights, config)
+            outputs.append(state[0])
+        return np.stack(outputs, axis=1) if config.get('return_sequences') else outputs[-1]
+    return layer
+
+
+def _bias(weights, config, index=2):
+    return weights[index] if config.get('use_bias', True) else 0
+
+
+def _simple_rnn_step(x, state, weights, config):
+    h = _activation(config)(x @ weights[0] + state[0] @ weights[1] + _bias(weights, config))
+    return [h, state[1]]
+
+
+def _lstm_step(x, state, weights, config):
+    h, c = state
+    units = config['units']
+    z = x @ weights[0] + h @ weights[1] + _bias(weights, config)
+    recurrent_activation, activation = _activation(config, 'recurrent_activation'), _activation(config)
+    i = recurrent_activation(z[:, :units])
+    f = recurrent_activation(z[:, units:2 * units])
+    c = f * c + i * activation(z[:, 2 * units:3 * units])
+    o = recurrent_activation(z[:, 3 * units:])
+    return [o * activation(c), c]
+
+
+def _gru_step(x, state, weights, config):
+    h = state[0]
+    units = config['units']
+    recurrent_activation, activation = _activation(config, 'recurrent_activation'), _activation(config)
+    bias = _bias(weights, config)
+    if config.get('reset_after', True):
+        input_bias, recurrent_bias = (bias[0], bias[1]) if config.get('use_bias', True) else (0, 0)
+        x_z = x @ weights[0] + input_bias
+        h_z = h @ weights[1] + recurrent_bias
+        z = recurrent_activation(x_z[:, :units] + h_z[:, :units])
+        r = recurrent_activation(x_z[:, units:2 * units] + h_z[:, units:2 * units])
+        hh = activation(x_z[:, 2 * units:] + r * h_z[:, 2 * units:])
+    else:
+        x_z = x @ weights[0] + bias
+        recurrent_kernel = weights[1]
+        z = recurrent_activation(x_z[:, :units] + h @ recurrent_kernel[:, :units])
+        r = recurrent_activation(x_z[:, units:2 * units] + h @ recurrent_kernel[:, units:2 * units])
+        hh = activation(x_z[:, 2 * units:] + (r * h) @ recurrent_kernel[:, 2 * units:])
+    return [z * h + (1 - z) * hh, state[1]]
+
+
+LAYERS = {
+    'Dense': _dense,
+    'SimpleRNN': _recurrent(_simple_rnn_step),
+    'LSTM': _recurrent(_lstm_step),
+    'GRU': _recurrent(_gru_step),
+    'Activation': lambda x, weights, config: _activation(config)(x),
+    'Flatten': lambda x, weights, config: x.reshape(x.shape[0], -1),
+    'Dropout': lambda x, weights, config: x
+}
+
+
+class NumpyRuntime(ModelRuntime):
+
+    def __init__(self, path):
+        with np.load(path) as archive:
+            self.layers = [(layer['type'], 
+                            [archive[name] for name in layer['weights']], 
+                            layer['config']) 
+                           for layer in json.loads(str(archive['layers']))]
+
+    def predict(self, inputs):
+        x = np.asarray(inputs, dtype=np.float32)
+        for layer_type, weights, config in self.layers:
+            x = LAYERS[layer_type](x, weights, config)
+        return x
+
+
+RUNTIMES = {
+    'keras': KerasRuntime,
+    'numpy': NumpyRuntime
+}
+
+
+def export_numpy(keras_path, npz_path):
+    """
+    Exports a keras model (a plain stack of the LAYERS above) to an .npz archive for the numpy runtime
+    """
+    import tensorflow as tf
+    model = tf.keras.models.load_model(keras_path, compile=False)
+
+    layers, arrays = [], {}
+    for i, layer in enumerate(model.layers):
+        layer_type = layer.__class__.__name__
+        if layer_type == 'InputLayer':
+            continue
+        if layer_type not in LAYERS:
+            raise ValueError(f'Unsupported layer: {layer_type}')
+
+        config = layer.get_config()
+        if config.get('go_backwards') or config.get('stateful'):
+            raise ValueError(f'Unsupported {layer_type} configuration: {layer.name}')
+
+        names = []
+        for j, weights in enumerate(layer.get_weights()):
+            names.append(f'layer{i}_weights{j}')
+            arrays[names[-1]] = weights
+        layers.append({
+            'type': layer_type,
+            'weights': names,
+            'config': {key: config.get(key) for key in ('units', 'activation', 'recurrent_activation', 
+                                                        'use_bias', 'return_sequences', 'reset_after')}
+        })
+
+    np.savez(npz_path, layers=json.dumps(layers), **arrays)
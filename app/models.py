@@ -1,101 +1,228 @@
-"""
-This file contains models of all collections + embedded documents
-housed within the MongoDB cluster. 
-"""
-from . import db 
-from datetime import datetime
-
-
-class Location(db.EmbeddedDocument):
-    CBSA_Code = db.IntField()
-    City = db.StringField()
-    State = db.StringField()
-    Lat = db.FloatField(required=True)
-    Long = db.FloatField(required=True)
-    Population = db.IntField()
-    Density = db.IntField()
-    Timezone = db.StringField()
-    Site_Name = db.StringField()
-    Full_AQSID = db.StringField()
-
-
-
-class Historic(db.Document):
-
-    meta = {
-        'collection': 'historic-data'
-    }
-
-    Date = db.StringField(required=True)
-    AQI = db.IntField(required=True)
-    Category = db.StringField(required=True)
-    Defining_Parameter = db.StringField()
-    Number_of_Sites_Reporting = db.IntField()
-    Location = db.EmbeddedDocumentField(Location, required=True)
-
-
-
-class Current(db.Document):
-
-    meta = {
-        'collection': 'current'
-    }
-
-    Date = db.StringField(required=True)
-    AQI = db.IntField(required=True)
-    Category = db.StringField(required=True)
-    Defining_Parameter = db.StringField()
-    Location = db.EmbeddedDocumentField(Location, required=True)
-
-
-
-class Prediction(db.EmbeddedDocument):
-    Days_in_Advance = db.IntField(required=True)
-    Pred_AQI = db.IntField(required=True)
-    Pred_Category = db.StringField(required=True)
-
-
-
-class Forecast(db.Document):
-
-    meta = {
-        'collection': 'forecast'
-    }
-
-    Date = db.StringField(required=True)
-    Real_AQI = db.IntField(default=-1)
-    Real_Category = db.StringField(default='N/A')
-    Predictions = db.ListField(db.EmbeddedDocumentField(Prediction), required=True)
-    Location = db.EmbeddedDocumentField(Location, required=True)
-
-
-class User(db.Document):
-
-    meta = {
-        'collection': 'users'
-    }
-
-    Email = db.EmailField(required=True)
-    Token = db.StringField(required=True)
-    Date_Joined = db.DateTimeField(default=datetime.utcnow(), required=True)
-    Permission = db.IntField(default=0, required=True)
-    Last_Email = db.DateTimeField(default=datetime.utcnow(), required=True)
-
-
-
-class Request(db.Document):
-
-    meta = {
-        'collection': 'requests'
-    }
-
-    User_Token = db.StringField(required=True)
-    Resource = db.StringField(required=True)
-    Time_Used = db.DateTimeField(default=datetime.utcnow(), required=True)
-
-  
-
-
-
-
+"""
+This file contains models of all collections + embedded documents
+housed within the MongoDB cluster. 
+Indexes are declared here but built with 'flask create-indexes' (see indexes.py)
+"""
+from . import db 
+from datetime import datetime
+
+
+class Location(db.EmbeddedDocument):
+    #the site metadata fields are only found in documents stored before the station registry (see stations.py)
+    CBSA_Code = db.IntField()
+    City = db.StringField()
+    State = db.StringField()
+    Lat = db.FloatField(required=True)
+    Long = db.FloatField(required=True)
+    Population = db.IntField()
+    Density = db.IntField()
+    Timezone = db.StringField()
+    Site_Name = db.StringField()
+    Full_AQSID = db.StringField()
+    Coordinates = db.PointField() #GeoJSON copy of Lat/Long for 2dsphere queries
+
+
+
+class Station(db.Document):
+    #metadata of a monitoring site, shared by all of its measurements (see stations.py)
+
+    meta = {
+        'collection': 'stations',
+        'auto_create_index': False,
+        'indexes': [
+            {'fields': ['AQSID'], 'unique': True}
+        ]
+    }
+
+    AQSID = db.StringField(required=True)
+    Lat = db.FloatField()
+    Long = db.FloatField()
+    Site_Name = db.StringField()
+    CBSA_Code = db.IntField()
+    City = db.StringField()
+    State = db.StringField()
+    Population = db.IntField()
+    Density = db.IntField()
+    Timezone = db.StringField()
+
+
+
+class Historic(db.Document):
+
+    meta = {
+        'collection': 'historic-data',
+        'auto_create_index': False,
+        'indexes': [
+            {'fields': ('Date', 'Location.Lat', 'Location.Long'), 'unique': True}, #one measurement per day/site
+            ('Date', '(Location.Coordinates')
+        ]
+    }
+
+    Date = db.DateTimeField(required=True) #midnight UTC (see dates.py)
+    AQI = db.IntField(required=True)
+    Category = db.StringField(required=True)
+    Defining_Parameter = db.StringField()
+    Number_of_Sites_Reporting = db.IntField()
+    Location = db.EmbeddedDocumentField(Location, required=True)
+
+
+
+class HistoricBucket(db.Document):
+    #historic measurements of one station over a month, packed into parallel arrays (see buckets.py)
+
+    meta = {
+        'collection': 'historic-buckets',
+        'auto_create_index': False,
+        'indexes': [
+            {'fields': ('Month', 'Location.Lat', 'Location.Long'), 'unique': True},
+            ('Location.Lat', 'Location.Long', 'Month')
+        ]
+    }
+
+    Month = db.StringField(required=True) #YYYY-MM
+    Location = db.EmbeddedDocumentField(Location, required=True)
+    Days = db.ListField(db.IntField()) #day of the month of every measurement
+    AQI = db.ListField(db.IntField())
+    Category = db.ListField(db.IntField()) #index in aqi.CATEGORIES
+    Defining_Parameter = db.ListField(db.StringField())
+    Sites = db.ListField(db.IntField()) #Number_of_Sites_Reporting (null if unknown)
+    Ids = db.ListField(db.ObjectIdField()) #_id of every measurement's historic document
+
+
+
+class Rollup(db.Document):
+    #aggregate aqi of the historic measurements of one grid cell over a day or month (see rollups.py)
+
+    meta = {
+        'collection': 'historic-rollups',
+        'auto_create_index': False,
+        'indexes': [
+            {'fields': ('Period', 'Date', 'Cell_Lat', 'Cell_Long'), 'unique': True}
+        ]
+    }
+
+    Period = db.StringField(required=True, choices=('day', 'month'))
+    Date = db.StringField(required=True) #YYYY-MM-DD for days, YYYY-MM for months
+    Cell_Lat = db.FloatField(required=True) #south west corner of the grid cell
+    Cell_Long = db.FloatField(required=True)
+    Count = db.IntField(required=True)
+    Sum = db.IntField(required=True)
+    Min = db.IntField(required=True)
+    Max = db.IntField(required=True)
+    Histogram = db.DictField() #number of measurements per aqi value (for exact percentiles)
+    Categories = db.DictField() #number of measurements per category
+
+
+
+class Current(db.Document):
+
+    meta = {
+        'collection': 'current',
+        'auto_create_index': False,
+        'indexes': [
+            {'fields': ('Version', 'Date', 'Location.Lat', 'Location.Long'), 'unique': True} #one measurement per day/site
+        ]
+    }
+
+    Version = db.StringField() #snapshot the document belongs to (see snapshots.py)
+    Date = db.DateTimeField(required=True) #midnight UTC (see dates.py)
+    AQI = db.IntField(required=True)
+    Category = db.StringField(required=True)
+    Defining_Parameter = db.StringField()
+    Location = db.EmbeddedDocumentField(Location, required=True)
+
+
+
+class Snapshot(db.Document):
+    #pointer to the active version of a versioned collection
+
+    meta = {
+        'collection': 'snapshots',
+        'auto_create_index': False,
+        'indexes': [
+            {'fields': ['Name'], 'unique': True}
+        ]
+    }
+
+    Name = db.StringField(required=True)
+    Version = db.StringField()
+    Previous_Version = db.StringField()
+    Activated = db.DateTimeField()
+
+
+
+class Prediction(db.EmbeddedDocument):
+    Days_in_Advance = db.IntField(required=True)
+    Pred_AQI = db.IntField(required=True)
+    Pred_Category = db.StringField(required=True)
+
+
+
+class Forecast(db.Document):
+
+    meta = {
+        'collection': 'forecast',
+        'auto_create_index': False,
+        'indexes': [
+            ('Date', 'Location.Lat', 'Location.Long', 'id'), #no unique key, so pages break ties on _id
+            ('Date', '(Location.Coordinates')
+        ]
+    }
+
+    Date = db.DateTimeField(required=True) #midnight UTC (see dates.py)
+    Real_AQI = db.IntField(default=-1)
+    Real_Category = db.StringField(default='N/A')
+    Predictions = db.ListField(db.EmbeddedDocumentField(Prediction), required=True)
+    Location = db.EmbeddedDocumentField(Location, required=True)
+
+
+class User(db.Document):
+
+    meta = {
+        'collection': 'users',
+        'auto_create_index': False,
+        'indexes': [
+            'Token', #token checks (see token_cache.py)
+            'Email' #sign ups
+        ]
+    }
+
+    Email = db.EmailField(required=True)
+    Token = db.StringField(required=True)
+    Date_Joined = db.DateTimeField(default=datetime.utcnow(), required=True)
+    Permission = db.IntField(default=0, required=True)
+    Last_Email = db.DateTimeField(default=datetime.utcnow(), required=True)
+
+
+
+class DataVersion(db.Document):
+    #data version of a collection, keyed by the collection's name (see conditional.py)
+
+    meta = {
+        'collection': 'data-versions',
+        'auto_create_index': False
+    }
+
+    id = db.StringField(primary_key=True)
+    Token = db.StringField(required=True)
+    Modified = db.IntField(required=True) #unix time of the latest write
+
+
+
+class Request(db.Document):
+
+    meta = {
+        'collection': 'requests',
+        'auto_create_index': False
+    }
+
+    User_Token = db.StringField(required=True)
+    Resource = db.StringField(required=True)
+    Time_Used = db.DateTimeField(default=datetime.utcnow(), required=True)
+
+  
+
+
+
+
    
\ No newline at end of file
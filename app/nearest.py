@@ -0,0 +1,97 @@
+"""
+This file contains the nearest station lookups of '/current/nearest' and '/forecasts/nearest'.
+Every worker keeps the stations of a collection (its documents grouped by coordinates) in memory as
+unit vectors on the sphere, reloaded whenever the collection's data version changes (see conditional.py).
+The k nearest stations of a point are found with one matrix-vector product over every station, which
+takes a few microseconds for the few thousand stations of the network
+"""
+import time
+from threading import Lock
+import numpy as np
+from .models import Current, Forecast
+from .conditional import data_version
+from .snapshots import active_version
+from .dates import to_datetime, today
+
+EARTH_RADIUS_KM = 6371.0088 #mean earth radius
+
+
+def unit_vectors(lats, longs):
+    """
+    Returns the (n, 3) unit vectors of the given coordinates (in degrees)
+    """
+    lats, longs = np.radians(np.asarray(lats, dtype=float)), np.radians(np.asarray(longs, dtype=float))
+    return np.stack([np.cos(lats) * np.cos(longs), np.cos(lats) * np.sin(longs), np.sin(lats)], axis=-1)
+
+
+class NearestIndex:
+    """
+    In-memory index of the stations of a collection, answering k nearest station queries
+    """
+
+    def __init__(self, model, query):
+        self.model = model
+        self.query = query #returns the queryset of the documents to index
+        self._lock = Lock()
+        self.init_app(None)
+
+    def init_app(self, app):
+        self._version = None
+        self._vectors = np.empty((0, 3))
+        self._documents = []
+        self.reloads = 0
+        self.lookups = 0
+        self.lookup_seconds = 0.0
+
+    def _load(self):
+        #documents from today on are indexed, so the index is also reloaded when the day changes
+        version = (data_version(self.model._get_collection_name())['token'], today())
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    stations = {}
+                    for document in self.query().order_by('Date').as_pymongo():
+                        key = (document['Location']['Lat'], document['Location']['Long'])
+                        stations.setdefault(key, []).append(document)
+                    self._vectors = unit_vectors([lat for lat, _ in stations], [long for _, long in stations])
+                    self._documents = list(stations.values())
+                    self._version = version
+                    self.reloads += 1
+        return self._vectors, self._documents
+
+    def nearest(self, lat, long, k, max_km=None):
+        """
+        Returns the documents of the k stations nearest to lat/long (within max_km), sorted by distance
+        (then date), each with its great circle 'Distance_km'
+        """
+        vectors, documents = self._load()
+        started = time.perf_counter()
+        #the dot product of unit vectors is the cosine of the angle between them
+        cosines = vectors @ unit_vectors(lat, long)
+        candidates = np.arange(len(cosines))
+        if max_km is not None:
+            candidates = candidates[cosines >= np.cos(min(max_km / EARTH_RADIUS_KM, np.pi))]
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-cosines[candidates], k - 1)[:k]]
+        candidates = candidates[np.argsort(-cosines[candidates], kind='stable')]
+        distances = EARTH_RADIUS_KM * np.arccos(np.clip(cosines[candidates], -1, 1))
+        elapsed = time.perf_counter() - started
+
+        with self._lock:
+            self.lookups += 1
+            self.lookup_seconds += elapsed
+        #indexed documents are shared between requests, so the returned ones are copies
+        return [dict(document, Distance_km=round(distance, 3))
+                    for i, distance in zip(candidates.tolist(), distances.tolist()) for document in documents[i]]
+
+    def stats(self):
+        return {
+            'stations': len(self._documents),
+            'reloads': self.reloads,
+            'lookups': self.lookups,
+            'avg_lookup_ms': round(1000 * self.lookup_seconds / self.lookups, 4) if self.lookups else None
+        }
+
+
+current_index = NearestIndex(Current, lambda: Current.objects(Version=active_version()))
+forecast_index = NearestIndex(Forecast, lambda: Forecast.objects(Date__gte=to_datetime(today())))
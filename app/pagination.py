@@ -0,0 +1,82 @@
+"""
+This file contains helpers for keyset (cursor based) pagination. Pages are read in
+(Date, Location.Lat, Location.Long) order straight off the matching index (ties, which only
+collections without a unique key on those fields have, are broken on _id), and the
+position of the last row is handed back to the client as an opaque, signed cursor
+"""
+from flask import current_app
+from itsdangerous import URLSafeSerializer, BadData
+from bson import ObjectId
+from bson.errors import InvalidId
+from mongoengine.queryset.visitor import Q
+from .geo import DATE_LAT_LONG_INDEX, DATE_LAT_LONG_ID_INDEX
+from .dates import to_datetime, date_string
+
+PAGE_ORDER = ('Date', 'Location__Lat', 'Location__Long')
+PAGE_KEY_FIELDS = ('Date', 'Location.Lat', 'Location.Long') #fields a cursor is built from
+
+
+def _serializer():
+    return URLSafeSerializer(current_app.config['SECRET_KEY'], salt='page-cursor')
+
+
+def encode_cursor(document):
+    """
+    Returns a signed cursor pointing just after the given (raw) document
+    """
+    return _serializer().dumps([
+                                date_string(document['Date']), 
+                                document['Location']['Lat'], 
+                                document['Location']['Long'], 
+                                str(document['_id'])
+                                ])
+
+
+def decode_cursor(cursor):
+    """
+    Returns the filter selecting every document after the given cursor.
+    Raises a ValueError if the cursor was tampered with or is malformed
+    """
+    try:
+        date, lat, long, _id = _serializer().loads(cursor)
+        date, _id = to_datetime(date), ObjectId(_id)
+    except (BadData, InvalidId, TypeError, ValueError):
+        raise ValueError('Invalid cursor')
+
+    same_date = Q(Date=date)
+    same_lat = same_date & Q(Location__Lat=lat)
+    same_long = same_lat & Q(Location__Long=long)
+    #the Date bound is repeated outside the $or so the index scan starts at the cursor
+    return Q(Date__gte=date) & (Q(Date__gt=date) \
+                                | (same_date & Q(Location__Lat__gt=lat)) \
+                                | (same_lat & Q(Location__Long__gt=long)) \
+                                | (same_long & Q(id__gt=_id)))
+
+
+def is_unique(model):
+    """
+    Returns whether the model has a unique (Date, Location.Lat, Location.Long) index
+    """
+    return any(spec.get('unique') and spec['fields'] == DATE_LAT_LONG_INDEX for spec in model._meta['index_specs'])
+
+
+def paginate(queryset, page_size, cursor=None):
+    """
+    Returns one page of raw documents from the queryset and the cursor for the next page
+    (None when this is the last page). Documents must hold the PAGE_KEY_FIELDS
+    """
+    if cursor:
+        queryset = queryset.filter(decode_cursor(cursor))
+    #the order must match the hinted index for mongo to read pages without sorting them
+    if is_unique(queryset._document):
+        order, index = PAGE_ORDER, DATE_LAT_LONG_INDEX
+    else:
+        order, index = PAGE_ORDER + ('id',), DATE_LAT_LONG_ID_INDEX
+    page = list(queryset.order_by(*order) \
+                        .hint(index) \
+                        .limit(page_size + 1) \
+                        .as_pymongo())
+
+    if len(page) > page_size:
+        return page[:page_size], encode_cursor(page[page_size - 1])
+    return page, None
@@ -0,0 +1,62 @@
+"""
+This file contains the read path data layer. Documents are read as raw dicts
+(as_pymongo) with explicit field projections instead of being hydrated into
+MongoEngine documents, which was the dominant per-row cost of every GET
+"""
+from flask import request
+from mongoengine.fields import EmbeddedDocumentField, ListField
+from .stations import STATION_PATHS
+
+
+def field_paths(document_cls, prefix=''):
+    """
+    Returns the (dotted) path of every field of a document class, including sub-document fields
+    """
+    paths = []
+    for name, field in document_cls._fields.items():
+        if name == 'id':
+            continue
+        path = prefix + field.db_field
+        paths.append(path)
+        if isinstance(field, ListField):
+            field = field.field
+        if isinstance(field, EmbeddedDocumentField):
+            paths += field_paths(field.document_type, path + '.')
+    return paths
+
+
+def requested_fields(document_cls):
+    """
+    Returns the fields selected with the 'fields' query parameter (comma separated, dotted
+    for sub-document fields e.g. 'Date,AQI,Location.Lat') or None if it was not given.
+    Raises a ValueError for unknown fields
+    """
+    if not request.args.get('fields'):
+        return None
+
+    names = [name.strip() for name in request.args['fields'].split(',') if name.strip()]
+    unknown = set(names) - set(field_paths(document_cls))
+    if unknown:
+        raise ValueError('Unknown fields: ' + ', '.join(sorted(unknown)))
+    return names
+
+
+def project(queryset, required=()):
+    """
+    Returns the queryset as raw dicts projected to the requested fields (every model field by default)
+    plus any required fields. Raises a ValueError for unknown fields
+    """
+    document_cls = queryset._document
+    names = requested_fields(document_cls)
+    if names is None:
+        names = [field.db_field for name, field in document_cls._fields.items() if name != 'id']
+
+    #station metadata is joined by AQSID from the station registry (see stations.py)
+    names = set(names) | set(required)
+    if names & set(STATION_PATHS):
+        names.add('Location.Full_AQSID')
+
+    #mongo rejects projections holding both a field and one of its sub-fields
+    names = [name for name in names 
+                if not any(name.startswith(parent + '.') for parent in names)]
+    return queryset.only(*names).as_pymongo()
@@ -1,66 +1,140 @@
-"""
-This file contains all methods for the '/current' api resource
-Possible requests
---------------------------
--GET: Gets all aqi values from the current collection
--POST: Adds new AQI values to the current collection (only posts most recent AQI values)
--DELETE: Deletes all documents in the current collection
-"""
-from flask import jsonify, request, make_response
-from . import api
-from .. import cache
-from ..models import Location, Current
-from ..http_status import HttpStatus
-from ..decorators import *
-from .general_resource import GeneralResource
-from ..schema import AQIMeasurementSchema
-from marshmallow import ValidationError
-
-
-class CurrentAQI(GeneralResource):
-
-    @token_required_read
-    @cache.cached(timeout=3600)
-    def get(self):
-        self.make_request('/current:GET')
-        data = list(Current.objects())
-        response = jsonify(data)
-        return make_response(response, HttpStatus.ok_200.value)
-
-    @token_required_write
-    def post(self):
-        self.make_request('/current:POST')
-        data = request.get_json()
-        if not data:
-            return  make_response({'message': 'No input data provided'}, HttpStatus.bad_request_400.value)
-        
-        try:
-            AQIMeasurementSchema(many=True).load(data)
-        except ValidationError as err:
-            return make_response({'message': 'Incorrect data format'}, HttpStatus.bad_request_400.value)
-
-
-        curr_objs = [Current(
-                            Date=d['Date'],
-                            Defining_Parameter=d['Defining_Parameter'], 
-                            AQI=d['AQI'], 
-                            Category=self.get_category(d['AQI']), 
-                            Location=Location(
-                              Full_AQSID=d['Location']['Full_AQSID'],
-                              Site_Name=d['Location']['Site_Name'],
-                              Lat=d['Location']['Lat'],
-                              Long=d['Location']['Long'])
-                    ) for d in list(data)]
-        Current.objects.insert(curr_objs)
-
-        return make_response({'message': 'Insert successful'}, HttpStatus.ok_200.value)
-
-    @token_required_write
-    def delete(self):
-        self.make_request('/current:DELETE')
-        cache.clear()
-        Current.objects().delete()
-        return make_response({'message': 'Delete successful'}, HttpStatus.ok_200.value)
-
-
-api.add_resource(CurrentAQI, '/current')
\ No newline at end of file
+"""
+This file contains all methods for the '/current' api resource
+Possible requests
+--------------------------
+-GET: Gets all aqi values from the current collection
+-POST: Adds new AQI values to the current collection (only posts most recent AQI values, re-posted measurements are updated in place).
+       With '?version=' the values are staged in that snapshot version instead of the active one.
+       Also accepts (gzip) ndjson/csv uploads, see ingest.py
+-DELETE: Deletes all documents in the current collection
+'/current/versions'
+-GET: Gets the active snapshot version and the number of documents in each version
+-POST: Atomically makes a staged version the active one (see snapshots.py)
+'/current/nearest'
+-GET: Gets the current aqi values of the k stations nearest to a point, with their distances (see nearest.py)
+"""
+from flask import request, make_response
+from . import api
+from ..response_cache import response_cache
+from ..conditional import conditional, data_version, normalized_query, touch
+from ..models import Current, Station
+from ..http_status import HttpStatus
+from ..decorators import *
+from .general_resource import GeneralResource
+from ..schema import SnapshotSchema
+from ..validation import measurement_validator
+from ..snapshots import active_version, activate_version, version_counts
+from ..responses import wants_ndjson, json_response, ndjson_response
+from ..queries import project
+from ..ingest import is_upload
+from ..nearest import current_index
+from marshmallow import ValidationError
+
+
+CACHE_KEY = 'view/current' #cache key of the '/current' GET response
+
+
+def cache_key():
+    #keyed on the data versions, so writes made through any worker retire the cached response,
+    #and on the query (e.g. '?stations=false' leaves out the station metadata)
+    return f"{CACHE_KEY}/{data_version(Current._get_collection_name())['token']}" \
+           f"/{data_version(Station._get_collection_name())['token']}/{normalized_query()}"
+
+
+def uncached_response():
+    #streamed and projected responses are not part of the cache key
+    return wants_ndjson() or 'fields' in request.args
+
+
+class CurrentAQI(GeneralResource):
+
+    @token_required_read
+    @conditional(Current, Station)
+    @response_cache.cached(timeout=3600, key=cache_key, unless=uncached_response)
+    def get(self):
+        self.make_request('/current:GET')
+        try:
+            query = project(Current.objects(Version=active_version()))
+        except ValueError as err:
+            return make_response({'message': str(err)}, HttpStatus.bad_request_400.value)
+
+        if wants_ndjson():
+            return ndjson_response(query)
+        return make_response(json_response(list(query)), HttpStatus.ok_200.value)
+
+    @token_required_write
+    def post(self):
+        self.make_request('/current:POST')
+        #stages the values in the given version, otherwise updates the active version in place
+        version = request.args.get('version') or active_version()
+
+        #ndjson/csv bodies are streamed in chunks instead of parsed as a whole
+        if is_upload():
+            response = self.upload_measurements(lambda chunk: self.upsert_measurements(Current, chunk, {'Version': version}))
+        else:
+            data = request.get_json()
+            if not data:
+                return  make_response({'message': 'No input data provided'}, HttpStatus.bad_request_400.value)
+            
+            #validated column by column, the validated rows are written directly (see validation.py)
+            measurements, errors = measurement_validator.validate(data)
+            if errors:
+                return make_response({'message': 'Incorrect data format'}, HttpStatus.bad_request_400.value)
+
+            #upserts on (Version, Date, Lat, Long) so retried uploads do not create duplicates
+            counts = self.upsert_measurements(Current, measurements, {'Version': version})
+            response = make_response(dict({'message': 'Insert successful'}, **counts), HttpStatus.ok_200.value)
+
+        if version == active_version():
+            touch(Current)
+        return response
+
+    @token_required_write
+    def delete(self):
+        self.make_request('/current:DELETE')
+        Current.objects().delete()
+        touch(Current)
+        return make_response({'message': 'Delete successful'}, HttpStatus.ok_200.value)
+
+
+class CurrentVersions(GeneralResource):
+
+    @token_required_write
+    def get(self):
+        self.make_request('/current/versions:GET')
+        return make_response({
+                            'active': active_version(),
+                            'versions': [{'Version': version, 'count': count} 
+                                            for version, count in version_counts().items()]
+                            }, HttpStatus.ok_200.value)
+
+    @token_required_write
+    def post(self):
+        self.make_request('/current/versions:POST')
+        try:
+            data = SnapshotSchema().load(request.get_json(silent=True) or {})
+        except ValidationError as err:
+            return make_response({'message': 'Incorrect data format'}, HttpStatus.bad_request_400.value)
+
+        #refuses to activate an empty (e.g. misspelled) version
+        if not Current.objects(Version=data['Version']).limit(1).count(with_limit_and_skip=True):
+            return make_response({'message': 'Version has no documents'}, HttpStatus.bad_request_400.value)
+
+        deleted = activate_version(data['Version'])
+        touch(Current)
+        return make_response({'message': 'Version activated', 'Version': data['Version'], 'deleted': deleted}, 
+                                HttpStatus.ok_200.value)
+
+
+class CurrentNearest(GeneralResource):
+
+    @token_required_read
+    @conditional(Current, Station)
+    def get(self):
+        self.make_request('/current/nearest:GET')
+        return self.nearest_response(current_index)
+
+
+api.add_resource(CurrentAQI, '/current')
+api.add_resource(CurrentNearest, '/current/nearest')
+api.add_resource(CurrentVersions, '/current/versions')
\ No newline at end of file
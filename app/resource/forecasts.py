@@ -1,130 +1,207 @@
-"""
-This file contains all methods for the '/forecasts' api resource
-Possible requests
---------------------------
--GET: Gets forecasted aqi data for the next 7 days based on user given locations
--POST: Adds new predictions to the forecasts collection
--PATCH: Either updates the forecast collection documents with actual aqi values (for model evaluation)
-        or will append updated forecasts to existing documents. The action depends on payload keys passsed.
-"""
-from flask import jsonify, request, make_response
-from mongoengine.queryset.visitor import Q
-from . import api
-from ..models import Location, Prediction, Forecast
-from ..http_status import HttpStatus
-from marshmallow import ValidationError
-from datetime import datetime
-from ..decorators import *
-from .general_resource import GeneralResource
-from ..schema import ForecastQuerySchema, ForecastSchema, AQIMeasurementSchema
-
-
-class ForecastAQI(GeneralResource):
-
-    @token_required_read
-    def get(self):
-
-        self.make_request('/forecasts:GET')
-        errors = ForecastQuerySchema().validate(request.args)
-        today = datetime.utcnow().strftime('%Y-%m-%d')
-        #if schema validation is wrong, will return the default query (USA-PA region)
-        if errors:
-            data = list(Forecast.objects(
-                                        Q(Date__gte=today) \
-                                        & Q(Location__Lat__gte=38) \
-                                        & Q(Location__Lat__lte=40) \
-                                        & Q(Location__Long__gte=-80) \
-                                        & Q(Location__Long__lte=-70)) \
-                .hint([('Date', 1), ('Location.Lat', 1), ('Location.Long', 1)]))
-        else:
-            n_limit = 0
-            #limits number of results returned if limit is given
-            if ('limit' in request.args) and (request.args['limit']):
-                n_limit = 5_000
-            data = list(Forecast.objects(
-                                        Q(Date__gte=today) \
-                                        & Q(Location__Lat__gte=request.args['bLat']) \
-                                        & Q(Location__Lat__lte=request.args['tLat']) \
-                                        & Q(Location__Long__gte=request.args['lLong']) \
-                                        & Q(Location__Long__lte=request.args['rLong']) 
-                                        ).hint([('Date', 1), ('Location.Lat', 1), ('Location.Long', 1)]).limit(n_limit))
-        response =  jsonify(data)
-        return make_response(response, HttpStatus.ok_200.value)
-
-    @token_required_write
-    def post(self):
-
-        self.make_request('/forecasts:POST')
-        data = request.get_json()
-        if not data:
-            response = {'message': 'No input data provided'}
-            return make_response(response, HttpStatus.bad_request_400.value)
-
-        try:
-            ForecastSchema(many=True).load(data)
-        except ValidationError as err:
-            return make_response({'message': 'Incorrect data format'}, HttpStatus.bad_request_400.value)
-
-        forecast_objs = [Forecast(
-                        Date=d['Date'],
-                        Predictions=[Prediction(
-                            Days_in_Advance=d['Predictions']['Days_in_Advance'],
-                            Pred_AQI=d['Predictions']['Pred_AQI'],
-                            Pred_Category=self.get_category(d['Predictions']['Pred_AQI'])
-                            )],
-                        Location=Location(
-                            Lat=d['Location']['Lat'],
-                            Long=d['Location']['Long']
-                            )
-                        ) 
-                        for d in list(data)]
-
-        Forecast.objects.insert(forecast_objs)
-        return make_response({'message': 'Insert successful'}, HttpStatus.ok_200.value)
-    
-    @token_required_write
-    def patch(self):
-
-        self.make_request('/forecasts:PATCH')
-        data = request.get_json()
-        if not data:
-            response = {'message': 'No input data provided'}
-            return make_response(response, HttpStatus.bad_request_400.value)
-
-        # if 'Prediction' in payload key will append updated predictions to existing documents
-        if 'Predictions' in data:
-            try:
-                ForecastSchema(many=True).load(data['Predictions'])
-            except ValidationError as err:
-                return make_response({'message': 'Incorrect data format'}, HttpStatus.bad_request_400.value)
-
-            for d in data['Predictions']:
-                forecast = Forecast.objects(Q(Date=d['Date']) \
-                                        & Q(Location__Lat=d['Location']['Lat']) \
-                                        & Q(Location__Long=d['Location']['Long'])
-                                        ).hint([('Date', 1), ('Location.Lat', 1), ('Location.Long', 1)])
-                prediction = Prediction(Days_in_Advance=d['Predictions']['Days_in_Advance'], 
-                                        Pred_AQI=d['Predictions']['Pred_AQI'], 
-                                        Pred_Category=self.get_category(d['Predictions']['Pred_AQI']))
-                if forecast.count() > 0:
-                    forecast.update_one(push__Predictions=prediction)
-
-        # if 'Actual' in payload key will update real aqi values to old forecasts
-        if 'Actual' in data:
-
-            try:
-                AQIMeasurementSchema(many=True).load(data['Actual'])
-            except ValidationError as err:
-                return make_response({'message': 'Incorrect data format'}, HttpStatus.bad_request_400.value)
-
-            for d in data['Actual']:
-                forecast = Forecast.objects(Q(Date=d['Date']) \
-                        & Q(Location__Lat=d['Location']['Lat']) \
-                        & Q(Location__Long=d['Location']['Long']) 
-                            ).hint([('Date', 1), ('Location.Lat', 1), ('Location.Long', 1)])
-                if forecast.count() > 0:
-                    forecast.update_one(set__Real_AQI=d['AQI'], set__Real_Category=self.get_category(d['AQI']))
-
-        return make_response({'message': 'Insert successful'}, HttpStatus.ok_200.value)
-
-api.add_resource(ForecastAQI, '/forecasts', endpoint='forecasts')
\ No newline at end of file
+"""
+This file contains all methods for the '/forecasts' api resource
+Possible requests
+--------------------------
+-GET: Gets forecasted aqi data for the next 7 days based on user given locations
+-POST: Adds new predictions to the forecasts collection
+-PATCH: Either updates the forecast collection documents with actual aqi values (for model evaluation)
+        or will append updated forecasts to existing documents. The action depends on payload keys passsed.
+'/forecasts/nearest'
+-GET: Gets the forecasts (from today on) of the k stations nearest to a point, with their distances (see nearest.py)
+'/forecasts/run'
+-POST: Runs the forecast job for every station server-side (see forecast_pipeline.py)
+"""
+from flask import request, current_app, make_response
+from mongoengine.queryset.visitor import Q
+from . import api
+from ..models import Location, Prediction, Forecast, Station
+from ..http_status import HttpStatus
+from marshmallow import ValidationError
+from datetime import datetime
+from ..decorators import *
+from .general_resource import GeneralResource
+from ..schema import ForecastQuerySchema, ForecastRunSchema
+from ..validation import measurement_validator, forecast_validator
+from ..forecast_pipeline import run_forecasts
+from ..bulk import bulk_write, document_key
+from pymongo import UpdateOne
+from ..geo import bbox_filter, point, affected_cells, DATE_LAT_LONG_ID_INDEX
+from ..tiles import tile_cache
+from ..conditional import conditional, touch
+from ..responses import wants_ndjson, json_response, ndjson_response, page_response
+from ..queries import project
+from ..dates import to_datetime, today
+from ..nearest import forecast_index
+
+
+class ForecastAQI(GeneralResource):
+
+    @token_required_read
+    @conditional(Forecast, Station, daily=True)
+    def get(self):
+
+        self.make_request('/forecasts:GET')
+        errors = ForecastQuerySchema().validate(request.args)
+        start = today()
+        n_limit = 0
+        #if schema validation is wrong, will return the default query (USA-PA region)
+        if errors:
+            bbox, hint = bbox_filter(38, 40, -80, -70, DATE_LAT_LONG_ID_INDEX)
+            query = Forecast.objects(Q(Date__gte=to_datetime(start)) & bbox).hint(hint)
+        else:
+            #limits number of results returned if limit is given
+            if ('limit' in request.args) and (request.args['limit']):
+                n_limit = 5_000
+            bbox, hint = bbox_filter(request.args['bLat'], request.args['tLat'], 
+                                     request.args['lLong'], request.args['rLong'], DATE_LAT_LONG_ID_INDEX)
+            query = Forecast.objects(Q(Date__gte=to_datetime(start)) & bbox).hint(hint)
+
+        #keyset pagination when a page size is given (ignores limit)
+        if not errors and 'page_size' in request.args:
+            return page_response(query)
+
+        #whole documents of boxes covering few enough tiles are served from the tile cache
+        if not errors and 'fields' not in request.args:
+            rows = tile_cache.rows(Forecast, start, None, 
+                                   float(request.args['bLat']), float(request.args['tLat']), 
+                                   float(request.args['lLong']), float(request.args['rLong']))
+            if rows is not None:
+                return self.rows_response(rows[:n_limit] if n_limit else rows)
+
+        try:
+            query = project(query).limit(n_limit)
+        except ValueError as err:
+            return make_response({'message': str(err)}, HttpStatus.bad_request_400.value)
+
+        if wants_ndjson():
+            return ndjson_response(query)
+        return make_response(json_response(list(query)), HttpStatus.ok_200.value)
+
+    @token_required_write
+    def post(self):
+
+        self.make_request('/forecasts:POST')
+        data = request.get_json()
+        if not data:
+            response = {'message': 'No input data provided'}
+            return make_response(response, HttpStatus.bad_request_400.value)
+
+        #validated column by column, the validated rows are written directly (see validation.py)
+        forecasts, errors = forecast_validator.validate(data)
+        if errors:
+            return make_response({'message': 'Incorrect data format'}, HttpStatus.bad_request_400.value)
+
+        categories = self.get_categories([d['Predictions']['Pred_AQI'] for d in forecasts])
+        forecast_objs = [Forecast(
+                        Date=to_datetime(d['Date']),
+                        Predictions=[Prediction(
+                            Days_in_Advance=d['Predictions']['Days_in_Advance'],
+                            Pred_AQI=d['Predictions']['Pred_AQI'],
+                            Pred_Category=category
+                            )],
+                        Location=Location(
+                            Lat=d['Location']['Lat'],
+                            Long=d['Location']['Long'],
+                            Coordinates=point(d['Location']['Lat'], d['Location']['Long'])
+                            )
+                        ) 
+                        for d, category in zip(forecasts, categories)]
+
+        Forecast.objects.insert(forecast_objs)
+        self.invalidate_tiles(forecasts)
+        return make_response({'message': 'Insert successful'}, HttpStatus.ok_200.value)
+    
+    @token_required_write
+    def patch(self):
+
+        self.make_request('/forecasts:PATCH')
+        data = request.get_json()
+        if not data:
+            response = {'message': 'No input data provided'}
+            return make_response(response, HttpStatus.bad_request_400.value)
+
+        counts = {}
+        # if 'Prediction' in payload key will append updated predictions to existing documents
+        if 'Predictions' in data:
+            forecasts, errors = forecast_validator.validate(data['Predictions'])
+            if errors:
+                return make_response({'message': 'Incorrect data format'}, HttpStatus.bad_request_400.value)
+
+            categories = self.get_categories([d['Predictions']['Pred_AQI'] for d in forecasts])
+            operations = [UpdateOne(document_key(d), 
+                                    {'$push': {'Predictions': {
+                                                'Days_in_Advance': d['Predictions']['Days_in_Advance'], 
+                                                'Pred_AQI': d['Predictions']['Pred_AQI'], 
+                                                'Pred_Category': category
+                                                }}})
+                          for d, category in zip(forecasts, categories)]
+            counts['Predictions'] = self.update_counts(operations)
+            self.invalidate_tiles(forecasts)
+
+        # if 'Actual' in payload key will update real aqi values to old forecasts
+        if 'Actual' in data:
+
+            measurements, errors = measurement_validator.validate(data['Actual'])
+            if errors:
+                return make_response({'message': 'Incorrect data format'}, HttpStatus.bad_request_400.value)
+
+            categories = self.get_categories([d['AQI'] for d in measurements])
+            operations = [UpdateOne(document_key(d), 
+                                    {'$set': {'Real_AQI': d['AQI'], 'Real_Category': category}})
+                          for d, category in zip(measurements, categories)]
+            counts['Actual'] = self.update_counts(operations)
+            self.invalidate_tiles(measurements)
+
+        return make_response(dict({'message': 'Insert successful'}, **counts), HttpStatus.ok_200.value)
+
+    def invalidate_tiles(self, rows):
+        """
+        Drops the cached tiles (of forecasts from today on) holding the given rows
+        """
+        start = today()
+        tile_cache.invalidate(Forecast, {(start, lat, long) for date, lat, long in affected_cells(rows) if date >= start})
+        touch(Forecast)
+
+    def update_counts(self, operations):
+        """
+        Runs the update operations in bulk, returning how many matched, changed or did not match a forecast
+        """
+        counts = bulk_write(Forecast, operations, current_app.config['BULK_WRITE_CHUNK_SIZE'])
+        return {
+            'matched': counts['matched'],
+            'modified': counts['modified'],
+            'unmatched': len(operations) - counts['matched']
+        }
+
+class ForecastNearest(GeneralResource):
+
+    @token_required_read
+    @conditional(Forecast, Station, daily=True)
+    def get(self):
+        self.make_request('/forecasts/nearest:GET')
+        return self.nearest_response(forecast_index)
+
+class ForecastRun(GeneralResource):
+
+    @token_required_write
+    def post(self):
+
+        self.make_request('/forecasts/run:POST')
+        if not current_app.config['INFERENCE_ENABLED']:
+            return make_response({'message': 'Predictions are not served by this server'}, 
+                                    HttpStatus.service_unavailable_503.value)
+
+        try:
+            data = ForecastRunSchema().load(request.get_json(silent=True) or {})
+        except ValidationError as err:
+            return make_response({'message': 'Incorrect data format'}, HttpStatus.bad_request_400.value)
+
+        end_date = datetime.combine(data['End'], datetime.min.time()) if 'End' in data else None
+        result = run_forecasts(end_date, current_app.config['FORECAST_MIN_DAYS'], current_app.config['BULK_WRITE_CHUNK_SIZE'])
+        tile_cache.invalidate_all(Forecast)
+        touch(Forecast)
+        return make_response(result, HttpStatus.ok_200.value)
+
+api.add_resource(ForecastAQI, '/forecasts', endpoint='forecasts')
+api.add_resource(ForecastNearest, '/forecasts/nearest')
+api.add_resource(ForecastRun, '/forecasts/run')
\ No newline at end of file
@@ -1,36 +1,85 @@
-"""
-This file contains the 'GeneralResource' class 
--- a parent class hosting commonly used class methods
-"""
-from flask import request
-from flask_restful import Resource
-from ..models import Request
-
-class GeneralResource(Resource):
-    def make_request(self, request_type):
-        """
-        Updates the 'resource' collection with whatever api resource was used.
-        This is primarily used for trend analysis of api usage
-        """
-        token = request.args.get('token')
-        new_request = Request(
-                                User_Token=token,
-                                Resource=request_type
-                            )
-        Request.objects.insert(new_request)
-
-    def get_category(self, aqi):
-        """
-        Bins aqi values into their given categories
-        """
-        if aqi <= 50:
-            return "Good"
-        if aqi <= 100:
-            return "Moderate"
-        if aqi <= 150:
-            return "Unhealthy for Sensitive Groups"
-        if aqi <= 200:
-            return "Unhealthy"
-        if aqi <= 300:
-            return "Very Unhealthy"
-        return "Hazardous"
\ No newline at end of file
+"""
+This file contains the 'GeneralResource' class 
+-- a parent class hosting commonly used class methods
+"""
+from flask import request, current_app, make_response
+from flask_restful import Resource
+from ..usage import usage_recorder
+from ..stations import station_index
+from ..aqi import get_category, get_categories
+from ..bulk import bulk_write, measurement_upserts
+from ..ingest import read_measurements, ingest
+from ..http_status import HttpStatus
+from ..responses import wants_ndjson, json_response, ndjson_response
+from ..schema import NearestQuerySchema
+from marshmallow import ValidationError
+
+class GeneralResource(Resource):
+    def make_request(self, request_type):
+        """
+        Updates the 'resource' collection with whatever api resource was used.
+        This is primarily used for trend analysis of api usage.
+        Usage is buffered and written in bulk in the background (see usage.py)
+        """
+        token = request.args.get('token')
+        usage_recorder.record(token, request_type)
+
+    def get_category(self, aqi):
+        """
+        Bins aqi values into their given categories
+        """
+        return get_category(aqi)
+
+    def get_categories(self, aqi):
+        """
+        Bins a list of aqi values into their given categories at once
+        """
+        return get_categories(aqi)
+
+    def upsert_measurements(self, model, data, key=None):
+        """
+        Upserts the aqi measurements into the model's collection in bulk.
+        Returns how many were inserted, updated or skipped (already stored unchanged)
+        """
+        station_index.register(data)
+        counts = bulk_write(model, measurement_upserts(data, key), 
+                            current_app.config['BULK_WRITE_CHUNK_SIZE'])
+        return {
+            'inserted': counts['upserted'],
+            'updated': counts['modified'],
+            'skipped': len(data) - counts['upserted'] - counts['modified']
+        }
+
+    def upload_measurements(self, write):
+        """
+        Streams an ndjson/csv upload (see ingest.py) in chunks to write(measurements), which returns write counts.
+        Returns the response reporting the write counts and the invalid rows
+        """
+        rows = read_measurements(request.stream, request.mimetype, 
+                                 request.headers.get('Content-Encoding') == 'gzip')
+        try:
+            result = ingest(rows, write,
+                            current_app.config['BULK_WRITE_CHUNK_SIZE'], current_app.config['INGEST_MAX_ERRORS'])
+        except ValueError as err:
+            return make_response({'message': str(err)}, HttpStatus.bad_request_400.value)
+
+        return make_response(dict({'message': 'Insert successful'}, **result), HttpStatus.ok_200.value)
+
+    def rows_response(self, rows):
+        """
+        Returns the documents (a list, or an iterator read as the response is streamed) as json, or ndjson if asked for
+        """
+        if wants_ndjson():
+            return ndjson_response(rows)
+        return make_response(json_response(list(rows)), HttpStatus.ok_200.value)
+
+    def nearest_response(self, index):
+        """
+        Returns the documents of the k stations nearest to the 'lat'/'long' query point (see nearest.py)
+        """
+        try:
+            args = NearestQuerySchema().load(request.args)
+        except ValidationError as err:
+            return make_response({'message': 'Incorrect query format', 'errors': err.messages}, 
+                                 HttpStatus.bad_request_400.value)
+        return self.rows_response(index.nearest(args['lat'], args['long'], args['k'], args.get('max_km')))
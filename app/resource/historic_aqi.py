@@ -1,82 +1,156 @@
-"""
-This file contains all methods for the '/historic-data' api resource
-Possible requests
---------------------------
--GET: Gets historic aqi data based on user given times/locations
--POST: Adds more data do the historic-data collection
-"""
-from flask import jsonify, request, make_response
-from . import api
-from ..models import Historic, Location
-from ..http_status import HttpStatus
-from mongoengine.queryset.visitor import Q
-from marshmallow import ValidationError
-from ..decorators import *
-from .general_resource import GeneralResource
-from ..schema import AQIMeasurementSchema, HistoricQuerySchema
-
-class HistoricAQI(GeneralResource):
-
-  @token_required_read
-  def get(self):
-    self.make_request('/historic-data:GET')
-    errors = HistoricQuerySchema().validate(request.args)
-    #if the schema is not followed, returns default query (2021/USA-PA region)
-    if errors:
-      data = list(Historic.objects(
-                                  Q(Date__gte="2021-06-30") \
-                                  & Q(Date__lte="2021-12-31") \
-                                  & Q(Location__Lat__gte=38) \
-                                  & Q(Location__Lat__lte=40) \
-                                  & Q(Location__Long__gte=-80) \
-                                  & Q(Location__Long__lte=-70)) \
-                                .hint([('Date', 1), ('Location.Lat', 1), ('Location.Long', 1)]))
-    else:
-      n_limit = 0
-      #limits number of results returned if limit is given
-      if ('limit' in request.args) and (request.args['limit']):
-        n_limit = 5_000
-      data = list(Historic.objects(
-                                  Q(Date__gte=request.args['start']) \
-                                  & Q(Date__lte=request.args['end']) \
-                                  & Q(Location__Lat__gte=request.args['bLat']) \
-                                  & Q(Location__Lat__lte=request.args['tLat']) \
-                                  & Q(Location__Long__gte=request.args['lLong']) \
-                                  & Q(Location__Long__lte=request.args['rLong']) 
-                                  ).hint([('Date', 1), ('Location.Lat', 1), ('Location.Long', 1)]).limit(n_limit))
-    response =  jsonify(data)
-    return make_response(response, HttpStatus.ok_200.value)
-
-  @token_required_write
-  def post(self):
-      self.make_request('/historic-data:POST')
-      data = request.get_json()
-
-      if not data:
-          response = {'message': 'No input data provided'}
-          return make_response(response, HttpStatus.bad_request_400.value)
-      
-      try:
-          AQIMeasurementSchema(many=True).load(data)
-      except ValidationError as err:
-          return make_response({'message': 'Incorrect data format'}, HttpStatus.bad_request_400.value)
-
-      hist_objs = [Historic(
-                          Date=d['Date'],
-                          Defining_Parameter=d['Defining_Parameter'], 
-                          AQI=d['AQI'], 
-                          Category=self.get_category(d['AQI']), 
-                          Location=Location(
-                            Full_AQSID=d['Location']['Full_AQSID'],
-                            Site_Name=d['Location']['Site_Name'],
-                            Lat=d['Location']['Lat'],
-                            Long=d['Location']['Long'])
-                  ) for d in list(data)]
-      Historic.objects.insert(hist_objs)
-
-      return make_response({'message': 'Insert successful'}, HttpStatus.ok_200.value)
-
-
-
-api.add_resource(HistoricAQI, '/historic-data', endpoint='historic-data')
-
+"""
+This file contains all methods for the '/historic-data' api resource
+Possible requests
+--------------------------
+-GET: Gets historic aqi data based on user given times/locations
+-POST: Adds more data do the historic-data collection (re-posted measurements are updated in place).
+       Also accepts (gzip) ndjson/csv uploads, see ingest.py
+'/historic-data/summary'
+-GET: Gets daily/monthly aqi statistics (count, min, mean, max, percentiles, categories) of the grid cells
+      overlapping the given box, read from precomputed rollups (see rollups.py)
+"""
+from itertools import islice
+from flask import request, current_app, make_response
+from marshmallow import ValidationError
+from . import api
+from ..models import Historic, Station
+from ..http_status import HttpStatus
+from mongoengine.queryset.visitor import Q
+from ..decorators import *
+from .general_resource import GeneralResource
+from ..schema import HistoricQuerySchema, SummaryQuerySchema
+from ..rollups import refresh_rollups, summarize
+from ..buckets import bucket_key, refresh_buckets, read_bbox
+from ..dates import to_datetime
+from ..validation import measurement_validator
+from ..geo import bbox_filter, affected_cells
+from ..tiles import tile_cache
+from ..response_cache import response_cache
+from ..conditional import conditional, data_version, normalized_query, touch
+from ..responses import wants_ndjson, json_response, ndjson_response, page_response
+from ..queries import project
+from ..ingest import is_upload
+
+def summary_cache_key():
+  #the data version changes whenever historic data is posted
+  return f"view/historic-summary/{data_version(Historic._get_collection_name())['token']}/{normalized_query()}"
+
+
+class HistoricAQI(GeneralResource):
+
+  @token_required_read
+  @conditional(Historic, Station)
+  def get(self):
+    self.make_request('/historic-data:GET')
+    errors = HistoricQuerySchema().validate(request.args)
+    n_limit = 0
+    #if the schema is not followed, returns default query (2021/USA-PA region)
+    if errors:
+      bbox, hint = bbox_filter(38, 40, -80, -70)
+      query = Historic.objects(
+                              Q(Date__gte=to_datetime("2021-06-30")) \
+                              & Q(Date__lte=to_datetime("2021-12-31")) \
+                              & bbox).hint(hint)
+    else:
+      #limits number of results returned if limit is given
+      if ('limit' in request.args) and (request.args['limit']):
+        n_limit = 5_000
+      bbox, hint = bbox_filter(request.args['bLat'], request.args['tLat'], 
+                               request.args['lLong'], request.args['rLong'])
+      query = Historic.objects(
+                              Q(Date__gte=to_datetime(request.args['start'])) \
+                              & Q(Date__lte=to_datetime(request.args['end'])) \
+                              & bbox).hint(hint)
+
+    #keyset pagination when a page size is given (ignores limit)
+    if not errors and 'page_size' in request.args:
+      return page_response(query)
+
+    #whole documents of boxes covering few enough tiles are served from the tile cache
+    if not errors and 'fields' not in request.args:
+      rows = tile_cache.rows(Historic, request.args['start'], request.args['end'], 
+                             float(request.args['bLat']), float(request.args['tLat']), 
+                             float(request.args['lLong']), float(request.args['rLong']))
+      if rows is not None:
+        return self.rows_response(rows[:n_limit] if n_limit else rows)
+
+      #larger boxes are streamed from the monthly buckets if enabled
+      if current_app.config['HISTORIC_BUCKETS']:
+        rows = read_bbox(request.args['start'], request.args['end'], 
+                         float(request.args['bLat']), float(request.args['tLat']), 
+                         float(request.args['lLong']), float(request.args['rLong']),
+                         current_app.config['STREAM_BATCH_SIZE'])
+        return self.rows_response(islice(rows, n_limit) if n_limit else rows)
+
+    try:
+      query = project(query).limit(n_limit)
+    except ValueError as err:
+      return make_response({'message': str(err)}, HttpStatus.bad_request_400.value)
+
+    if wants_ndjson():
+      return ndjson_response(query)
+    return make_response(json_response(list(query)), HttpStatus.ok_200.value)
+
+  @token_required_write
+  def post(self):
+      self.make_request('/historic-data:POST')
+      #ndjson/csv bodies are streamed in chunks instead of parsed as a whole
+      if is_upload():
+        return self.upload_measurements(self.write_measurements)
+
+      data = request.get_json()
+
+      if not data:
+          response = {'message': 'No input data provided'}
+          return make_response(response, HttpStatus.bad_request_400.value)
+      
+      #validated column by column, the validated rows are written directly (see validation.py)
+      measurements, errors = measurement_validator.validate(data)
+      if errors:
+          return make_response({'message': 'Incorrect data format'}, HttpStatus.bad_request_400.value)
+
+      counts = self.write_measurements(measurements)
+
+      return make_response(dict({'message': 'Insert successful'}, **counts), HttpStatus.ok_200.value)
+
+  def write_measurements(self, measurements):
+      """
+      Upserts the measurements, then refreshes the rollups and cached tiles of the days/grid cells they changed
+      (and their monthly buckets if enabled)
+      """
+      #upserts on (Date, Lat, Long) so retried uploads do not create duplicates
+      counts = self.upsert_measurements(Historic, measurements)
+      if counts['inserted'] or counts['updated']:
+        cells = affected_cells(measurements)
+        refresh_rollups(cells, current_app.config['BULK_WRITE_CHUNK_SIZE'])
+        if current_app.config['HISTORIC_BUCKETS']:
+          refresh_buckets(map(bucket_key, measurements), current_app.config['BULK_WRITE_CHUNK_SIZE'])
+        tile_cache.invalidate(Historic, set(cells))
+        touch(Historic)
+      return counts
+
+
+class HistoricSummary(GeneralResource):
+
+  @token_required_read
+  @conditional(Historic)
+  def get(self):
+    self.make_request('/historic-data/summary:GET')
+    return response_cache.cached(timeout=current_app.config['SUMMARY_CACHE_TIMEOUT'], key=summary_cache_key)(self.summary)()
+
+  def summary(self):
+    try:
+      args = SummaryQuerySchema().load(request.args)
+    except ValidationError as err:
+      return make_response({'message': 'Incorrect query format', 'errors': err.messages}, 
+                           HttpStatus.bad_request_400.value)
+
+    summary = summarize(args['period'], args['start'], args['end'], 
+                        args['bLat'], args['tLat'], args['lLong'], args['rLong'])
+    return make_response(json_response(summary), HttpStatus.ok_200.value)
+
+
+
+api.add_resource(HistoricAQI, '/historic-data', endpoint='historic-data')
+api.add_resource(HistoricSummary, '/historic-data/summary')
+
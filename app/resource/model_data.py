@@ -1,50 +1,71 @@
-"""
-This file contains all methods for the '/model-data' api resource
-Possible requests
---------------------------
--POST: Given datetime/location parameters, returns the last 30 days of 
-aqi values for the given dates/locations
-"""
-from flask import jsonify, request, make_response
-from . import api
-from ..models import Historic
-from mongoengine.queryset.visitor import Q
-from ..http_status import HttpStatus
-from ..decorators import *
-from .general_resource import GeneralResource
-from ..schema import ModelDataSchema
-from marshmallow import ValidationError
-
-
-
-class ModelData(GeneralResource):
-
-    @token_required_write
-    def post(self):
-        self.make_request('/model-data:POST')
-        data = request.get_json()
-        if not data:
-            response = {'message': 'No input data provided'}
-            return make_response(response, HttpStatus.bad_request_400.value)
-
-        try:
-            ModelDataSchema(many=True).load(data)
-        except ValidationError as err:
-            return make_response({'message': 'Incorrect data format'}, HttpStatus.bad_request_400.value)
-
-        model_data = []
-        for d in data:
-            query = list(Historic.objects(
-                            Q(Date__gte=d['Start']) \
-                            & Q(Date__lte=d['End']) \
-                            & Q(Location__Lat=d['Location']['Lat']) \
-                            & Q(Location__Long=d['Location']['Long']) 
-                            ).hint([('Date', 1), ('Location.Lat', 1), ('Location.Long', 1)]))
-            model_data += query
-
-        response =  jsonify(model_data)
-        return make_response(response, HttpStatus.ok_200.value)
-
-
-
+"""
+This file contains all methods for the '/model-data' api resource
+Possible requests
+--------------------------
+-POST: Given datetime/location parameters, returns the last 30 days of 
+aqi values for the given dates/locations (read from the monthly buckets if enabled, see buckets.py)
+"""
+from flask import request, current_app, make_response
+from . import api
+from ..models import Historic
+from mongoengine.queryset.visitor import Q
+from ..http_status import HttpStatus
+from ..decorators import *
+from .general_resource import GeneralResource
+from ..schema import ModelDataSchema
+from ..geo import DATE_LAT_LONG_INDEX
+from ..responses import wants_ndjson, json_response, ndjson_response
+from ..queries import project
+from ..buckets import read_series
+from ..dates import to_datetime
+from marshmallow import ValidationError
+
+
+
+class ModelData(GeneralResource):
+
+    @token_required_write
+    def post(self):
+        self.make_request('/model-data:POST')
+        data = request.get_json()
+        if not data:
+            response = {'message': 'No input data provided'}
+            return make_response(response, HttpStatus.bad_request_400.value)
+
+        try:
+            ModelDataSchema(many=True).load(data)
+        except ValidationError as err:
+            return make_response({'message': 'Incorrect data format'}, HttpStatus.bad_request_400.value)
+
+        #a series is packed in 1-2 monthly buckets instead of one document per day
+        if current_app.config['HISTORIC_BUCKETS'] and 'fields' not in request.args:
+            model_data = [row for d in data 
+                            for row in read_series(d['Location']['Lat'], d['Location']['Long'], d['Start'], d['End'])]
+            if wants_ndjson():
+                return ndjson_response(model_data)
+            return make_response(json_response(model_data), HttpStatus.ok_200.value)
+
+        queries = [Historic.objects(
+                            Q(Date__gte=to_datetime(d['Start'])) \
+                            & Q(Date__lte=to_datetime(d['End'])) \
+                            & Q(Location__Lat=d['Location']['Lat']) \
+                            & Q(Location__Long=d['Location']['Long']) 
+                            ).hint(DATE_LAT_LONG_INDEX)
+                    for d in data]
+        try:
+            queries = [project(query) for query in queries]
+        except ValueError as err:
+            return make_response({'message': str(err)}, HttpStatus.bad_request_400.value)
+
+        if wants_ndjson():
+            return ndjson_response(*queries)
+
+        model_data = []
+        for query in queries:
+            model_data += list(query)
+
+        return make_response(json_response(model_data), HttpStatus.ok_200.value)
+
+
+
 api.add_resource(ModelData, '/model-data')
\ No newline at end of file
@@ -0,0 +1,36 @@
+"""
+This file contains all methods for the '/stats' api resource
+Possible requests
+--------------------------
+-GET: Returns the in-process counters (caches, buffers) of the worker serving the request, for monitoring
+"""
+from flask import make_response
+from . import api
+from ..decorators import *
+from ..http_status import HttpStatus
+from .general_resource import GeneralResource
+from ..usage import usage_recorder
+from ..inference import batch_predictor
+from ..tiles import tile_cache
+from ..response_cache import response_cache
+from ..stations import station_index
+from ..nearest import current_index, forecast_index
+
+
+class Stats(GeneralResource):
+
+    @token_required_write
+    def get(self):
+        stats = {
+            'token_cache': token_cache.stats(),
+            'usage': usage_recorder.stats(),
+            'inference': batch_predictor.stats(),
+            'tile_cache': tile_cache.stats(),
+            'response_cache': response_cache.stats(),
+            'stations': station_index.stats(),
+            'nearest': {'current': current_index.stats(), 'forecasts': forecast_index.stats()}
+        }
+        return make_response(stats, HttpStatus.ok_200.value)
+
+
+api.add_resource(Stats, '/stats')
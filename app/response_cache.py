@@ -0,0 +1,140 @@
+"""
+This file contains the response cache used by every cached resource. It sits on top of the
+application cache (which can be shared between workers, see CACHE_TYPE in config.py) and adds
+- single-flight: only one worker/thread recomputes a missing or expired key (others wait for it)
+- stale-while-revalidate: expired entries are still served while that one recomputes them
+- hit/miss/latency statistics
+"""
+from functools import wraps
+from threading import Lock
+from uuid import uuid4
+from flask import make_response
+import time
+from . import cache
+
+
+class ResponseCache:
+    """
+    Caches values as {'value', 'fresh_until'} entries kept stale_timeout seconds past their timeout.
+    Recomputing a key is guarded by a 'lock/<key>' entry taken with cache.add, which is atomic on
+    the shared backends (redis/memcached) as well as the in-process ones
+    """
+
+    def __init__(self, stale_timeout=300, lock_timeout=30, poll_interval=0.05):
+        self.stale_timeout = stale_timeout
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+        self._lock = Lock()
+        self._reset_stats()
+
+    def init_app(self, app):
+        self.stale_timeout = app.config['RESPONSE_CACHE_STALE_TIMEOUT']
+        self.lock_timeout = app.config['RESPONSE_CACHE_LOCK_TIMEOUT']
+        self._reset_stats()
+
+    def _reset_stats(self):
+        with self._lock:
+            self.hits = 0
+            self.stale_hits = 0
+            self.misses = 0
+            self.coalesced = 0
+            self.computed = 0
+            self.compute_seconds = 0.0
+            self.lookup_seconds = 0.0
+
+    def _count(self, counter, seconds=0.0, lookup_seconds=0.0):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+            self.compute_seconds += seconds
+            self.lookup_seconds += lookup_seconds
+
+    def get_or_compute(self, key, compute, timeout):
+        """
+        Returns the cached value of key, computing it with compute() (only in one worker at a time) if needed.
+        compute returns (value, cacheable); uncacheable values (e.g. error responses) are returned but not stored
+        """
+        started = time.perf_counter()
+        entry = cache.get(key)
+        lookup = time.perf_counter() - started
+        if entry is not None and entry['fresh_until'] > time.time():
+            self._count('hits', lookup_seconds=lookup)
+            return entry['value']
+
+        token = uuid4().hex
+        if cache.add(f'lock/{key}', token, timeout=self.lock_timeout):
+            try:
+                self._count('misses' if entry is None else 'stale_hits', lookup_seconds=lookup)
+                return self._compute(key, compute, timeout)
+            finally:
+                if cache.get(f'lock/{key}') == token:
+                    cache.delete(f'lock/{key}')
+
+        #another worker is recomputing the key: serve the stale value, or wait for the new one
+        if entry is not None:
+            self._count('stale_hits', lookup_seconds=lookup)
+            return entry['value']
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline and cache.get(f'lock/{key}') is not None:
+            time.sleep(self.poll_interval)
+            entry = cache.get(key)
+            if entry is not None:
+                self._count('coalesced', lookup_seconds=lookup)
+                return entry['value']
+        #the other worker failed (or gave up), so the value is computed here
+        self._count('misses', lookup_seconds=lookup)
+        return self._compute(key, compute, timeout)
+
+    def _compute(self, key, compute, timeout):
+        started = time.perf_counter()
+        value, cacheable = compute()
+        if cacheable:
+            cache.set(key, {'value': value, 'fresh_until': time.time() + timeout},
+                      timeout=timeout + self.stale_timeout)
+        self._count('computed', seconds=time.perf_counter() - started)
+        return value
+
+    def cached(self, timeout, key, unless=None):
+        """
+        Decorates a resource method so its (200) responses are cached under key()
+        unless unless() returns True
+        """
+        def decorator(f):
+            @wraps(f)
+            def decorated(*args, **kwargs):
+                if unless is not None and unless():
+                    return f(*args, **kwargs)
+
+                def compute():
+                    response = make_response(f(*args, **kwargs))
+                    if response.status_code != 200 or response.is_streamed:
+                        return response, False
+                    return (response.get_data(), response.status_code, list(response.headers.items())), True
+
+                value = self.get_or_compute(key(), compute, timeout)
+                if isinstance(value, tuple):
+                    return make_response(value)
+                return value
+            return decorated
+        return decorator
+
+    def delete(self, key):
+        """
+        Drops the cached value of key (it is recomputed, not served stale, on the next request)
+        """
+        cache.delete(key)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.stale_hits + self.misses + self.coalesced
+            return {
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'computed': self.computed,
+                'avg_compute_ms': round(1000 * self.compute_seconds / self.computed, 3) if self.computed else None,
+                'avg_lookup_ms': round(1000 * self.lookup_seconds / lookups, 3) if lookups else None
+            }
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,108 @@
+"""
+This file contains helpers for building data responses. By default results are
+returned as one json array; clients can opt in to a streamed, newline delimited
+json (ndjson) response with '?format=ndjson' or 'Accept: application/x-ndjson'
+"""
+from flask import request, current_app, make_response, Response, stream_with_context
+from bson import ObjectId
+from datetime import datetime
+import json
+from .http_status import HttpStatus
+from .pagination import paginate, PAGE_KEY_FIELDS
+from .queries import project
+from .stations import station_index
+from .dates import date_string
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+
+def _encode(value):
+    """
+    Encodes the bson types found in raw documents the same way as (relaxed) extended json
+    """
+    if isinstance(value, ObjectId):
+        return {'$oid': str(value)}
+    if isinstance(value, datetime):
+        if value.microsecond:
+            return {'$date': value.strftime('%Y-%m-%dT%H:%M:%S.') + '%03dZ' % (value.microsecond // 1000)}
+        return {'$date': value.strftime('%Y-%m-%dT%H:%M:%SZ')}
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def dumps(data):
+    """
+    Serializes raw documents to json. Unlike bson's json_util this leaves the walk over
+    dicts/lists to the C encoder and only calls back into python for ObjectIds and dates
+    """
+    return json.dumps(data, default=_encode, separators=(',', ':'))
+
+
+def wants_ndjson():
+    """
+    Returns True if the client asked for a streamed ndjson response
+    """
+    if 'format' in request.args:
+        return request.args['format'] == 'ndjson'
+    return request.accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
+
+
+def presenter():
+    """
+    Returns a function preparing a raw document for the response: station metadata
+    joined (see stations.py) and the stored Date sent back as YYYY-MM-DD
+    """
+    join = station_index.joiner()
+
+    def present(document):
+        document = join(document)
+        if isinstance(document.get('Date'), datetime):
+            document = dict(document, Date=date_string(document['Date']))
+        return document
+    return present
+
+
+def json_response(data):
+    """
+    Returns a json response for data holding raw (pymongo) documents
+    (a list of documents is prepared for the response, see presenter)
+    """
+    if isinstance(data, list):
+        data = list(map(presenter(), data))
+    return current_app.response_class(dumps(data), mimetype='application/json')
+
+
+def ndjson_response(*sources, headers=None):
+    """
+    Streams the documents of the given querysets (or lists of raw documents) as ndjson,
+    one document per line. Querysets are read as raw dicts from the pymongo cursor in batches 
+    of STREAM_BATCH_SIZE, so time-to-first-byte and memory use do not depend on the size of the result
+    """
+    batch_size = current_app.config['STREAM_BATCH_SIZE']
+    present = presenter()
+
+    def generate():
+        for source in sources:
+            if hasattr(source, 'as_pymongo'):
+                source = source.as_pymongo().batch_size(batch_size)
+            for document in source:
+                yield dumps(present(document)) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE, headers=headers)
+
+
+def page_response(queryset):
+    """
+    Returns one page of the queryset using the 'page_size' and 'cursor' query parameters.
+    Json responses are wrapped as {'data': [...], 'next': cursor}; ndjson responses
+    return the next cursor in the 'X-Next-Cursor' header. 'next' is null on the last page.
+    Rows are projected like any other read, but always include the fields the cursor is built from
+    """
+    try:
+        queryset = project(queryset, required=PAGE_KEY_FIELDS)
+        page, next_cursor = paginate(queryset, int(request.args['page_size']), request.args.get('cursor'))
+    except ValueError as err:
+        return make_response({'message': str(err)}, HttpStatus.bad_request_400.value)
+
+    if wants_ndjson():
+        return ndjson_response(page, headers={'X-Next-Cursor': next_cursor or ''})
+    return json_response({'data': list(map(presenter(), page)), 'next': next_cursor})
@@ -0,0 +1,143 @@
+"""
+This file contains the materialized rollups of the historic-data collection.
+Every (day, grid cell) and (month, grid cell) keeps the count/sum/min/max of its aqi values,
+a histogram of the values (so percentiles of merged rollups are exact) and category counts.
+Posting historic data recomputes only the day/cells it touched, then their months,
+so summaries over large regions and years read a few rollups instead of every raw row
+"""
+from collections import Counter
+from pymongo import ReplaceOne
+import numpy as np
+from .models import Historic, Rollup
+from .geo import grid_cell, affected_cells, GRID_SIZE
+from .bulk import bulk_write
+from .dates import to_datetime, date_string
+
+PERCENTILES = (25, 50, 75, 90)
+
+
+def _rollup(period, date, cell_lat, cell_long, aqi, categories):
+    """
+    Returns the rollup document of the given aqi values/categories
+    """
+    values, counts = np.unique(np.asarray(aqi, dtype=np.int64), return_counts=True)
+    return {
+        'Period': period, 'Date': date, 'Cell_Lat': cell_lat, 'Cell_Long': cell_long,
+        'Count': int(counts.sum()), 'Sum': int((values * counts).sum()),
+        'Min': int(values[0]), 'Max': int(values[-1]),
+        'Histogram': {str(value): count for value, count in zip(values.tolist(), counts.tolist())},
+        'Categories': dict(Counter(categories))
+    }
+
+
+def merge(rollups, **key):
+    """
+    Merges rollups (of any periods/cells) into one, keyed with the given fields
+    """
+    histogram, categories = Counter(), Counter()
+    for rollup in rollups:
+        histogram.update(rollup['Histogram'])
+        categories.update(rollup['Categories'])
+    return dict(key,
+                Count=sum(histogram.values()),
+                Sum=sum(int(value) * count for value, count in histogram.items()),
+                Min=min(map(int, histogram)), Max=max(map(int, histogram)),
+                Histogram=dict(histogram), Categories=dict(categories))
+
+
+def percentiles(histogram, ranks=PERCENTILES):
+    """
+    Returns the (nearest rank) percentiles of the values counted in the histogram
+    """
+    values = np.array(sorted(map(int, histogram)))
+    cumulative = np.cumsum([histogram[str(value)] for value in values])
+    positions = np.ceil(np.asarray(ranks) / 100 * cumulative[-1]).clip(1)
+    return {f'P{rank}': int(values[i]) for rank, i in zip(ranks, np.searchsorted(cumulative, positions))}
+
+
+def refresh_rollups(cells, chunk_size=1_000):
+    """
+    Recomputes the day rollups of the given (date, cell lat, cell long) keys from the raw
+    documents, then the month rollups holding them. Returns the number of rewritten rollups
+    """
+    cells = set(cells)
+    if not cells:
+        return 0
+    dates = sorted({date for date, _, _ in cells})
+    lats = [lat for _, lat, _ in cells]
+    longs = [long for _, _, long in cells]
+    rows = Historic.objects(Date__in=[to_datetime(date) for date in dates],
+                            Location__Lat__gte=min(lats), Location__Lat__lt=max(lats) + GRID_SIZE,
+                            Location__Long__gte=min(longs), Location__Long__lt=max(longs) + GRID_SIZE
+                            ).only('Date', 'AQI', 'Category', 'Location.Lat', 'Location.Long').as_pymongo()
+
+    groups = {}
+    rows = list(rows)
+    for row, key in zip(rows, affected_cells(rows)):
+        if key in cells:
+            group = groups.setdefault(key, ([], []))
+            group[0].append(row['AQI'])
+            group[1].append(row['Category'])
+    days = [_rollup('day', *key, aqi, categories) for key, (aqi, categories) in groups.items()]
+
+    #months are merged from all the (already stored and refreshed) day rollups of the month
+    months = {(date[:7], lat, long) for date, lat, long in groups}
+    refreshed = {(day['Date'], day['Cell_Lat'], day['Cell_Long']): day for day in days}
+    stored = Rollup.objects(Period='day', Date__gte=min(months)[0], Date__lt=max(months)[0] + '-32',
+                            Cell_Lat__in=list({lat for _, lat, _ in months}),
+                            Cell_Long__in=list({long for _, _, long in months})
+                            ).exclude('id').as_pymongo()
+    month_days = {}
+    for day in list(stored) + days:
+        key = (day['Date'][:7], day['Cell_Lat'], day['Cell_Long'])
+        if key in months:
+            #refreshed days replace their stored version
+            month_days.setdefault(key, {})[day['Date']] = refreshed.get((day['Date'],) + key[1:], day)
+    months = [merge(month.values(), Period='month', Date=key[0], Cell_Lat=key[1], Cell_Long=key[2])
+                for key, month in month_days.items()]
+
+    operations = [ReplaceOne({key: rollup[key] for key in ('Period', 'Date', 'Cell_Lat', 'Cell_Long')}, rollup, upsert=True)
+                    for rollup in days + months]
+    bulk_write(Rollup, operations, chunk_size)
+    return len(operations)
+
+
+def rebuild_rollups(chunk_size=1_000):
+    """
+    Recomputes the rollups of every historic document, one day at a time. Returns the number of rewritten rollups
+    """
+    rewritten = 0
+    for date in sorted(Historic.objects.distinct('Date')):
+        rows = Historic.objects(Date=date).only('Location.Lat', 'Location.Long').as_pymongo()
+        rewritten += refresh_rollups(affected_cells([dict(row, Date=date) for row in rows]), chunk_size)
+    return rewritten
+
+
+def summarize(period, start, end, bLat, tLat, lLong, rLong):
+    """
+    Returns the aqi summary of every day/month between start and end for the grid cells
+    overlapping the bounding box, read from the rollups
+    """
+    start, end = date_string(start), date_string(end)
+    if period == 'month':
+        start, end = start[:7], end[:7]
+    (bottom, left) = grid_cell(bLat, lLong)
+    rollups = Rollup.objects(Period=period, Date__gte=start, Date__lte=end,
+                             Cell_Lat__gte=float(bottom), Cell_Lat__lte=tLat,
+                             Cell_Long__gte=float(left), Cell_Long__lte=rLong
+                             ).exclude('id').as_pymongo()
+    dates = {}
+    for rollup in rollups:
+        dates.setdefault(rollup['Date'], []).append(rollup)
+
+    summary = []
+    for date in sorted(dates):
+        rollup = merge(dates[date], Date=date)
+        summary.append({
+            'Date': date, 'Count': rollup['Count'], 'Min': rollup['Min'], 'Max': rollup['Max'],
+            'Mean': round(rollup['Sum'] / rollup['Count'], 2),
+            'Percentiles': percentiles(rollup['Histogram']),
+            'Categories': rollup['Categories'],
+            'Cells': len(dates[date])
+        })
+    return summary
@@ -0,0 +1,60 @@
+"""
+This file contains the versioned snapshots of the current collection.
+Measurements are loaded into a (staged) version and made visible all at once by
+flipping the active version stored in a single pointer document, so readers never
+see a half-loaded snapshot
+"""
+from datetime import datetime
+from pymongo.errors import DuplicateKeyError
+from .models import Current, Snapshot
+
+SNAPSHOT_NAME = 'current'
+
+
+def active_version():
+    """
+    Returns the active version of the current collection (None until a version is activated,
+    which serves the unversioned documents)
+    """
+    pointer = Snapshot.objects(Name=SNAPSHOT_NAME).only('Version').as_pymongo().first()
+    return pointer.get('Version') if pointer else None
+
+
+def activate_version(version):
+    """
+    Atomically makes the given version the active one. The previously active version is
+    kept for readers that already looked up the pointer, the one before that is deleted.
+    Returns the number of deleted documents
+    """
+    collection = Snapshot._get_collection()
+    while True:
+        previous = collection.find_one({'Name': SNAPSHOT_NAME})
+        pointer = {
+            'Version': version, 
+            'Previous_Version': previous.get('Version') if previous else None, 
+            'Activated': datetime.utcnow()
+        }
+        if previous is None:
+            try:
+                collection.insert_one(dict(pointer, Name=SNAPSHOT_NAME))
+                return 0
+            except DuplicateKeyError:
+                continue
+        #compare and swap, so concurrent activations are applied one after the other
+        swapped = collection.update_one({'_id': previous['_id'], 'Version': previous.get('Version')}, 
+                                        {'$set': pointer})
+        if swapped.matched_count:
+            break
+
+    if previous.get('Previous_Version') in (version, pointer['Previous_Version']):
+        return 0
+    #unversioned documents are stored without a 'Version' and match None
+    return Current._get_collection().delete_many({'Version': previous.get('Previous_Version')}).deleted_count
+
+
+def version_counts():
+    """
+    Returns the number of documents stored in each version
+    """
+    groups = Current._get_collection().aggregate([{'$group': {'_id': '$Version', 'count': {'$sum': 1}}}])
+    return {group['_id']: group['count'] for group in groups}
@@ -0,0 +1,112 @@
+"""
+This file contains the station registry. The metadata of a monitoring site (site name, CBSA, city, state,
+population, density, timezone) is kept once in the 'stations' collection, keyed by AQSID, instead of in
+every one of its measurement documents, whose Location only holds the AQSID and coordinates.
+Every worker keeps the registry in memory, reloading it whenever the stations' data version changes
+(see conditional.py), and joins the metadata back into the documents it returns
+"""
+from threading import Lock
+from flask import request, current_app
+from pymongo import UpdateOne
+from .models import Station
+from .bulk import bulk_write
+from .conditional import data_version, touch
+
+#Location fields kept in the registry instead of the measurement documents
+STATION_FIELDS = ('Site_Name', 'CBSA_Code', 'City', 'State', 'Population', 'Density', 'Timezone')
+STATION_PATHS = tuple(f'Location.{field}' for field in STATION_FIELDS)
+
+
+def station_fields():
+    """
+    Returns the station fields to join into the returned documents: every one unless
+    omitted with '?stations=false' or left out of the 'fields' projection
+    """
+    if request.args.get('stations', '').lower() in ['false', 'f', 'off', 'no', 'n', '0']:
+        return ()
+    if not request.args.get('fields'):
+        return STATION_FIELDS
+    names = {name.strip() for name in request.args['fields'].split(',')}
+    if 'Location' in names:
+        return STATION_FIELDS
+    return tuple(field for field, path in zip(STATION_FIELDS, STATION_PATHS) if path in names)
+
+
+class StationIndex:
+    """
+    In-memory {AQSID: station} index of the station registry
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._stations = {}
+        self._version = None
+        self.reloads = 0
+
+    def init_app(self, app):
+        with self._lock:
+            self._stations = {}
+            self._version = None
+            self.reloads = 0
+
+    def stations(self):
+        """
+        Returns the {AQSID: station} index, reloaded if the registry changed since it was loaded
+        """
+        version = data_version(Station._get_collection_name())['token']
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._stations = {station['AQSID']: station
+                                        for station in Station.objects.exclude('id').as_pymongo()}
+                    self._version = version
+                    self.reloads += 1
+        return self._stations
+
+    def register(self, data):
+        """
+        Upserts the stations of the measurements whose metadata is new or changed. Returns the number of written stations
+        """
+        stations = self.stations()
+        changes = {}
+        for d in data:
+            location = d['Location']
+            if not location.get('Full_AQSID'):
+                continue
+            metadata = {field: location[field] for field in STATION_FIELDS if field in location}
+            metadata.update(Lat=float(location['Lat']), Long=float(location['Long']))
+            stored = stations.get(location['Full_AQSID'], {})
+            if any(stored.get(field) != value for field, value in metadata.items()):
+                changes.setdefault(location['Full_AQSID'], {}).update(metadata)
+
+        if changes:
+            bulk_write(Station, [UpdateOne({'AQSID': aqsid}, {'$set': metadata}, upsert=True)
+                                    for aqsid, metadata in changes.items()],
+                       current_app.config['BULK_WRITE_CHUNK_SIZE'])
+            touch(Station)
+        return len(changes)
+
+    def joiner(self):
+        """
+        Returns a function adding the (requested) station metadata to a returned document's Location
+        """
+        fields = station_fields()
+        if not fields:
+            return lambda document: document
+        stations = self.stations()
+
+        def join(document):
+            location = document.get('Location')
+            station = location and stations.get(location.get('Full_AQSID'))
+            if not station:
+                return document
+            #documents may be shared (e.g. cached tiles), so the joined ones are copies
+            joined = dict(location, **{field: station[field] for field in fields if field in station})
+            return dict(document, Location=joined)
+        return join
+
+    def stats(self):
+        return {'stations': len(self._stations), 'reloads': self.reloads}
+
+
+station_index = StationIndex()
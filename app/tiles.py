@@ -0,0 +1,145 @@
+"""
+This file contains the tile cache of the bbox queries ('/historic-data' and '/forecasts').
+A query's bounding box is split into fixed grid cells (see geo.GRID_SIZE) per date, every
+(date, cell) tile is cached on its own, and the tiles are stitched together and clipped to
+the box per request, so overlapping and panned boxes mostly hit the cache. Ingestion drops
+the tiles of the dates/cells it wrote (or every tile of a collection, by bumping its generation).
+Invalidations only reach the workers sharing the cache backend, so the tile cache is off unless
+CACHE_TYPE is shared by every worker (see TILE_CACHE_ENABLED)
+"""
+from datetime import datetime, timedelta
+from threading import Lock
+from flask import current_app
+from uuid import uuid4
+import numpy as np
+from . import cache
+from .geo import grid_cell, affected_cells, GRID_SIZE
+from .dates import to_datetime
+
+
+class TileCache:
+    """
+    Caches the raw documents of every (date, grid cell) tile in the application cache
+    """
+
+    def __init__(self, timeout=3600, max_tiles=2_000):
+        self.timeout = timeout
+        self.max_tiles = max_tiles
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    def init_app(self, app):
+        self.timeout = app.config['TILE_CACHE_TIMEOUT']
+        self.max_tiles = app.config['TILE_CACHE_MAX_TILES']
+        with self._lock:
+            self.hits = self.misses = self.bypassed = 0
+
+    def _generation(self, collection):
+        #a lost (evicted) generation is replaced by a new one, so older tiles can never be served again
+        key = f'tiles/{collection}/generation'
+        generation = cache.get(key)
+        if generation is None:
+            cache.add(key, uuid4().hex, timeout=0)
+            generation = cache.get(key)
+        return generation
+
+    def _key(self, collection, generation, date, lat, long):
+        return f'tiles/{collection}/{generation}/{date}/{lat:g}/{long:g}'
+
+    def rows(self, model, start, end, bLat, tLat, lLong, rLong):
+        """
+        Returns the raw documents of the model's collection dated from start to end (YYYY-MM-DD) inside
+        the box, sorted by date/lat/long, or None if the tile cache is off or the query covers too many 
+        tiles to be cached. Without an end, the documents dated on or after start are returned (as one tile per cell)
+        """
+        if not current_app.config['TILE_CACHE_ENABLED']:
+            return None
+        (bottom, left), (top, right) = grid_cell(bLat, lLong), grid_cell(tLat, rLong)
+        lats = np.arange(bottom, top + GRID_SIZE / 2, GRID_SIZE).tolist()
+        longs = np.arange(left, right + GRID_SIZE / 2, GRID_SIZE).tolist()
+        try:
+            days = 1 if end is None else (parse_date(end) - parse_date(start)).days + 1
+        except ValueError:
+            days = None
+        if days is None or days * len(lats) * len(longs) > self.max_tiles:
+            with self._lock:
+                self.bypassed += 1
+            return None
+        dates = [start] if end is None else date_range(start, end)
+        open_ended = end is None
+
+        collection = model._get_collection_name()
+        generation = self._generation(collection)
+        tiles = {(date, lat, long): self._key(collection, generation, date, lat, long)
+                    for date in dates for lat in lats for long in longs}
+        cached = dict(zip(tiles, cache.get_many(*tiles.values())))
+        missing = [tile for tile, rows in cached.items() if rows is None]
+        with self._lock:
+            self.hits += len(tiles) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            loaded = self._load(model, missing, open_ended)
+            cache.set_many({tiles[tile]: loaded[tile] for tile in missing}, timeout=self.timeout)
+            cached.update(loaded)
+
+        #stitches the tiles and clips them to the box
+        rows = [row for tile in tiles for row in cached[tile]
+                    if bLat <= row['Location']['Lat'] <= tLat and lLong <= row['Location']['Long'] <= rLong]
+        rows.sort(key=lambda row: (row['Date'], row['Location']['Lat'], row['Location']['Long']))
+        return rows
+
+    def _load(self, model, tiles, open_ended):
+        """
+        Loads the given tiles with one query over the box/dates covering them
+        """
+        dates = sorted({date for date, _, _ in tiles})
+        lats = [lat for _, lat, _ in tiles]
+        longs = [long for _, _, long in tiles]
+        date_filter = {'Date__gte': to_datetime(dates[0])} if open_ended else {'Date__in': list(map(to_datetime, dates))}
+        query = model.objects(Location__Lat__gte=min(lats), Location__Lat__lt=max(lats) + GRID_SIZE,
+                              Location__Long__gte=min(longs), Location__Long__lt=max(longs) + GRID_SIZE,
+                              **date_filter).as_pymongo()
+
+        loaded = {tile: [] for tile in tiles}
+        rows = list(query)
+        for row, tile in zip(rows, affected_cells(rows)):
+            tile = (dates[0],) + tile[1:] if open_ended else tile
+            if tile in loaded:
+                loaded[tile].append(row)
+        return loaded
+
+    def invalidate(self, model, cells):
+        """
+        Drops the cached tiles of the given (date, cell lat, cell long) keys
+        """
+        collection = model._get_collection_name()
+        generation = self._generation(collection)
+        cache.delete_many(*[self._key(collection, generation, *cell) for cell in cells])
+
+    def invalidate_all(self, model):
+        """
+        Drops every cached tile of the model's collection
+        """
+        cache.set(f'tiles/{model._get_collection_name()}/generation', uuid4().hex, timeout=0)
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'bypassed': self.bypassed}
+
+
+def parse_date(date):
+    return datetime.strptime(date, '%Y-%m-%d')
+
+
+def date_range(start, end):
+    """
+    Returns every YYYY-MM-DD date from start to end (inclusive)
+    """
+    start = parse_date(start)
+    return [(start + timedelta(days=day)).strftime('%Y-%m-%d') for day in range((parse_date(end) - start).days + 1)]
+
+
+tile_cache = TileCache()
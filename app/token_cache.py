@@ -0,0 +1,100 @@
+"""
+This file contains an in-process cache of api token -> permission lookups used by the
+token decorators, so a request does not cost a database round trip before any real work
+"""
+from collections import OrderedDict
+from threading import Lock
+from mongoengine import signals
+from .models import User
+import time
+
+
+class TokenCache:
+    """
+    TTL + LRU cache of token -> user permission. Tokens without a user are cached too
+    (as None) for a shorter time, so repeated invalid tokens do not reach the database either.
+    Entries are dropped when a User is saved, inserted or deleted through mongoengine
+    """
+
+    def __init__(self, maxsize=10_000, ttl=300, negative_ttl=30):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict() #token -> (permission, expires at)
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app):
+        self.maxsize = app.config['TOKEN_CACHE_SIZE']
+        self.ttl = app.config['TOKEN_CACHE_TTL']
+        self.negative_ttl = app.config['TOKEN_CACHE_NEGATIVE_TTL']
+        self.clear()
+
+    def get_permission(self, token):
+        """
+        Returns the permission of the user with the given token (None if there is no such user)
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(token)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        permission = self._load(token)
+        ttl = self.ttl if permission is not None else self.negative_ttl
+        with self._lock:
+            self._entries[token] = (permission, now + ttl)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return permission
+
+    def _load(self, token):
+        #a token only counts as valid when exactly one user holds it
+        users = list(User.objects(Token=token).hint([('Token', 1)]) \
+                                .only('Permission').limit(2).as_pymongo())
+        if len(users) != 1:
+            return None
+        return users[0].get('Permission', 0)
+
+    def invalidate(self, token):
+        with self._lock:
+            self._entries.pop(token, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """
+        Returns the cache counters for monitoring
+        """
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+token_cache = TokenCache()
+
+
+def _invalidate_user(sender, document, **kwargs):
+    token_cache.invalidate(document.Token)
+
+
+def _invalidate_users(sender, documents, **kwargs):
+    for document in documents:
+        token_cache.invalidate(document.Token)
+
+
+signals.post_save.connect(_invalidate_user, sender=User)
+signals.post_delete.connect(_invalidate_user, sender=User)
+signals.post_bulk_insert.connect(_invalidate_users, sender=User)
@@ -0,0 +1,122 @@
+"""
+This file contains the buffered api usage recorder. Calls are queued in memory and written
+to the 'requests' collection in bulk by a background thread (by batch size or flush interval)
+instead of one blocking insert per api call
+"""
+from datetime import datetime
+from threading import Event, Lock, Thread
+from .models import Request
+import atexit
+import os
+import queue
+import time
+
+
+class UsageRecorder:
+    """
+    Bounded in-process queue of usage events with a background writer thread.
+    Events are dropped (and counted) when the queue is full rather than slowing requests down
+    """
+
+    def __init__(self, queue_size=10_000, batch_size=500, flush_interval=5.0):
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = None
+        self._pid = None #the writer thread belongs to the process (worker) that started it
+        self._lock = Lock()
+        self.recorded = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def init_app(self, app):
+        self.queue_size = app.config['USAGE_QUEUE_SIZE']
+        self.batch_size = app.config['USAGE_BATCH_SIZE']
+        self.flush_interval = app.config['USAGE_FLUSH_INTERVAL']
+
+    def record(self, token, resource):
+        """
+        Queues one api call for the 'requests' collection
+        """
+        self._ensure_started()
+        event = {
+            'User_Token': token,
+            'Resource': resource,
+            'Time_Used': datetime.utcnow()
+        }
+        try:
+            self._queue.put_nowait(event)
+            self.recorded += 1
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout=10):
+        """
+        Blocks until every event queued so far has been written
+        """
+        if self._pid != os.getpid():
+            return
+        flushed = Event()
+        try:
+            self._queue.put(flushed, timeout=timeout)
+        except queue.Full:
+            return
+        flushed.wait(timeout)
+
+    def stats(self):
+        """
+        Returns the recorder counters for monitoring
+        """
+        return {
+            'queued': self._queue.qsize() if self._pid == os.getpid() else 0,
+            'recorded': self.recorded,
+            'written': self.written,
+            'dropped': self.dropped,
+            'failed': self.failed
+        }
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self.queue_size)
+            Thread(target=self._run, name='usage-recorder', daemon=True).start()
+            self._pid = os.getpid()
+            atexit.register(self.flush)
+
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                item = None
+
+            #flush requests are queued as events, so everything queued before them is in the batch
+            if isinstance(item, Event):
+                self._write(batch)
+                batch = []
+                item.set()
+            elif item is not None:
+                batch.append(item)
+
+            if len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                self._write(batch)
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+
+    def _write(self, batch):
+        if not batch:
+            return
+        try:
+            Request._get_collection().insert_many(batch, ordered=False)
+            self.written += len(batch)
+        except Exception:
+            self.failed += len(batch)
+
+
+usage_recorder = UsageRecorder()
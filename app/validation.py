@@ -0,0 +1,198 @@
+"""
+This file contains a columnar (batch) validator for the ingest schemas.
+Instead of marshmallow loading every row field by field, the rows are validated
+one column at a time: type checks and Range/OneOf validators run once per column
+(ranges with numpy) and only the failing values go back through marshmallow to
+build the same error messages. The validated rows are returned with their values
+converted, ready to be written
+"""
+import numpy as np
+from marshmallow import fields, validate, ValidationError, missing
+from .schema import AQIMeasurementSchema, ForecastSchema
+
+#python types accepted as-is (without conversion) by each field type
+NATIVE_TYPES = {
+    fields.String: (str,),
+    fields.Integer: (int,),
+    fields.Float: (int, float),
+    fields.Date: (), #dates are always sent as strings
+}
+#numpy types numeric strings (e.g. csv cells) are parsed to in bulk
+PARSED_TYPES = {
+    fields.Integer: np.int64,
+    fields.Float: np.float64,
+    fields.Date: 'datetime64[D]', #YYYY-MM-DD only, see _parse
+}
+
+
+class BatchValidator:
+    """
+    Validates lists of rows against a marshmallow schema, returning the same data and
+    error messages as schema.load(rows, many=True). Only String/Integer/Float/Date/Nested fields
+    are supported and @validates_schema hooks are not run
+    """
+    def __init__(self, schema):
+        self.columns = []  #(input path, output path, field) with parents before their children
+        self.allowed = {}  #input keys allowed in each (nested) object
+        self._add_columns(schema, (), ())
+
+    def _add_columns(self, schema, path, out_path):
+        self.allowed[path] = set()
+        for name, field in schema.fields.items():
+            key = field.data_key or name
+            self.allowed[path].add(key)
+            self.columns.append((path + (key,), out_path + (name,), field))
+            if isinstance(field, fields.Nested):
+                self._add_columns(field.schema, path + (key,), out_path + (name,))
+
+    def validate(self, rows):
+        """
+        Returns the validated rows (in order, without the invalid ones) and the
+        error messages of the invalid rows keyed by their index
+        """
+        errors = {}
+        if not isinstance(rows, list):
+            return [], {'_schema': ['Invalid input type.']}
+
+        def add_error(i, path, messages):
+            node = errors.setdefault(i, {})
+            for key in path[:-1]:
+                node = node.setdefault(key, {})
+            if isinstance(messages, dict):
+                node.setdefault(path[-1], {}).update(messages)
+            else:
+                node.setdefault(path[-1], []).extend(messages)
+
+        #objects being validated/built per (nested) path: {row index: (input dict, output dict)}
+        objects = {(): {}}
+        for i, row in enumerate(rows):
+            if isinstance(row, dict):
+                objects[()][i] = (row, {})
+            else:
+                add_error(i, ('_schema',), ['Invalid input type.'])
+        present = {(): self._check_unknown((), objects[()], add_error)}
+
+        for path, out_path, field in self.columns:
+            parents = objects[path[:-1]]
+            #optional columns no row has are skipped without visiting the rows
+            if path[-1] not in present[path[:-1]] and not field.required:
+                continue
+            values = [(i, obj.get(path[-1], missing)) for i, (obj, _) in parents.items()]
+            converted = self._validate_column(path, field, values, add_error)
+
+            if isinstance(field, fields.Nested):
+                objects[path] = {}
+                for i, value in converted:
+                    nested = {}
+                    parents[i][1][out_path[-1]] = nested
+                    objects[path][i] = (value, nested)
+                present[path] = self._check_unknown(path, objects[path], add_error)
+            else:
+                for i, value in converted:
+                    parents[i][1][out_path[-1]] = value
+
+        return [out for i, (_, out) in objects[()].items() if i not in errors], errors
+
+    def _check_unknown(self, path, objects, add_error):
+        """
+        Reports the unknown keys of the objects, returning the set of (allowed) keys found in any of them
+        """
+        allowed, present = self.allowed[path], set()
+        for i, (obj, _) in objects.items():
+            keys = obj.keys()
+            if keys <= present:
+                continue
+            present |= keys & allowed
+            for key in keys - allowed:
+                add_error(i, path + (key,), ['Unknown field.'])
+        return present
+
+    def _validate_column(self, path, field, values, add_error):
+        """
+        Validates one column, returning the (row index, converted value) pairs of the valid values
+        """
+        native, text, other = [], [], []
+        for i, value in values:
+            if value is missing:
+                if field.required:
+                    add_error(i, path, [field.error_messages['required']])
+            elif value is None:
+                if not field.allow_none:
+                    add_error(i, path, [field.error_messages['null']])
+            elif isinstance(field, fields.Nested):
+                (native if isinstance(value, dict) else other).append((i, value))
+            elif type(value) in NATIVE_TYPES[type(field)]:
+                native.append((i, value))
+            elif type(value) is str and type(field) in PARSED_TYPES:
+                text.append((i, value))
+            else:
+                other.append((i, value))
+
+        #numeric/date strings are parsed all at once, falling back to one by one if any of them fails
+        if text:
+            parsed = self._parse(field, [value for _, value in text])
+            if parsed is None:
+                other += text
+            else:
+                native += zip([i for i, _ in text], parsed)
+
+        #values that need converting (or are invalid) are deserialized by the field itself
+        converted = []
+        for i, value in other:
+            try:
+                converted.append((i, field.deserialize(value)))
+            except ValidationError as err:
+                add_error(i, path, err.messages)
+        if isinstance(field, fields.Nested) or not native:
+            return native + converted
+
+        indices, column = zip(*native)
+        failed = np.zeros(len(column), dtype=bool)
+        if isinstance(field, fields.Float):
+            numbers = np.asarray(column, dtype=np.float64)
+            failed |= ~np.isfinite(numbers)
+            column = numbers.tolist()
+        for validator in field.validators:
+            failed |= self._failing(validator, column)
+
+        for k in np.flatnonzero(failed):
+            try:
+                converted.append((indices[k], field.deserialize(column[k])))
+            except ValidationError as err:
+                add_error(indices[k], path, err.messages)
+        return [(indices[k], column[k]) for k in np.flatnonzero(~failed)] + converted
+
+    def _parse(self, field, values):
+        """
+        Returns the strings parsed to the field's type with numpy, or None if any of them does not parse
+        """
+        #numpy also reads partial (YYYY-MM) and other iso dates, which the field's format rejects
+        if type(field) is fields.Date and any(len(value) != 10 or value[4] != '-' or value[7] != '-' 
+                                                for value in values):
+            return None
+        try:
+            return np.asarray(values, dtype=PARSED_TYPES[type(field)]).tolist()
+        except (ValueError, OverflowError):
+            return None
+
+    def _failing(self, validator, column):
+        """
+        Returns a mask of the column values (possibly) failing the validator
+        """
+        if isinstance(validator, validate.Range):
+            numbers = np.asarray(column, dtype=np.float64)
+            failed = np.zeros(len(numbers), dtype=bool)
+            if validator.min is not None:
+                failed |= numbers < validator.min if validator.min_inclusive else numbers <= validator.min
+            if validator.max is not None:
+                failed |= numbers > validator.max if validator.max_inclusive else numbers >= validator.max
+            return failed
+        if isinstance(validator, validate.OneOf):
+            choices = set(validator.choices)
+            return np.fromiter((value not in choices for value in column), dtype=bool, count=len(column))
+        #validators without a batch version are run value by value
+        return np.ones(len(column), dtype=bool)
+
+
+measurement_validator = BatchValidator(AQIMeasurementSchema())
+forecast_validator = BatchValidator(ForecastSchema())
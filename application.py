@@ -1,27 +1,126 @@
-"""
-This is the forecasts file for the application.
-FLASK_APP environment variable should be set to this file
-"""
-from app import create_app
-import click
-import os
-from dotenv import load_dotenv
-
-dotenv_path = os.path.join(os.path.dirname(__file__), '.env')
-load_dotenv(dotenv_path)
-
-#creates the app with the given config
-application = create_app(os.getenv('FLASK_CONFIG'))
-
-
-#command for running unittests
-@application.cli.command()
-@click.argument('test_names', nargs=-1)
-def test(test_names):
-    """Run the unit tests."""
-    import unittest
-    if test_names:
-        tests = unittest.TestLoader().loadTestsFromNames(test_names)
-    else:
-        tests = unittest.TestLoader().discover('tests')
-    unittest.TextTestRunner(verbosity=2).run(tests)
+"""
+This is the forecasts file for the application.
+FLASK_APP environment variable should be set to this file
+"""
+from app import create_app
+import click
+import os
+from dotenv import load_dotenv
+
+dotenv_path = os.path.join(os.path.dirname(__file__), '.env')
+load_dotenv(dotenv_path)
+
+#creates the app with the given config
+application = create_app(os.getenv('FLASK_CONFIG'))
+
+
+#command for running unittests
+@application.cli.command()
+@click.argument('test_names', nargs=-1)
+def test(test_names):
+    """Run the unit tests."""
+    import unittest
+    if test_names:
+        tests = unittest.TestLoader().loadTestsFromNames(test_names)
+    else:
+        tests = unittest.TestLoader().discover('tests')
+    unittest.TextTestRunner(verbosity=2).run(tests)
+
+
+#command for building the indexes declared with the models
+@application.cli.command('create-indexes')
+@click.option('--foreground', is_flag=True, help='Build the indexes in the foreground (locks collections on servers < 4.2).')
+def create_indexes_job(foreground):
+    """Build every index declared with the models."""
+    from app.indexes import create_indexes
+    for collection, names in create_indexes(background=not foreground).items():
+        click.echo(f"{collection}: {', '.join(names) or 'no indexes'}")
+
+
+#command for adding GeoJSON points to existing documents
+@application.cli.command('migrate-geo')
+def migrate_geo():
+    """Add GeoJSON location points to existing documents."""
+    from app.migrations import migrate_geo_locations
+    for collection, updated in migrate_geo_locations().items():
+        click.echo(f'{collection}: {updated} documents updated')
+
+
+
+#command for converting string dates to native dates
+@application.cli.command('migrate-dates')
+def migrate_dates_job():
+    """Convert the measurements' YYYY-MM-DD string dates to native dates."""
+    from app.migrations import migrate_dates
+    for collection, updated in migrate_dates(application.config['BULK_WRITE_CHUNK_SIZE']).items():
+        click.echo(f'{collection}: {updated} documents updated')
+
+
+#command for removing duplicate measurements before the unique index is built
+@application.cli.command('dedupe-measurements')
+def dedupe_measurements():
+    """Remove duplicate historic/current measurements."""
+    from app.migrations import remove_duplicate_measurements
+    from app.conditional import touch
+    from app.models import Historic, Current
+    for collection, deleted in remove_duplicate_measurements(application.config['BULK_WRITE_CHUNK_SIZE']).items():
+        click.echo(f'{collection}: {deleted} documents deleted')
+    touch(Historic, Current)
+
+
+#command for moving the site metadata of the measurements to the station registry
+@application.cli.command('migrate-stations')
+def migrate_stations_job():
+    """Move the measurements' site metadata to the stations collection."""
+    from app.migrations import migrate_stations
+    for collection, count in migrate_stations(application.config['BULK_WRITE_CHUNK_SIZE']).items():
+        click.echo(f'{collection}: {count}')
+
+
+#command for (re)building the historic data rollups
+@application.cli.command('rebuild-rollups')
+def rebuild_rollups_job():
+    """Recompute the historic data rollups from every document."""
+    from app.rollups import rebuild_rollups
+    from app.conditional import touch
+    from app.models import Historic
+    rewritten = rebuild_rollups(application.config['BULK_WRITE_CHUNK_SIZE'])
+    touch(Historic)
+    click.echo(f'{rewritten} rollups rewritten')
+
+
+#command for (re)building the monthly buckets of the historic data
+@application.cli.command('rebuild-buckets')
+def rebuild_buckets_job():
+    """Pack every historic document into monthly buckets."""
+    from app.buckets import rebuild_buckets
+    rewritten = rebuild_buckets(application.config['BULK_WRITE_CHUNK_SIZE'])
+    click.echo(f'{rewritten} buckets rewritten')
+
+
+#command for exporting the ML model for the numpy model runtime
+@application.cli.command('export-model')
+@click.option('--source', default=os.path.join('app', 'forecast_model', 'aqi-model-v1.h5'))
+@click.option('--output', default=os.path.join('app', 'forecast_model', 'aqi-model-v1.npz'))
+def export_model(source, output):
+    """Export the keras model's weights for the numpy model runtime."""
+    from app.model_runtime import export_numpy
+    export_numpy(source, output)
+    click.echo(f'Exported {source} to {output}')
+
+
+#command for running the forecast job for every station
+@application.cli.command('run-forecasts')
+@click.option('--date', help='Last day of history to forecast from (YYYY-MM-DD), defaults to yesterday.')
+def run_forecasts_job(date):
+    """Forecast every station and store the predictions."""
+    from datetime import datetime
+    from app.forecast_pipeline import run_forecasts
+    from app.conditional import touch
+    from app.tiles import tile_cache
+    from app.models import Forecast
+    end_date = datetime.strptime(date, '%Y-%m-%d') if date else None
+    result = run_forecasts(end_date, application.config['FORECAST_MIN_DAYS'], application.config['BULK_WRITE_CHUNK_SIZE'])
+    tile_cache.invalidate_all(Forecast)
+    touch(Forecast)
+    click.echo(', '.join(f'{key}: {value}' for key, value in result.items()))
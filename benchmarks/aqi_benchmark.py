@@ -0,0 +1,33 @@
+"""
+Benchmark of batch aqi category binning against binning one value at a time.
+Run from the repository root: python -m benchmarks.aqi_benchmark [--values 1000000]
+"""
+import argparse
+import timeit
+import numpy as np
+from app.aqi import get_category, get_categories
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--values', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    aqi_array = rng.integers(0, 500, args.values)
+    aqi = aqi_array.tolist()
+    assert get_categories(aqi) == [get_category(value) for value in aqi]
+
+    timings = {
+        'get_category per value': lambda: [get_category(value) for value in aqi],
+        'get_categories (list)': lambda: get_categories(aqi),
+        'get_categories (numpy array)': lambda: get_categories(aqi_array),
+    }
+    for name, run in timings.items():
+        seconds = min(timeit.repeat(run, number=1, repeat=args.repeat))
+        print(f'{name}, {args.values:,} values: {seconds:.3f}s')
+
+
+if __name__ == '__main__':
+    main()
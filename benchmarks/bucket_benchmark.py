@@ -0,0 +1,98 @@
+"""
+Benchmark of the monthly bucket layout (see app/buckets.py) against one historic document per station per day:
+storage size, 30 day series reads (as in /model-data) and a year long box scan (as in /historic-data).
+Run from the repository root: python -m benchmarks.bucket_benchmark [--stations 20 --years 2 --host mongodb://...]
+Without --host the collections live in mongomock (no indexes), so read timings are only indicative
+"""
+import argparse
+import random
+import timeit
+from datetime import datetime, timedelta
+import bson
+from mongoengine import connect, disconnect
+from app import create_app
+from app.aqi import get_categories
+from app.geo import point
+from app.models import Historic, HistoricBucket
+from app.buckets import rebuild_buckets, read_series, read_bbox
+from app.indexes import create_indexes
+
+
+def make_rows(stations, years, seed=0):
+    #daily measurements of stations spread over the USA
+    rng = random.Random(seed)
+    sites = [(round(rng.uniform(25, 49), 4), round(rng.uniform(-124, -67), 4)) for i in range(stations)]
+    start = datetime(2020, 1, 1)
+    rows = []
+    for day in range(365 * years):
+        date = (start + timedelta(days=day)).strftime('%Y-%m-%d')
+        aqi = [rng.randint(0, 200) for site in sites]
+        for i, ((lat, long), value, category) in enumerate(zip(sites, aqi, get_categories(aqi))):
+            rows.append({'Date': date, 'AQI': value, 'Category': category, 'Defining_Parameter': 'PM2.5',
+                         'Number_of_Sites_Reporting': 1,
+                         'Location': {'Lat': lat, 'Long': long, 'Full_AQSID': str(840000000000 + i),
+                                      'Coordinates': point(lat, long)}})
+    return sites, rows
+
+
+def storage(model):
+    #bson size of the documents, plus the server's storage/index sizes when there is a server
+    size = sum(len(bson.encode(document)) for document in model._get_collection().find())
+    try:
+        stats = model._get_db().command('collStats', model._get_collection_name())
+        return f"{size / 1e6:.1f} MB of bson, {stats['storageSize'] / 1e6:.1f} MB stored, {stats['totalIndexSize'] / 1e6:.1f} MB of indexes"
+    except Exception:
+        return f'{size / 1e6:.1f} MB of bson'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--stations', type=int, default=20)
+    parser.add_argument('--years', type=int, default=2)
+    parser.add_argument('--reads', type=int, default=200)
+    parser.add_argument('--host', default='mongomock://localhost')
+    args = parser.parse_args()
+
+    app = create_app('testing')
+    app.app_context().push()
+    disconnect()
+    connect('bucket-benchmark', host=args.host)
+    Historic.drop_collection()
+    HistoricBucket.drop_collection()
+    create_indexes()
+
+    sites, rows = make_rows(args.stations, args.years)
+    Historic._get_collection().insert_many(rows)
+    build = timeit.timeit(rebuild_buckets, number=1)
+    print(f'{len(rows):,} daily documents packed into {HistoricBucket.objects.count():,} buckets in {build:.1f}s')
+    print(f'daily documents: {storage(Historic)}')
+    print(f'monthly buckets: {storage(HistoricBucket)}')
+
+    rng = random.Random(1)
+    windows = []
+    for i in range(args.reads):
+        end = datetime(2020, 2, 1) + timedelta(days=rng.randrange(365 * args.years - 31))
+        windows.append((rng.choice(sites), (end - timedelta(days=29)).strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')))
+
+    def documents():
+        for (lat, long), start, end in windows:
+            list(Historic.objects(Date__gte=start, Date__lte=end, Location__Lat=lat, Location__Long=long).as_pymongo())
+
+    def buckets():
+        for (lat, long), start, end in windows:
+            read_series(lat, long, start, end)
+
+    slow, fast = timeit.timeit(documents, number=1), timeit.timeit(buckets, number=1)
+    print(f'{args.reads} series of 30 days: documents {slow:.3f}s, buckets {fast:.3f}s ({slow / fast:.1f}x)')
+
+    box = ('2021-01-01', '2021-12-31', 30, 45, -100, -80)
+    slow = timeit.timeit(lambda: list(Historic.objects(Date__gte=box[0], Date__lte=box[1],
+                                                       Location__Lat__gte=box[2], Location__Lat__lte=box[3],
+                                                       Location__Long__gte=box[4], Location__Long__lte=box[5]
+                                                       ).as_pymongo()), number=1)
+    fast = timeit.timeit(lambda: list(read_bbox(*box)), number=1)
+    print(f'year long box scan: documents {slow:.3f}s, buckets {fast:.3f}s ({slow / fast:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+Benchmark of the batch (columnar) validator against marshmallow on measurement uploads.
+Run from the repository root: python -m benchmarks.validation_benchmark [--rows 100000]
+"""
+import argparse
+import random
+import timeit
+from marshmallow import ValidationError
+from app.schema import AQIMeasurementSchema
+from app.validation import measurement_validator
+
+
+def make_rows(n, invalid_share=0.01, seed=0):
+    #measurements shaped like an AirNow daily upload, with a few invalid rows
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n):
+        row = {
+            'Date': '2022-06-29',
+            'AQI': rng.randint(0, 300),
+            'Defining_Parameter': rng.choice(['PM10', 'PM2.5', 'OZONE', 'CO', 'SO2', 'NO2']),
+            'Location': {
+                'Lat': rng.uniform(-90, 90),
+                'Long': rng.uniform(-180, 180),
+                'Site_Name': f'SITE {i}',
+                'Full_AQSID': str(840000000000 + i)
+            }
+        }
+        if rng.random() < invalid_share:
+            row['Location']['Lat'] = 120
+        rows.append(row)
+    return rows
+
+
+def marshmallow_load(rows):
+    try:
+        return AQIMeasurementSchema(many=True).load(rows)
+    except ValidationError as err:
+        return err.messages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    text_rows = [dict(row, AQI=str(row['AQI']), 
+                      Location=dict(row['Location'], Lat=str(row['Location']['Lat']), Long=str(row['Location']['Long'])))
+                 for row in rows]
+    for name, data in (('json rows', rows), ('csv (string) rows', text_rows)):
+        slow = min(timeit.repeat(lambda: marshmallow_load(data), number=1, repeat=args.repeat))
+        fast = min(timeit.repeat(lambda: measurement_validator.validate(data), number=1, repeat=args.repeat))
+        print(f'{name}, {args.rows:,} rows: marshmallow {slow:.3f}s, batch validator {fast:.3f}s ({slow / fast:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,24 +1,52 @@
-"""
-This file contains application tests for basic tests
-"""
-import unittest
-from flask import current_app
-from general_test import GeneralTestCase
-
-class BasicsTestCase(GeneralTestCase):
-    """
-    This class tests the initializes a test config application and runs basic tests
-    """
-
-    def test_app_exists(self):
-        """
-        Tests that the application exists/was created successfully
-        """
-        self.assertFalse(current_app is None)
-
-
-    def test_app_is_testing(self):
-        """
-        Tests that the application is in testing configuration
-        """
-        self.assertTrue(current_app.config['TESTING'])
\ No newline at end of file
+"""
+This file contains application tests for basic tests
+"""
+import unittest
+import subprocess
+import sys
+from flask import current_app
+from app.models import Historic, Forecast, User
+from app.indexes import create_indexes
+from general_test import GeneralTestCase
+
+class BasicsTestCase(GeneralTestCase):
+    """
+    This class tests the initializes a test config application and runs basic tests
+    """
+
+    def test_app_exists(self):
+        """
+        Tests that the application exists/was created successfully
+        """
+        self.assertFalse(current_app is None)
+
+
+    def test_app_is_testing(self):
+        """
+        Tests that the application is in testing configuration
+        """
+        self.assertTrue(current_app.config['TESTING'])
+
+
+    def test_app_starts_without_tensorflow(self):
+        """
+        Tests creating the application does not import tensorflow (the model loads on first use)
+        """
+        code = "from app import create_app; import sys; create_app('testing'); print('tensorflow' in sys.modules)"
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True).stdout
+        self.assertEqual(output.strip(), 'False')
+
+
+    def test_create_indexes(self):
+        """
+        Tests the indexes the read paths hint are built by create_indexes (and not on first use)
+        """
+        self.assertIn('Date_1_Location.Lat_1_Location.Long_1', Historic._get_collection().index_information())
+        self.assertIn('Date_1_Location.Lat_1_Location.Long_1__id_1', Forecast._get_collection().index_information())
+        self.assertIn('Token_1', User._get_collection().index_information())
+        self.assertIn('Email_1', User._get_collection().index_information())
+
+        Historic._get_collection().drop_indexes()
+        Historic.objects.count()
+        self.assertNotIn('Date_1_Location.Lat_1_Location.Long_1', Historic._get_collection().index_information())
+        self.assertIn('Date_1_Location.Lat_1_Location.Long_1', create_indexes()['historic-data'])
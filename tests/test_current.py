@@ -1,155 +1,345 @@
-"""
-This file contains application tests for '/current' api resources
-"""
-from app.http_status import HttpStatus
-from app.models import Current, Location
-import json
-from general_test import GeneralTestCase
-
-
-class CurrentTestCase(GeneralTestCase):
-
-    def setUp(self):
-        """
-        Initializes application in testing config
-        """
-        super().setUp()
-        self.uri = '/api/v1/current'
-    
-    #Test POST
-    def test_post(self):
-        """
-        Tests the POST method for the '/current' endpoint
-        """
-        valid_data = {
-            "Date": "2022-06-29",
-            "AQI": 18,
-            "Category": "Good",
-            "Defining_Parameter": "PM2.5",  
-            "Location": {
-                    "Lat": 46.2406,    
-                    "Long": -63.1306,    
-                    "Site_Name": "CHARLOTTETOWN",    
-                    "Full_AQSID": "124000020104"  
-                    }
-        }
-        invalid_data = {'Invalid': -1, 'AQI': 'abc'}
-
-        #test data cannot be posted with no token
-        response = self.client.post(
-                                    self.uri, 
-                                    headers=self.get_api_headers(),
-                                    data=json.dumps([valid_data])
-                                    )
-        
-        self.assertEqual(response.status_code, HttpStatus.method_not_allowed_405.value)
-
-        #test data cannot be posted with invalid token
-        response = self.client.post(
-                                    self.uri+"?token=invalid",
-                                    headers=self.get_api_headers(),
-                                    data=json.dumps([valid_data])
-                                     )
-        
-        self.assertEqual(response.status_code, HttpStatus.method_not_allowed_405.value)
-
-        #test data cannot be posted with token without write access
-        user_without_write, token_without_write = self.get_user(write_access=0)
-        user_without_write.save()
-        response = self.client.post(    
-                                    self.uri+f'?token={token_without_write}',
-                                    headers=self.get_api_headers(),
-                                    data=json.dumps([valid_data])
-                                    )
-        self.assertEqual(response.status_code, HttpStatus.forbidden_403.value)
-
-        #test invalid data cannot be posted with valid token
-        
-        user_with_write, token_with_write = self.get_user(write_access=1)
-        user_with_write.save()
-        response = self.client.post(
-                                    self.uri+f'?token={token_with_write}', 
-                                    headers=self.get_api_headers(),
-                                    data=json.dumps([invalid_data])
-                                    )
-        self.assertEqual(response.status_code, HttpStatus.bad_request_400.value)
-        #test data can be posted and exists in db with a valid token
-        response = self.client.post(
-                                    self.uri+f'?token={token_with_write}', 
-                                    headers=self.get_api_headers(),
-                                    data=json.dumps([valid_data])
-                                    )
-        self.assertEqual(response.status_code, HttpStatus.ok_200.value)
-
-        current_data_exists = Current.objects().first() is not None
-        self.assertTrue(current_data_exists)
-       
-
-    #Test GET
-    def test_get(self):
-        """
-        Tests the GET method for the '/current' endpoint
-        """
-        #test data cannot be queried without token
-        response = self.client.get(self.uri)
-        self.assertEquals(response.status_code, HttpStatus.method_not_allowed_405.value)
-
-        #test data cannot be queried with invalid token
-        response = self.client.get(self.uri + "?token=invalid")
-        self.assertEquals(response.status_code, HttpStatus.method_not_allowed_405.value)
-
-        #test data can be queried with valid token
-        user_without_write, token_without_write = self.get_user(write_access=0)
-        user_without_write.save()
-        response = self.client.get(self.uri + f"?token={token_without_write}")
-        self.assertEqual(response.status_code, HttpStatus.ok_200.value)
-
-
-    #Test DELETE
-    def test_delete(self):
-        """
-        Tests the DELETE method for the '/current' endpoint
-        """
-        #test data cannot be deleted with no token
-        response = self.client.delete(self.uri)
-        self.assertEquals(response.status_code, HttpStatus.method_not_allowed_405.value)
-
-        #test data cannot be deleted with invalid token
-        response = self.client.delete(self.uri + "?token=invalid")
-        self.assertEquals(response.status_code, HttpStatus.method_not_allowed_405.value)
-
-        #test data cannot be deleted with token without write access
-        user_without_write, token_without_write = self.get_user(write_access=0)
-        user_without_write.save()
-        response = self.client.delete(self.uri + f"?token={token_without_write}")
-        self.assertEquals(response.status_code, HttpStatus.forbidden_403.value)
-
-        #test data can be deleted with a valid token
-        user_with_write, token_with_write = self.get_user(write_access=1)
-        user_with_write.save()
-
-        location = Location(Lat=12, Long=30)
-        data = Current(
-            Date="2030-01-01",
-            AQI=100,
-            Category="Moderate",
-            Location=location
-        )
-        Current.objects.insert(data) #inserts test data
-
-        current_data_exists = Current.objects().first() is not None #checks if data is in db
-        self.assertTrue(current_data_exists)
-
-        response = self.client.delete(self.uri+f"?token={token_with_write}")
-        self.assertEquals(response.status_code, HttpStatus.ok_200.value)
-
-        
-        current_data_not_exists = Current.objects().first() is None #checks if data is deleted
-        self.assertTrue(current_data_not_exists)
-
-
-
-        
-
-
-
+"""
+This file contains application tests for '/current' api resources
+"""
+from app.http_status import HttpStatus
+from app.models import Current, Location, Station, DataVersion
+from app.conditional import data_version, data_versions, touch
+from app import create_app
+from mongoengine import connect, disconnect
+import json
+from general_test import GeneralTestCase
+
+
+class CurrentTestCase(GeneralTestCase):
+
+    def setUp(self):
+        """
+        Initializes application in testing config
+        """
+        super().setUp()
+        self.uri = '/api/v1/current'
+    
+    #Test POST
+    def test_post(self):
+        """
+        Tests the POST method for the '/current' endpoint
+        """
+        valid_data = {
+            "Date": "2022-06-29",
+            "AQI": 18,
+            "Category": "Good",
+            "Defining_Parameter": "PM2.5",  
+            "Location": {
+                    "Lat": 46.2406,    
+                    "Long": -63.1306,    
+                    "Site_Name": "CHARLOTTETOWN",    
+                    "Full_AQSID": "124000020104"  
+                    }
+        }
+        invalid_data = {'Invalid': -1, 'AQI': 'abc'}
+
+        #test data cannot be posted with no token
+        response = self.client.post(
+                                    self.uri, 
+                                    headers=self.get_api_headers(),
+                                    data=json.dumps([valid_data])
+                                    )
+        
+        self.assertEqual(response.status_code, HttpStatus.method_not_allowed_405.value)
+
+        #test data cannot be posted with invalid token
+        response = self.client.post(
+                                    self.uri+"?token=invalid",
+                                    headers=self.get_api_headers(),
+                                    data=json.dumps([valid_data])
+                                     )
+        
+        self.assertEqual(response.status_code, HttpStatus.method_not_allowed_405.value)
+
+        #test data cannot be posted with token without write access
+        user_without_write, token_without_write = self.get_user(write_access=0)
+        user_without_write.save()
+        response = self.client.post(    
+                                    self.uri+f'?token={token_without_write}',
+                                    headers=self.get_api_headers(),
+                                    data=json.dumps([valid_data])
+                                    )
+        self.assertEqual(response.status_code, HttpStatus.forbidden_403.value)
+
+        #test invalid data cannot be posted with valid token
+        
+        user_with_write, token_with_write = self.get_user(write_access=1)
+        user_with_write.save()
+        response = self.client.post(
+                                    self.uri+f'?token={token_with_write}', 
+                                    headers=self.get_api_headers(),
+                                    data=json.dumps([invalid_data])
+                                    )
+        self.assertEqual(response.status_code, HttpStatus.bad_request_400.value)
+        #test data can be posted and exists in db with a valid token
+        response = self.client.post(
+                                    self.uri+f'?token={token_with_write}', 
+                                    headers=self.get_api_headers(),
+                                    data=json.dumps([valid_data])
+                                    )
+        self.assertEqual(response.status_code, HttpStatus.ok_200.value)
+
+        current_data_exists = Current.objects().first() is not None
+        self.assertTrue(current_data_exists)
+       
+
+    #Test GET
+    def test_get(self):
+        """
+        Tests the GET method for the '/current' endpoint
+        """
+        #test data cannot be queried without token
+        response = self.client.get(self.uri)
+        self.assertEquals(response.status_code, HttpStatus.method_not_allowed_405.value)
+
+        #test data cannot be queried with invalid token
+        response = self.client.get(self.uri + "?token=invalid")
+        self.assertEquals(response.status_code, HttpStatus.method_not_allowed_405.value)
+
+        #test data can be queried with valid token
+        user_without_write, token_without_write = self.get_user(write_access=0)
+        user_without_write.save()
+        response = self.client.get(self.uri + f"?token={token_without_write}")
+        self.assertEqual(response.status_code, HttpStatus.ok_200.value)
+
+
+    def test_get_fields(self):
+        """
+        Tests the GET method for the '/current' endpoint only returns the requested fields
+        """
+        user_without_write, token_without_write = self.get_user(write_access=0)
+        user_without_write.save()
+        Current.objects.insert(Current(
+            Date="2030-01-01",
+            AQI=100,
+            Category="Moderate",
+            Location=Location(Lat=12, Long=30)
+        ))
+
+        #test only the requested (and _id) fields are returned
+        response = self.client.get(self.uri + f"?token={token_without_write}&fields=AQI,Location.Lat")
+        self.assertEqual(response.status_code, HttpStatus.ok_200.value)
+        row = response.get_json()[0]
+        self.assertEqual(set(row), {'_id', 'AQI', 'Location'})
+        self.assertEqual(row['Location'], {'Lat': 12})
+        self.assertIn('$oid', row['_id'])
+
+        #test unknown fields are rejected
+        response = self.client.get(self.uri + f"?token={token_without_write}&fields=Password")
+        self.assertEqual(response.status_code, HttpStatus.bad_request_400.value)
+
+
+    def test_versions(self):
+        """
+        Tests staged '/current' versions are only served once activated
+        """
+        user_with_write, token_with_write = self.get_user(write_access=1)
+        user_with_write.save()
+        Current.objects.insert(Current(Date="2030-01-01", AQI=100, Category="Moderate", 
+                                        Location=Location(Lat=12, Long=30)))
+        measurement = {
+            "Date": "2030-01-02",
+            "AQI": 20,
+            "Defining_Parameter": "PM2.5",
+            "Location": {"Lat": 12, "Long": 30, "Site_Name": "SITE", "Full_AQSID": "1"}
+        }
+
+        #test the unversioned documents are served before any version is activated
+        response = self.client.get(self.uri + f"?token={token_with_write}")
+        self.assertEqual([row['AQI'] for row in response.get_json()], [100])
+
+        #test staged data is not served (nor does it invalidate the cached response)
+        for version in ("v1", "v2"):
+            response = self.client.post(
+                                        self.uri + f"?token={token_with_write}&version={version}",
+                                        headers=self.get_api_headers(),
+                                        data=json.dumps([measurement])
+                                        )
+            self.assertEqual(response.get_json()['inserted'], 1)
+        response = self.client.get(self.uri + f"?token={token_with_write}")
+        self.assertEqual([row['AQI'] for row in response.get_json()], [100])
+
+        #test empty versions cannot be activated
+        response = self.client.post(self.uri + f"/versions?token={token_with_write}", 
+                                    headers=self.get_api_headers(), data=json.dumps({"Version": "v3"}))
+        self.assertEqual(response.status_code, HttpStatus.bad_request_400.value)
+
+        #test activating a version serves it and keeps the previous version
+        response = self.client.post(self.uri + f"/versions?token={token_with_write}", 
+                                    headers=self.get_api_headers(), data=json.dumps({"Version": "v1"}))
+        self.assertEqual(response.status_code, HttpStatus.ok_200.value)
+        self.assertEqual(response.get_json()['deleted'], 0)
+        response = self.client.get(self.uri + f"?token={token_with_write}")
+        self.assertEqual([row['AQI'] for row in response.get_json()], [20])
+
+        #test the version before the previous one is deleted on the next swap
+        response = self.client.post(self.uri + f"/versions?token={token_with_write}", 
+                                    headers=self.get_api_headers(), data=json.dumps({"Version": "v2"}))
+        self.assertEqual(response.get_json()['deleted'], 1)
+        response = self.client.get(self.uri + f"/versions?token={token_with_write}")
+        self.assertEqual(response.get_json()['active'], "v2")
+        self.assertEqual({row['Version'] for row in response.get_json()['versions']}, {"v1", "v2"})
+
+
+    def test_conditional_get(self):
+        """
+        Tests '/current' GET responses carry an ETag that is answered with a 304 until the data changes
+        """
+        user_with_write, token_with_write = self.get_user(write_access=1)
+        user_with_write.save()
+        response = self.client.get(self.uri + f"?token={token_with_write}")
+        self.assertEqual(response.status_code, HttpStatus.ok_200.value)
+        etag = response.headers['ETag']
+        self.assertIsNotNone(response.last_modified)
+
+        #test unchanged data is not sent again
+        response = self.client.get(self.uri + f"?token={token_with_write}", headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, HttpStatus.not_modified_304.value)
+        self.assertEqual(response.data, b'')
+        self.assertEqual(response.headers['ETag'], etag)
+
+        #test other representations do not match the ETag
+        response = self.client.get(self.uri + f"?token={token_with_write}&format=ndjson", headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, HttpStatus.ok_200.value)
+
+        #test posting data changes the ETag
+        data = {"Date": "2022-06-29", "AQI": 18, "Defining_Parameter": "PM2.5",
+                "Location": {"Lat": 46.2406, "Long": -63.1306, "Site_Name": "CHARLOTTETOWN", "Full_AQSID": "124000020104"}}
+        self.client.post(self.uri + f"?token={token_with_write}", headers=self.get_api_headers(), data=json.dumps([data]))
+        response = self.client.get(self.uri + f"?token={token_with_write}", headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, HttpStatus.ok_200.value)
+        self.assertEqual(len(response.get_json()), 1)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_workers(self):
+        """
+        Tests writes made through one worker change the cached '/current' responses of the others
+        """
+        disconnect()
+        other_worker = create_app('testing').test_client() #with its own (per worker) cache
+        disconnect()
+        connect('mongoenginetest', host='mongomock://localhost')
+        user_with_write, token_with_write = self.get_user(write_access=1)
+        user_with_write.save()
+        response = self.client.get(self.uri + f'?token={token_with_write}')
+        self.assertEqual(response.get_json(), [])
+
+        new_row = {"Date": "2020-01-01", "AQI": 20, "Defining_Parameter": "PM10",
+                   "Location": {"Lat": 0.5, "Long": 0.5, "Site_Name": "SITE", "Full_AQSID": "1"}}
+        other_worker.post(self.uri + f'?token={token_with_write}', 
+                          headers=self.get_api_headers(), data=json.dumps([new_row]))
+        response = self.client.get(self.uri + f'?token={token_with_write}')
+        self.assertEqual([row['AQI'] for row in response.get_json()], [20])
+
+        #test the cached responses are keyed on the query
+        response = self.client.get(self.uri + f'?token={token_with_write}&stations=false')
+        self.assertNotIn('Site_Name', response.get_json()[0]['Location'])
+        response = self.client.get(self.uri + f'?token={token_with_write}')
+        self.assertEqual(response.get_json()[0]['Location']['Site_Name'], "SITE")
+
+    def test_data_versions(self):
+        """
+        Tests the data versions are read once per request, except for the ones the request writes
+        """
+        with self.app.test_request_context():
+            versions = data_versions('current', 'stations')
+            #another worker's write is seen by the next request
+            DataVersion.objects(id='current').update(Token='other')
+            self.assertEqual(data_version('current'), versions['current'])
+            touch(Station)
+            self.assertNotEqual(data_version('stations'), versions['stations'])
+        with self.app.test_request_context():
+            self.assertEqual(data_version('current')['token'], 'other')
+
+    def test_nearest(self):
+        """
+        Tests '/current/nearest' returns the k stations nearest to a point with their distances
+        """
+        user_with_write, token_with_write = self.get_user(write_access=1)
+        user_with_write.save()
+        sites = [("PHILADELPHIA", 39.9526, -75.1652), ("CAMDEN", 39.9259, -75.1196),
+                 ("PITTSBURGH", 40.4406, -79.9959), ("BOSTON", 42.3601, -71.0589)]
+        data = [{"Date": "2022-06-29", "AQI": 18 + i, "Defining_Parameter": "PM2.5",
+                 "Location": {"Lat": lat, "Long": long, "Site_Name": name, "Full_AQSID": str(840000000000 + i)}}
+                for i, (name, lat, long) in enumerate(sites)]
+        self.client.post(self.uri + f"?token={token_with_write}", headers=self.get_api_headers(), data=json.dumps(data))
+
+        #test the k nearest stations are returned, sorted by distance, with the joined site metadata
+        response = self.client.get(self.uri + f"/nearest?token={token_with_write}&lat=39.95&long=-75.16&k=2")
+        self.assertEqual(response.status_code, HttpStatus.ok_200.value)
+        rows = response.get_json()
+        self.assertEqual([row['Location']['Site_Name'] for row in rows], ["PHILADELPHIA", "CAMDEN"])
+        self.assertEqual(rows[0]['Date'], "2022-06-29")
+        self.assertLess(rows[0]['Distance_km'], 1)
+        self.assertAlmostEqual(rows[1]['Distance_km'], 4.36, delta=0.05)
+
+        #test stations further than max_km are left out
+        response = self.client.get(self.uri + f"/nearest?token={token_with_write}&lat=39.95&long=-75.16&k=10&max_km=425")
+        self.assertEqual([row['Location']['Site_Name'] for row in response.get_json()], 
+                         ["PHILADELPHIA", "CAMDEN", "PITTSBURGH"])
+
+        #test the index is rebuilt when the data changes
+        self.client.post(self.uri + f"?token={token_with_write}", headers=self.get_api_headers(), data=json.dumps([
+                         {"Date": "2022-06-29", "AQI": 30, "Defining_Parameter": "PM2.5", "Location": {"Lat": 39.95, "Long": -75.16}}]))
+        response = self.client.get(self.uri + f"/nearest?token={token_with_write}&lat=39.95&long=-75.16&k=1")
+        self.assertEqual(response.get_json()[0]['AQI'], 30)
+        self.assertEqual(response.get_json()[0]['Distance_km'], 0)
+
+        #test invalid points are rejected
+        response = self.client.get(self.uri + f"/nearest?token={token_with_write}&lat=95&long=-75.16")
+        self.assertEqual(response.status_code, HttpStatus.bad_request_400.value)
+
+
+    #Test DELETE
+    def test_delete(self):
+        """
+        Tests the DELETE method for the '/current' endpoint
+        """
+        #test data cannot be deleted with no token
+        response = self.client.delete(self.uri)
+        self.assertEquals(response.status_code, HttpStatus.method_not_allowed_405.value)
+
+        #test data cannot be deleted with invalid token
+        response = self.client.delete(self.uri + "?token=invalid")
+        self.assertEquals(response.status_code, HttpStatus.method_not_allowed_405.value)
+
+        #test data cannot be deleted with token without write access
+        user_without_write, token_without_write = self.get_user(write_access=0)
+        user_without_write.save()
+        response = self.client.delete(self.uri + f"?token={token_without_write}")
+        self.assertEquals(response.status_code, HttpStatus.forbidden_403.value)
+
+        #test data can be deleted with a valid token
+        user_with_write, token_with_write = self.get_user(write_access=1)
+        user_with_write.save()
+
+        location = Location(Lat=12, Long=30)
+        data = Current(
+            Date="2030-01-01",
+            AQI=100,
+            Category="Moderate",
+            Location=location
+        )
+        Current.objects.insert(data) #inserts test data
+
+        current_data_exists = Current.objects().first() is not None #checks if data is in db
+        self.assertTrue(current_data_exists)
+
+        response = self.client.delete(self.uri+f"?token={token_with_write}")
+        self.assertEquals(response.status_code, HttpStatus.ok_200.value)
+
+        
+        current_data_not_exists = Current.objects().first() is None #checks if data is deleted
+        self.assertTrue(current_data_not_exists)
+
+
+
+        
+
+
+
@@ -1,256 +1,350 @@
-"""
-This file contains application tests for '/forecasts' api resources
-"""
-from app.http_status import HttpStatus
-from app.models import Forecast, Location, Prediction
-import json
-from datetime import datetime, timedelta
-from general_test import GeneralTestCase
-
-class ForecastTestCase(GeneralTestCase):
-
-    def setUp(self):
-        """
-        Initializes application in testing config
-        """
-        super().setUp()
-        self.uri = '/api/v1/forecasts'
-    
-
-    def test_get(self):
-        """
-        Tests the GET method for the '/forecasts' endpoint
-        """
-        #test resource cannot be accessed without token
-        response = self.client.get(self.uri)
-        self.assertEquals(response.status_code, HttpStatus.method_not_allowed_405.value)
-
-        #test resource cannot be access with invalid token
-        response = self.client.get(self.uri + "?token=invalid")
-        self.assertEquals(response.status_code, HttpStatus.method_not_allowed_405.value)
-
-        #insert default data (returns when no parameters given)
-        location = Location(Lat=39, Long=-75)
-        prediction = Prediction(Days_in_Advance=1, Pred_AQI=5)
-        default_data = Forecast(
-                                Date=(datetime.utcnow() + timedelta(days=1)).strftime('%Y-%m-%d'), 
-                                Predictions=[prediction],
-                                Location=location
-                                )
-        Forecast.objects().insert(default_data)
-
-        #test resource can be accessed with valid token and no additional parameters
-        user, token = self.get_user(write_access=0)
-        user.save()
-        response = self.client.get(self.uri + f'?token={token}')
-        self.assertEquals(response.status_code, HttpStatus.ok_200.value)
-
-        #test that default data is returned
-        default_data_was_returned = response.get_json()[0]['Predictions'][0]['Pred_AQI'] == 5
-        self.assertTrue(default_data_was_returned)
-
-        #insert customdata (will not return when no parameters given -- needs parameters)
-        location = Location(Lat=0, Long=0)
-        prediction = Prediction(Days_in_Advance=1, Pred_AQI=100)
-        custom_data = Forecast(
-                                Date=(datetime.utcnow() + timedelta(days=1)).strftime('%Y-%m-%d'), 
-                                Predictions=[prediction],
-                                Location=location
-                                )
-        Forecast.objects().insert(custom_data)
-
-        #test resource can be accessed with valid token and additional parameters
-        bLat, tLat = -1, 1
-        lLong, rLong = -1, 1
-
-        response = self.client.get(self.uri + \
-            f'?token={token}&bLat={bLat}&tLat={tLat}&lLong={lLong}&rLong={rLong}')
-        self.assertEquals(response.status_code, HttpStatus.ok_200.value)
-
-        #test that default data is returned
-        custom_data_was_returned = response.get_json()[0]['Predictions'][0]['Pred_AQI'] == 100
-        self.assertTrue(custom_data_was_returned)
-
-    def test_post(self):
-        """
-        Tests the POST method for the '/forecasts' endpoint
-        """
-        valid_data = {
-                "Date": "2030-01-01",
-                "Predictions": {"Days_in_Advance": 7, "Pred_AQI": 55},
-                "Location": {"Lat": 12, "Long": 40}
-        }
-        invalid_data = {
-                "Date": 10,
-                "Invalid": -1
-        }
-
-        #test resource cannot be accessed without token
-        response = self.client.post(
-                                    self.uri,
-                                    headers=self.get_api_headers(),
-                                    data=json.dumps([valid_data])
-                                )
-        self.assertEquals(response.status_code, HttpStatus.method_not_allowed_405.value)
-
-        #test resource cannot be access with invalid token
-        response = self.client.post(
-                                    self.uri + "?token=invalid",
-                                    headers=self.get_api_headers(),
-                                    data=json.dumps([valid_data])
-                                )
-        self.assertEquals(response.status_code, HttpStatus.method_not_allowed_405.value)
-
-        #test resource cannot be accessed with valid read-only token
-        user_without_write, token_without_write = self.get_user(write_access=0)
-        user_without_write.save()
-        response = self.client.post(
-                                    self.uri + f"?token={token_without_write}",
-                                    headers=self.get_api_headers(),
-                                    data=json.dumps([valid_data])
-                                )
-        self.assertEquals(response.status_code, HttpStatus.forbidden_403.value)
-
-        #test resource can be accessed with valid write access token,
-        #but will send bad status if data is invalid format
-        user_with_write, token_with_write = self.get_user(write_access=1)
-        user_with_write.save()
-        response = self.client.post(
-                                    self.uri + f"?token={token_with_write}",
-                                    headers=self.get_api_headers(),
-                                    data=json.dumps([invalid_data])
-                                )
-        self.assertEquals(response.status_code, HttpStatus.bad_request_400.value)
-
-        #test resource can be accessed with valid write access token,
-        #and will send a good status if data is valid format,
-        #and data is stored in the db
-        response = self.client.post(
-                            self.uri + f"?token={token_with_write}",
-                            headers=self.get_api_headers(),
-                            data=json.dumps([valid_data])
-                        )
-        self.assertEquals(response.status_code, HttpStatus.ok_200.value)
-
-        forecast_data_exists = Forecast.objects().first() is not None
-        self.assertTrue(forecast_data_exists)
-
-    def test_patch(self):
-        """
-        Tests the PATCH method for the '/forecasts' endpoint
-        """
-        valid_data_predictions = {
-            'Predictions': [{
-                "Date": "2030-01-01",
-                "Predictions": {"Days_in_Advance": 1, "Pred_AQI": 55},
-                "Location": {"Lat": 12, "Long": 40}
-        }]
-        }
-        invalid_data_predictions = {
-            'Predictions': [{'Invalid': -1, "Date": "2030-01-01"}]
-        }
-        valid_data_actual = {
-            'Actual': [{
-            "Date": "2030-01-01",
-            "AQI": 18,
-            "Category": "Good",
-            "Defining_Parameter": "PM2.5",  
-            "Location": {
-                    "Lat": 12,    
-                    "Long": 40
-                    }
-        }]
-        }
-        invalid_data_actual = {
-            'Actual': [{'Invalid': -1, "Date": "2030-01-01"}]
-        }
-        #test resource cannot be accessed without token
-        response = self.client.patch(
-                            self.uri,
-                            headers=self.get_api_headers(),
-                            data=json.dumps(valid_data_predictions)
-                        )
-        self.assertEquals(response.status_code, HttpStatus.method_not_allowed_405.value)
-
-        #test resource cannot be access with invalid token
-        response = self.client.patch(
-                    self.uri + '?token=invalid',
-                    headers=self.get_api_headers(),
-                    data=json.dumps(valid_data_predictions)
-                )
-        self.assertEquals(response.status_code, HttpStatus.method_not_allowed_405.value)
-
-        #test resource cannot be accessed with valid read-only token
-        user_without_write, token_without_write = self.get_user(write_access=0)
-        user_without_write.save()
-
-        response = self.client.patch(
-                    self.uri + f"?token={token_without_write}",
-                    headers=self.get_api_headers(),
-                    data=json.dumps(valid_data_predictions)
-                )
-        self.assertEquals(response.status_code, HttpStatus.forbidden_403.value)
-
-        #Create some data to patch~
-        prediction = Prediction(Days_in_Advance=7, Pred_AQI=55)
-        location = Location(Lat=12, Long=40)
-        forecast = Forecast(Date="2030-01-01", Predictions=[prediction], Location=location)
-        Forecast.objects.insert(forecast)
-
-        forecast_exists = Forecast.objects().first() is not None
-        self.assertTrue(forecast_exists)
-
-        predictions_length_is_1 = len(Forecast.objects().first().Predictions) == 1
-        self.assertTrue(predictions_length_is_1)
-
-        #test resource can be accessed with valid write access token,
-        #but will send bad status if data is invalid format (Prediction Path)
-        user_with_write, token_with_write = self.get_user(write_access=1)
-        user_with_write.save()
-
-        response = self.client.patch(
-                            self.uri + f"?token={token_with_write}",
-                            headers=self.get_api_headers(),
-                            data=json.dumps(invalid_data_predictions)
-                        )
-        self.assertEquals(response.status_code, HttpStatus.bad_request_400.value)
-
-
-        #test resource can be accessed with valid write access token,
-        #and will send a good status if data is valid format,
-        #and data is stored in the db (Prediction Path)
-        response = self.client.patch(
-                    self.uri + f"?token={token_with_write}",
-                    headers=self.get_api_headers(),
-                    data=json.dumps(valid_data_predictions)
-                )
-        self.assertEquals(response.status_code, HttpStatus.ok_200.value)
-
-        #check if existing data was updated with another prediciton
-        predictions_length_is_2 = len(Forecast.objects().first().Predictions) == 2
-        self.assertTrue(predictions_length_is_2)
-
-        
-        #test resource can be accessed with valid write access token,
-        #but will send bad status if data is invalid format (Actual Path)
-        response = self.client.patch(
-                            self.uri + f"?token={token_with_write}",
-                            headers=self.get_api_headers(),
-                            data=json.dumps(invalid_data_actual)
-                        )
-        self.assertEquals(response.status_code, HttpStatus.bad_request_400.value)
-
-        #test resource can be accessed with valid write access token,
-        #and will send a good status if data is valid format,
-        #and data is stored in the db (Actual Path)
-        response = self.client.patch(
-                            self.uri + f"?token={token_with_write}",
-                            headers=self.get_api_headers(),
-                            data=json.dumps(valid_data_actual)
-                        )
-        self.assertEquals(response.status_code, HttpStatus.ok_200.value)
-
-        #check if existing data was updated with actual AQI values
-    
-        actual_aqi_exists = Forecast.objects().first().Real_AQI > -1
-        self.assertTrue(actual_aqi_exists)
\ No newline at end of file
+"""
+This file contains application tests for '/forecasts' api resources
+"""
+from app.http_status import HttpStatus
+from app.models import Forecast, Location, Prediction, Historic, Station
+from app.stations import station_index
+from app.forecast_pipeline import fill_gaps
+import numpy as np
+import json
+from datetime import datetime, timedelta
+from general_test import GeneralTestCase
+
+class ForecastTestCase(GeneralTestCase):
+
+    def setUp(self):
+        """
+        Initializes application in testing config
+        """
+        super().setUp()
+        self.uri = '/api/v1/forecasts'
+    
+
+    def test_get(self):
+        """
+        Tests the GET method for the '/forecasts' endpoint
+        """
+        #test resource cannot be accessed without token
+        response = self.client.get(self.uri)
+        self.assertEquals(response.status_code, HttpStatus.method_not_allowed_405.value)
+
+        #test resource cannot be access with invalid token
+        response = self.client.get(self.uri + "?token=invalid")
+        self.assertEquals(response.status_code, HttpStatus.method_not_allowed_405.value)
+
+        #insert default data (returns when no parameters given)
+        location = Location(Lat=39, Long=-75)
+        prediction = Prediction(Days_in_Advance=1, Pred_AQI=5)
+        default_data = Forecast(
+                                Date=(datetime.utcnow() + timedelta(days=1)).strftime('%Y-%m-%d'), 
+                                Predictions=[prediction],
+                                Location=location
+                                )
+        Forecast.objects().insert(default_data)
+
+        #test resource can be accessed with valid token and no additional parameters
+        user, token = self.get_user(write_access=0)
+        user.save()
+        response = self.client.get(self.uri + f'?token={token}')
+        self.assertEquals(response.status_code, HttpStatus.ok_200.value)
+
+        #test that default data is returned
+        default_data_was_returned = response.get_json()[0]['Predictions'][0]['Pred_AQI'] == 5
+        self.assertTrue(default_data_was_returned)
+
+        #insert customdata (will not return when no parameters given -- needs parameters)
+        location = Location(Lat=0, Long=0)
+        prediction = Prediction(Days_in_Advance=1, Pred_AQI=100)
+        custom_data = Forecast(
+                                Date=(datetime.utcnow() + timedelta(days=1)).strftime('%Y-%m-%d'), 
+                                Predictions=[prediction],
+                                Location=location
+                                )
+        Forecast.objects().insert(custom_data)
+
+        #test resource can be accessed with valid token and additional parameters
+        bLat, tLat = -1, 1
+        lLong, rLong = -1, 1
+
+        response = self.client.get(self.uri + \
+            f'?token={token}&bLat={bLat}&tLat={tLat}&lLong={lLong}&rLong={rLong}')
+        self.assertEquals(response.status_code, HttpStatus.ok_200.value)
+
+        #test that default data is returned
+        custom_data_was_returned = response.get_json()[0]['Predictions'][0]['Pred_AQI'] == 100
+        self.assertTrue(custom_data_was_returned)
+
+    def test_nearest(self):
+        """
+        Tests '/forecasts/nearest' returns the forecasts (from today on) of the k stations nearest to a point
+        """
+        user, token = self.get_user(write_access=0)
+        user.save()
+        dates = [(datetime.utcnow() + timedelta(days=days)).strftime('%Y-%m-%d') for days in (-1, 1, 2)]
+        Forecast.objects().insert([Forecast(Date=date, Predictions=[Prediction(Days_in_Advance=1, Pred_AQI=aqi)],
+                                            Location=Location(Lat=lat, Long=long))
+                                   for lat, long, aqi in ((39, -75, 5), (40, -75, 50), (45, -90, 100)) for date in dates])
+
+        #test the forecasts of the nearest stations are returned by distance then date, without past days
+        response = self.client.get(self.uri + f'/nearest?token={token}&lat=39.1&long=-75&k=2')
+        self.assertEquals(response.status_code, HttpStatus.ok_200.value)
+        rows = response.get_json()
+        self.assertEqual([(row['Predictions'][0]['Pred_AQI'], row['Date']) for row in rows],
+                         [(5, dates[1]), (5, dates[2]), (50, dates[1]), (50, dates[2])])
+        self.assertAlmostEqual(rows[0]['Distance_km'], 11.1, delta=0.1)
+
+        #test a point without stations within max_km returns nothing
+        response = self.client.get(self.uri + f'/nearest?token={token}&lat=0&long=0&max_km=100')
+        self.assertEqual(response.get_json(), [])
+
+    def test_post(self):
+        """
+        Tests the POST method for the '/forecasts' endpoint
+        """
+        valid_data = {
+                "Date": "2030-01-01",
+                "Predictions": {"Days_in_Advance": 7, "Pred_AQI": 55},
+                "Location": {"Lat": 12, "Long": 40}
+        }
+        invalid_data = {
+                "Date": 10,
+                "Invalid": -1
+        }
+
+        #test resource cannot be accessed without token
+        response = self.client.post(
+                                    self.uri,
+                                    headers=self.get_api_headers(),
+                                    data=json.dumps([valid_data])
+                                )
+        self.assertEquals(response.status_code, HttpStatus.method_not_allowed_405.value)
+
+        #test resource cannot be access with invalid token
+        response = self.client.post(
+                                    self.uri + "?token=invalid",
+                                    headers=self.get_api_headers(),
+                                    data=json.dumps([valid_data])
+                                )
+        self.assertEquals(response.status_code, HttpStatus.method_not_allowed_405.value)
+
+        #test resource cannot be accessed with valid read-only token
+        user_without_write, token_without_write = self.get_user(write_access=0)
+        user_without_write.save()
+        response = self.client.post(
+                                    self.uri + f"?token={token_without_write}",
+                                    headers=self.get_api_headers(),
+                                    data=json.dumps([valid_data])
+                                )
+        self.assertEquals(response.status_code, HttpStatus.forbidden_403.value)
+
+        #test resource can be accessed with valid write access token,
+        #but will send bad status if data is invalid format
+        user_with_write, token_with_write = self.get_user(write_access=1)
+        user_with_write.save()
+        response = self.client.post(
+                                    self.uri + f"?token={token_with_write}",
+                                    headers=self.get_api_headers(),
+                                    data=json.dumps([invalid_data])
+                                )
+        self.assertEquals(response.status_code, HttpStatus.bad_request_400.value)
+
+        #test resource can be accessed with valid write access token,
+        #and will send a good status if data is valid format,
+        #and data is stored in the db
+        response = self.client.post(
+                            self.uri + f"?token={token_with_write}",
+                            headers=self.get_api_headers(),
+                            data=json.dumps([valid_data])
+                        )
+        self.assertEquals(response.status_code, HttpStatus.ok_200.value)
+
+        forecast_data_exists = Forecast.objects().first() is not None
+        self.assertTrue(forecast_data_exists)
+
+    def test_patch(self):
+        """
+        Tests the PATCH method for the '/forecasts' endpoint
+        """
+        valid_data_predictions = {
+            'Predictions': [{
+                "Date": "2030-01-01",
+                "Predictions": {"Days_in_Advance": 1, "Pred_AQI": 55},
+                "Location": {"Lat": 12, "Long": 40}
+        }]
+        }
+        invalid_data_predictions = {
+            'Predictions': [{'Invalid': -1, "Date": "2030-01-01"}]
+        }
+        valid_data_actual = {
+            'Actual': [{
+            "Date": "2030-01-01",
+            "AQI": 18,
+            "Category": "Good",
+            "Defining_Parameter": "PM2.5",  
+            "Location": {
+                    "Lat": 12,    
+                    "Long": 40
+                    }
+        }]
+        }
+        invalid_data_actual = {
+            'Actual': [{'Invalid': -1, "Date": "2030-01-01"}]
+        }
+        #test resource cannot be accessed without token
+        response = self.client.patch(
+                            self.uri,
+                            headers=self.get_api_headers(),
+                            data=json.dumps(valid_data_predictions)
+                        )
+        self.assertEquals(response.status_code, HttpStatus.method_not_allowed_405.value)
+
+        #test resource cannot be access with invalid token
+        response = self.client.patch(
+                    self.uri + '?token=invalid',
+                    headers=self.get_api_headers(),
+                    data=json.dumps(valid_data_predictions)
+                )
+        self.assertEquals(response.status_code, HttpStatus.method_not_allowed_405.value)
+
+        #test resource cannot be accessed with valid read-only token
+        user_without_write, token_without_write = self.get_user(write_access=0)
+        user_without_write.save()
+
+        response = self.client.patch(
+                    self.uri + f"?token={token_without_write}",
+                    headers=self.get_api_headers(),
+                    data=json.dumps(valid_data_predictions)
+                )
+        self.assertEquals(response.status_code, HttpStatus.forbidden_403.value)
+
+        #Create some data to patch~
+        prediction = Prediction(Days_in_Advance=7, Pred_AQI=55)
+        location = Location(Lat=12, Long=40)
+        forecast = Forecast(Date="2030-01-01", Predictions=[prediction], Location=location)
+        Forecast.objects.insert(forecast)
+
+        forecast_exists = Forecast.objects().first() is not None
+        self.assertTrue(forecast_exists)
+
+        predictions_length_is_1 = len(Forecast.objects().first().Predictions) == 1
+        self.assertTrue(predictions_length_is_1)
+
+        #test resource can be accessed with valid write access token,
+        #but will send bad status if data is invalid format (Prediction Path)
+        user_with_write, token_with_write = self.get_user(write_access=1)
+        user_with_write.save()
+
+        response = self.client.patch(
+                            self.uri + f"?token={token_with_write}",
+                            headers=self.get_api_headers(),
+                            data=json.dumps(invalid_data_predictions)
+                        )
+        self.assertEquals(response.status_code, HttpStatus.bad_request_400.value)
+
+
+        #test resource can be accessed with valid write access token,
+        #and will send a good status if data is valid format,
+        #and data is stored in the db (Prediction Path)
+        response = self.client.patch(
+                    self.uri + f"?token={token_with_write}",
+                    headers=self.get_api_headers(),
+                    data=json.dumps(valid_data_predictions)
+                )
+        self.assertEquals(response.status_code, HttpStatus.ok_200.value)
+
+        #check if existing data was updated with another prediciton
+        predictions_length_is_2 = len(Forecast.objects().first().Predictions) == 2
+        self.assertTrue(predictions_length_is_2)
+        self.assertEqual(response.get_json()['Predictions'], {'matched': 1, 'modified': 1, 'unmatched': 0})
+
+        
+        #test resource can be accessed with valid write access token,
+        #but will send bad status if data is invalid format (Actual Path)
+        response = self.client.patch(
+                            self.uri + f"?token={token_with_write}",
+                            headers=self.get_api_headers(),
+                            data=json.dumps(invalid_data_actual)
+                        )
+        self.assertEquals(response.status_code, HttpStatus.bad_request_400.value)
+
+        #test resource can be accessed with valid write access token,
+        #and will send a good status if data is valid format,
+        #and data is stored in the db (Actual Path)
+        response = self.client.patch(
+                            self.uri + f"?token={token_with_write}",
+                            headers=self.get_api_headers(),
+                            data=json.dumps(valid_data_actual)
+                        )
+        self.assertEquals(response.status_code, HttpStatus.ok_200.value)
+
+        #check if existing data was updated with actual AQI values
+    
+        actual_aqi_exists = Forecast.objects().first().Real_AQI > -1
+        self.assertTrue(actual_aqi_exists)
+
+        #test updates without a matching forecast are reported as unmatched
+        valid_data_actual['Actual'][0]['Date'] = "2031-01-01"
+        response = self.client.patch(
+                            self.uri + f"?token={token_with_write}",
+                            headers=self.get_api_headers(),
+                            data=json.dumps(valid_data_actual)
+                        )
+        self.assertEqual(response.get_json()['Actual'], {'matched': 0, 'modified': 0, 'unmatched': 1})
+
+    def test_run(self):
+        """
+        Tests the POST method for the '/forecasts/run' endpoint
+        """
+        #test the job cannot be run with a read-only token
+        user_without_write, token_without_write = self.get_user(write_access=0)
+        user_without_write.save()
+        response = self.client.post(self.uri + f"/run?token={token_without_write}")
+        self.assertEqual(response.status_code, HttpStatus.forbidden_403.value)
+
+        #30 days of history for one station, 5 days for another
+        end = datetime(2022, 6, 30)
+        for days, lat in ((30, 10), (5, 20)):
+            Historic.objects.insert([Historic(
+                                        Date=(end - timedelta(days=i)).strftime('%Y-%m-%d'),
+                                        AQI=40, Category="Good",
+                                        Location=Location(Lat=lat, Long=10, Full_AQSID=str(lat))
+                                        ) for i in range(days)])
+        Station(AQSID="10", Site_Name="SITE").save()
+
+        #test only stations with enough history are forecast, starting the day after the window (in chunks)
+        self.app.config['BULK_WRITE_CHUNK_SIZE'] = 2
+        user_with_write, token_with_write = self.get_user(write_access=1)
+        user_with_write.save()
+        response = self.client.post(
+                            self.uri + f"/run?token={token_with_write}",
+                            headers=self.get_api_headers(),
+                            data=json.dumps({"End": "2022-06-30"})
+                        )
+        self.assertEqual(response.status_code, HttpStatus.ok_200.value)
+        self.assertEqual(response.get_json()['stations'], 1)
+        self.assertEqual(response.get_json()['skipped'], 1)
+        forecast = Forecast.objects(Date="2022-07-01", Location__Lat=10).first()
+        self.assertEqual(forecast.Predictions[0].Days_in_Advance, 1)
+        self.assertEqual(Forecast.objects(Location__Lat=20).count(), 0)
+        self.assertEqual(response.get_json()['inserted'], response.get_json()['forecasts'])
+
+        #test the forecasts carry the station's AQSID, so its metadata is joined into them
+        self.assertEqual(forecast.Location.Full_AQSID, "10")
+        with self.app.test_request_context():
+            self.assertEqual(station_index.joiner()(forecast.to_mongo().to_dict())['Location']['Site_Name'], "SITE")
+
+        #test running the job again does not duplicate predictions
+        self.client.post(
+                    self.uri + f"/run?token={token_with_write}",
+                    headers=self.get_api_headers(),
+                    data=json.dumps({"End": "2022-06-30"})
+                )
+        forecast = Forecast.objects(Date="2022-07-01", Location__Lat=10).first()
+        self.assertEqual(len(forecast.Predictions), 1)
+
+    def test_fill_gaps(self):
+        """
+        Tests missing days are forward filled (and leading gaps back filled)
+        """
+        windows = np.array([[np.nan, 1, np.nan, 3], [5, np.nan, np.nan, np.nan]])
+        np.testing.assert_array_equal(fill_gaps(windows), [[1, 1, 1, 3], [5, 5, 5, 5]])
\ No newline at end of file
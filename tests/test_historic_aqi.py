@@ -1,143 +1,540 @@
-"""
-This file contains application tests for '/historic-data' api resources
-"""
-from app.http_status import HttpStatus
-from app.models import User, Historic, Location
-from app import create_app
-import unittest
-from mongoengine import connect, disconnect
-import json
-from general_test import GeneralTestCase
-
-class HistoricDataTestCase(GeneralTestCase):
-
-    def setUp(self):
-        """
-        Initializes application in testing config
-        """
-        super().setUp()
-        self.uri = '/api/v1/historic-data'
-
-    def test_get(self):
-        """
-        Tests the GET method for the '/histoic-data' endpoint
-        """
-        #test resource cannot be accessed without token
-        response = self.client.get(self.uri)
-        self.assertEquals(response.status_code, HttpStatus.method_not_allowed_405.value)
-
-        #test resource cannot be access with invalid token
-        response = self.client.get(self.uri + "?token=invalid")
-        self.assertEquals(response.status_code, HttpStatus.method_not_allowed_405.value)
-
-
-        #insert default data (returns when no parameters given)
-        location = Location(Lat=39, Long=-75)
-        default_data = Historic(
-                                Date="2021-08-01", 
-                                AQI=5, Category="Good", 
-                                Defining_Parameter="PM10",
-                                Location=location
-                                )
-        Historic.objects().insert(default_data)
-
-        #test resource can be accessed with valid token and no additional parameters
-        user, token = self.get_user(write_access=0)
-        user.save()
-        response = self.client.get(self.uri + f'?token={token}')
-        self.assertEquals(response.status_code, HttpStatus.ok_200.value)
-
-        #test that default data is returned
-        default_data_was_returned = response.get_json()[0]['AQI'] == 5
-        self.assertTrue(default_data_was_returned)
-
-        #insert customdata (will not return when no parameters given -- needs parameters)
-        location = Location(Lat=0, Long=0)
-        custom_data = Historic(
-                                Date="2020-01-01", 
-                                AQI=100, Category="Moderate", 
-                                Defining_Parameter="PM10",
-                                Location=location
-                                )
-        Historic.objects().insert(custom_data)
-
-        #test resource can be accessed with valid token and additional parameters
-        start, end = "2020-01-01", "2020-01-01"
-        bLat, tLat = -1, 1
-        lLong, rLong = -1, 1
-
-        response = self.client.get(self.uri + \
-            f'?token={token}&start={start}&end={end}&bLat={bLat}&tLat={tLat}&lLong={lLong}&rLong={rLong}')
-        self.assertEquals(response.status_code, HttpStatus.ok_200.value)
-
-        #test that default data is returned
-        custom_data_was_returned = response.get_json()[0]['AQI'] == 100
-        self.assertTrue(custom_data_was_returned)
-
-
-    def test_post(self):
-        """
-        Tests the POST method for the '/forecasts' endpoint
-        """
-        valid_data = {
-            "Date": "2022-06-29",
-            "AQI": 18,
-            "Category": "Good",
-            "Defining_Parameter": "PM2.5",  
-            "Location": {
-                    "Lat": 46.2406,    
-                    "Long": -63.1306,    
-                    "Site_Name": "CHARLOTTETOWN",    
-                    "Full_AQSID": "124000020104"  
-                    }
-        }
-        invalid_data = {'Invalid': -1, 'AQI': 'abc'}
-
-        #test data cannot be posted with no token
-        response = self.client.post(
-                                    self.uri, 
-                                    headers=self.get_api_headers(),
-                                    data=json.dumps([valid_data])
-                                    )
-        
-        self.assertEqual(response.status_code, HttpStatus.method_not_allowed_405.value)
-
-        #test data cannot be posted with invalid token
-        response = self.client.post(
-                                    self.uri+"?token=invalid",
-                                    headers=self.get_api_headers(),
-                                    data=json.dumps([valid_data])
-                                     )
-        
-        self.assertEqual(response.status_code, HttpStatus.method_not_allowed_405.value)
-
-        #test data cannot be posted with token without write access
-        user_without_write, token_without_write = self.get_user(write_access=0)
-        user_without_write.save()
-        response = self.client.post(    
-                                    self.uri+f'?token={token_without_write}',
-                                    headers=self.get_api_headers(),
-                                    data=json.dumps([valid_data])
-                                    )
-        self.assertEqual(response.status_code, HttpStatus.forbidden_403.value)
-
-        #test invalid data cannot be posted with valid token
-        
-        user_with_write, token_with_write = self.get_user(write_access=1)
-        user_with_write.save()
-        response = self.client.post(
-                                    self.uri+f'?token={token_with_write}', 
-                                    headers=self.get_api_headers(),
-                                    data=json.dumps([invalid_data])
-                                    )
-        self.assertEqual(response.status_code, HttpStatus.bad_request_400.value)
-        #test data can be posted and exists in db with a valid token
-        response = self.client.post(
-                                    self.uri+f'?token={token_with_write}', 
-                                    headers=self.get_api_headers(),
-                                    data=json.dumps([valid_data])
-                                    )
-        self.assertEqual(response.status_code, HttpStatus.ok_200.value)
-
-        current_data_exists = Historic.objects().first() is not None
-        self.assertTrue(current_data_exists)
\ No newline at end of file
+"""
+This file contains application tests for '/historic-data' api resources
+"""
+from app.http_status import HttpStatus
+from app.models import User, Historic, Current, Location, Station
+from app import create_app
+import unittest
+from mongoengine import connect, disconnect
+import json
+import gzip
+from general_test import GeneralTestCase
+from app.geo import bbox_polygon
+from app.schema import AQIMeasurementSchema, HistoricQuerySchema
+from app.validation import measurement_validator
+from app.tiles import tile_cache
+from app.ingest import ingest
+from pymongo.errors import OperationFailure
+from app.migrations import migrate_stations, migrate_dates, remove_duplicate_measurements
+from datetime import datetime, timedelta
+from marshmallow import ValidationError
+
+class HistoricDataTestCase(GeneralTestCase):
+
+    def setUp(self):
+        """
+        Initializes application in testing config
+        """
+        super().setUp()
+        self.uri = '/api/v1/historic-data'
+
+    def test_get(self):
+        """
+        Tests the GET method for the '/histoic-data' endpoint
+        """
+        #test resource cannot be accessed without token
+        response = self.client.get(self.uri)
+        self.assertEquals(response.status_code, HttpStatus.method_not_allowed_405.value)
+
+        #test resource cannot be access with invalid token
+        response = self.client.get(self.uri + "?token=invalid")
+        self.assertEquals(response.status_code, HttpStatus.method_not_allowed_405.value)
+
+
+        #insert default data (returns when no parameters given)
+        location = Location(Lat=39, Long=-75)
+        default_data = Historic(
+                                Date="2021-08-01", 
+                                AQI=5, Category="Good", 
+                                Defining_Parameter="PM10",
+                                Location=location
+                                )
+        Historic.objects().insert(default_data)
+
+        #test resource can be accessed with valid token and no additional parameters
+        user, token = self.get_user(write_access=0)
+        user.save()
+        response = self.client.get(self.uri + f'?token={token}')
+        self.assertEquals(response.status_code, HttpStatus.ok_200.value)
+
+        #test that default data is returned
+        default_data_was_returned = response.get_json()[0]['AQI'] == 5
+        self.assertTrue(default_data_was_returned)
+
+        #insert customdata (will not return when no parameters given -- needs parameters)
+        location = Location(Lat=0, Long=0)
+        custom_data = Historic(
+                                Date="2020-01-01", 
+                                AQI=100, Category="Moderate", 
+                                Defining_Parameter="PM10",
+                                Location=location
+                                )
+        Historic.objects().insert(custom_data)
+
+        #test resource can be accessed with valid token and additional parameters
+        start, end = "2020-01-01", "2020-01-01"
+        bLat, tLat = -1, 1
+        lLong, rLong = -1, 1
+
+        response = self.client.get(self.uri + \
+            f'?token={token}&start={start}&end={end}&bLat={bLat}&tLat={tLat}&lLong={lLong}&rLong={rLong}')
+        self.assertEquals(response.status_code, HttpStatus.ok_200.value)
+
+        #test that default data is returned
+        custom_data_was_returned = response.get_json()[0]['AQI'] == 100
+        self.assertTrue(custom_data_was_returned)
+
+
+    def test_get_ndjson(self):
+        """
+        Tests the GET method for the '/historic-data' endpoint streams ndjson when asked
+        """
+        user, token = self.get_user(write_access=0)
+        user.save()
+        for aqi in (10, 20):
+            Historic.objects().insert(Historic(
+                                Date="2020-01-01", 
+                                AQI=aqi, Category="Good", 
+                                Defining_Parameter="PM10",
+                                Location=Location(Lat=0, Long=aqi / 100)
+                                ))
+        query = f'?token={token}&start=2020-01-01&end=2020-01-01&bLat=-1&tLat=1&lLong=-1&rLong=1'
+
+        #test the format parameter selects ndjson
+        response = self.client.get(self.uri + query + '&format=ndjson')
+        self.assertEqual(response.status_code, HttpStatus.ok_200.value)
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual([row['AQI'] for row in rows], [10, 20])
+
+        #test the accept header selects ndjson
+        response = self.client.get(self.uri + query, headers={'Accept': 'application/x-ndjson'})
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        self.assertEqual(len(response.get_data(as_text=True).splitlines()), 2)
+
+
+    def test_get_pages(self):
+        """
+        Tests the GET method for the '/historic-data' endpoint pages through results with a cursor
+        """
+        user, token = self.get_user(write_access=0)
+        user.save()
+        for lat in (0, 0.5, 0.25):
+            Historic.objects().insert(Historic(
+                                Date="2020-01-01", 
+                                AQI=10, Category="Good", 
+                                Defining_Parameter="PM10",
+                                Location=Location(Lat=lat, Long=0)
+                                ))
+        query = f'?token={token}&start=2020-01-01&end=2020-01-01&bLat=-1&tLat=1&lLong=-1&rLong=1&page_size=2'
+
+        #test the first page is full and points to the next page
+        response = self.client.get(self.uri + query)
+        self.assertEqual(response.status_code, HttpStatus.ok_200.value)
+        first_page = response.get_json()
+        self.assertEqual([row['Location']['Lat'] for row in first_page['data']], [0, 0.25])
+        self.assertIsNotNone(first_page['next'])
+
+        #test the last page holds the remaining rows
+        response = self.client.get(self.uri + query + f"&cursor={first_page['next']}")
+        last_page = response.get_json()
+        self.assertEqual([row['Location']['Lat'] for row in last_page['data']], [0.5])
+        self.assertIsNone(last_page['next'])
+
+        #test a tampered cursor is rejected
+        response = self.client.get(self.uri + query + f"&cursor={first_page['next']}x")
+        self.assertEqual(response.status_code, HttpStatus.bad_request_400.value)
+
+
+    def test_post(self):
+        """
+        Tests the POST method for the '/forecasts' endpoint
+        """
+        valid_data = {
+            "Date": "2022-06-29",
+            "AQI": 18,
+            "Category": "Good",
+            "Defining_Parameter": "PM2.5",  
+            "Location": {
+                    "Lat": 46.2406,    
+                    "Long": -63.1306,    
+                    "Site_Name": "CHARLOTTETOWN",    
+                    "Full_AQSID": "124000020104"  
+                    }
+        }
+        invalid_data = {'Invalid': -1, 'AQI': 'abc'}
+
+        #test data cannot be posted with no token
+        response = self.client.post(
+                                    self.uri, 
+                                    headers=self.get_api_headers(),
+                                    data=json.dumps([valid_data])
+                                    )
+        
+        self.assertEqual(response.status_code, HttpStatus.method_not_allowed_405.value)
+
+        #test data cannot be posted with invalid token
+        response = self.client.post(
+                                    self.uri+"?token=invalid",
+                                    headers=self.get_api_headers(),
+                                    data=json.dumps([valid_data])
+                                     )
+        
+        self.assertEqual(response.status_code, HttpStatus.method_not_allowed_405.value)
+
+        #test data cannot be posted with token without write access
+        user_without_write, token_without_write = self.get_user(write_access=0)
+        user_without_write.save()
+        response = self.client.post(    
+                                    self.uri+f'?token={token_without_write}',
+                                    headers=self.get_api_headers(),
+                                    data=json.dumps([valid_data])
+                                    )
+        self.assertEqual(response.status_code, HttpStatus.forbidden_403.value)
+
+        #test invalid data cannot be posted with valid token
+        
+        user_with_write, token_with_write = self.get_user(write_access=1)
+        user_with_write.save()
+        response = self.client.post(
+                                    self.uri+f'?token={token_with_write}', 
+                                    headers=self.get_api_headers(),
+                                    data=json.dumps([invalid_data])
+                                    )
+        self.assertEqual(response.status_code, HttpStatus.bad_request_400.value)
+        #test data can be posted and exists in db with a valid token
+        response = self.client.post(
+                                    self.uri+f'?token={token_with_write}', 
+                                    headers=self.get_api_headers(),
+                                    data=json.dumps([valid_data])
+                                    )
+        self.assertEqual(response.status_code, HttpStatus.ok_200.value)
+
+        current_data_exists = Historic.objects().first() is not None
+        self.assertTrue(current_data_exists)
+
+        #test posted data is stored with a GeoJSON point for 2dsphere queries
+        coordinates = Historic.objects().first().Location.Coordinates['coordinates']
+        self.assertEqual(coordinates, [valid_data['Location']['Long'], valid_data['Location']['Lat']])
+
+        #test re-posting is idempotent and updates changed measurements in place
+        updated_data = dict(valid_data, Date="2022-06-30")
+        response = self.client.post(
+                                    self.uri+f'?token={token_with_write}', 
+                                    headers=self.get_api_headers(),
+                                    data=json.dumps([valid_data, updated_data])
+                                    )
+        self.assertEqual(response.get_json()['inserted'], 1)
+        self.assertEqual(response.get_json()['skipped'], 1)
+        updated_data['AQI'] = 60
+        response = self.client.post(
+                                    self.uri+f'?token={token_with_write}', 
+                                    headers=self.get_api_headers(),
+                                    data=json.dumps([valid_data, updated_data])
+                                    )
+        self.assertEqual(response.get_json()['updated'], 1)
+        self.assertEqual(Historic.objects().count(), 2)
+        self.assertEqual(Historic.objects(Date="2022-06-30").first().Category, "Moderate")
+
+        #test measurements without an AQSID (optional) are stored
+        unregistered_data = dict(valid_data, Location={'Lat': 10.5, 'Long': 20.5})
+        response = self.client.post(
+                                    self.uri+f'?token={token_with_write}', 
+                                    headers=self.get_api_headers(),
+                                    data=json.dumps([unregistered_data])
+                                    )
+        self.assertEqual(response.get_json()['inserted'], 1)
+        self.assertIsNone(Historic.objects(Location__Lat=10.5).first().Location.Full_AQSID)
+
+
+    def test_stations(self):
+        """
+        Tests site metadata is kept in the station registry and joined into the returned documents
+        """
+        user_with_write, token_with_write = self.get_user(write_access=1)
+        user_with_write.save()
+        rows = [{"Date": date, "AQI": 20, "Defining_Parameter": "PM2.5",
+                 "Location": {"Lat": 40.1, "Long": -75.1, "Site_Name": "SITE", "Full_AQSID": "1", "City": "Philadelphia"}}
+                for date in ("2022-06-01", "2022-06-02")]
+        self.client.post(self.uri + f'?token={token_with_write}', headers=self.get_api_headers(), data=json.dumps(rows))
+
+        #test the metadata is stored once, not in the measurements
+        self.assertEqual(Station.objects.count(), 1)
+        self.assertEqual(Station.objects.first().City, "Philadelphia")
+        self.assertNotIn('City', Historic.objects.as_pymongo().first()['Location'])
+
+        #test the metadata is joined into the documents unless omitted
+        query = self.uri + f'?token={token_with_write}&start=2022-06-01&end=2022-06-02&bLat=40&tLat=41&lLong=-76&rLong=-75'
+        response = self.client.get(query)
+        self.assertEqual([row['Location']['City'] for row in response.get_json()], ["Philadelphia"] * 2)
+        response = self.client.get(query + '&stations=false')
+        self.assertNotIn('City', response.get_json()[0]['Location'])
+        response = self.client.get(query + '&fields=AQI,Location.Site_Name')
+        self.assertEqual(response.get_json()[0]['Location'], {'Site_Name': "SITE", 'Full_AQSID': "1"})
+
+        #test changed metadata is served right away
+        rows[0]['Location']['City'] = "Phila"
+        self.client.post(self.uri + f'?token={token_with_write}', headers=self.get_api_headers(), data=json.dumps(rows[:1]))
+        response = self.client.get(query)
+        self.assertEqual(response.get_json()[1]['Location']['City'], "Phila")
+
+        #test the migration moves the metadata of older documents to the registry
+        Historic(Date="2021-01-01", AQI=1, Category="Good",
+                 Location=Location(Lat=10, Long=10, Full_AQSID="2", City="Pittsburgh", State="PA")).save()
+        self.assertEqual(migrate_stations()['historic-data'], 1)
+        self.assertEqual(Station.objects(AQSID="2").first().State, "PA")
+        self.assertNotIn('State', Historic.objects(Date="2021-01-01").as_pymongo().first()['Location'])
+
+
+    def test_dates(self):
+        """
+        Tests dates are stored natively, returned as YYYY-MM-DD and validated against the current day
+        """
+        user_with_write, token_with_write = self.get_user(write_access=1)
+        user_with_write.save()
+        rows = [{"Date": "2022-06-01", "AQI": 20, "Defining_Parameter": "PM2.5",
+                 "Location": {"Lat": 40.1, "Long": -75.1, "Site_Name": "SITE", "Full_AQSID": "1"}}]
+        self.client.post(self.uri + f'?token={token_with_write}', headers=self.get_api_headers(), data=json.dumps(rows))
+        self.assertEqual(Historic.objects.as_pymongo().first()['Date'], datetime(2022, 6, 1))
+
+        #test dates that are not YYYY-MM-DD are rejected
+        rows[0]['Date'] = "2022-06"
+        response = self.client.post(self.uri + f'?token={token_with_write}', headers=self.get_api_headers(), data=json.dumps(rows))
+        self.assertEqual(response.status_code, HttpStatus.bad_request_400.value)
+
+        #test string dates of older documents are migrated (in chunks)
+        Historic._get_collection().insert_many([{"Date": date, "AQI": 30, "Category": "Good",
+                                                 "Location": {"Lat": 40.1, "Long": -75.1}}
+                                                for date in ("2022-06-02", "2022-06-03", "2022-06-04")])
+        self.assertEqual(migrate_dates(chunk_size=2)['historic-data'], 3)
+
+        query = f'?token={token_with_write}&start=2022-06-01&end=2022-06-04&bLat=40&tLat=41&lLong=-76&rLong=-75'
+        response = self.client.get(self.uri + query)
+        self.assertEqual([row['Date'] for row in response.get_json()], ["2022-06-01", "2022-06-02", "2022-06-03", "2022-06-04"])
+        response = self.client.get(self.uri + query + '&page_size=1')
+        self.assertEqual(response.get_json()['data'][0]['Date'], "2022-06-01")
+        response = self.client.get(self.uri + query + f"&page_size=1&cursor={response.get_json()['next']}")
+        self.assertEqual(response.get_json()['data'][0]['Date'], "2022-06-02")
+
+        #test the end of the valid range is the current day
+        tomorrow = (datetime.utcnow() + timedelta(days=1)).strftime('%Y-%m-%d')
+        errors = HistoricQuerySchema().validate({'token': 'token', 'start': '2022-06-01', 'end': tomorrow,
+                                                 'bLat': 40, 'tLat': 41, 'lLong': -76, 'rLong': -75})
+        self.assertIn('end', errors)
+
+
+    def test_dedupe(self):
+        """
+        Tests duplicate measurements stored before the unique index are removed (in chunks), keeping the latest
+        """
+        #(versioned current documents, mongomock groups documents missing a field of the key as one)
+        collection = Current._get_collection()
+        collection.drop_indexes()
+        collection.insert_many([{"Version": "v1", "Date": datetime(2022, 6, day), "AQI": aqi, "Category": "Good",
+                                 "Location": {"Lat": 40.1, "Long": -75.1}}
+                                for day, aqi in ((1, 10), (1, 20), (1, 30), (2, 10), (2, 20), (3, 10))])
+        self.assertEqual(remove_duplicate_measurements(chunk_size=2)['current'], 3)
+        self.assertEqual(sorted(row['AQI'] for row in collection.find()), [10, 20, 30])
+
+
+    def test_post_upload(self):
+        """
+        Tests the POST method for the '/historic-data' endpoint streams ndjson/csv uploads
+        """
+        user_with_write, token_with_write = self.get_user(write_access=1)
+        user_with_write.save()
+        rows = [{"Date": "2022-06-29", "AQI": aqi, "Defining_Parameter": "PM2.5", 
+                 "Location": {"Lat": 46, "Long": aqi, "Site_Name": "SITE", "Full_AQSID": str(aqi)}}
+                for aqi in (10, 20, 30)]
+        lines = [json.dumps(row) for row in rows] + ['{"Date": ', json.dumps({"Date": "2022-06-29", "AQI": "x"})]
+
+        #test gzip ndjson rows are written in chunks and invalid rows are reported per line
+        self.app.config['BULK_WRITE_CHUNK_SIZE'] = 2
+        response = self.client.post(
+                                    self.uri + f'?token={token_with_write}',
+                                    data=gzip.compress('\n'.join(lines).encode()),
+                                    content_type='application/x-ndjson',
+                                    headers={'Content-Encoding': 'gzip'}
+                                    )
+        self.assertEqual(response.status_code, HttpStatus.ok_200.value)
+        result = response.get_json()
+        self.assertEqual((result['inserted'], result['invalid']), (3, 2))
+        self.assertEqual([error['line'] for error in result['errors']], [4, 5])
+        self.assertIn('AQI', result['errors'][1]['errors'])
+        self.assertEqual(Historic.objects().count(), 3)
+
+        #test csv rows are read with their location columns (the AQSID is optional)
+        csv_data = ("Date,AQI,Defining_Parameter,Lat,Long,Site_Name,Full_AQSID\n"
+                    "2022-06-29,10,PM2.5,46,10,SITE,10\n"
+                    "2022-06-29,60,PM2.5,46,40,SITE,\n")
+        response = self.client.post(
+                                    self.uri + f'?token={token_with_write}',
+                                    data=csv_data,
+                                    content_type='text/csv'
+                                    )
+        result = response.get_json()
+        self.assertEqual((result['inserted'], result['skipped'], result['invalid']), (1, 1, 0))
+        self.assertEqual(Historic.objects(Location__Long=40).first().Category, "Moderate")
+
+        #test an unreadable body is rejected
+        response = self.client.post(
+                                    self.uri + f'?token={token_with_write}',
+                                    data=b'not gzip',
+                                    content_type='application/x-ndjson',
+                                    headers={'Content-Encoding': 'gzip'}
+                                    )
+        self.assertEqual(response.status_code, HttpStatus.bad_request_400.value)
+
+        #test the rows of a chunk failing to be written are reported, the other chunks are still written
+        def write(measurements):
+            if measurements[0]['AQI'] == 10:
+                raise OperationFailure('write failed')
+            return {'inserted': len(measurements)}
+        rows = [(line_number, {"Date": "2022-06-29", "AQI": aqi, "Defining_Parameter": "PM2.5", 
+                               "Location": {"Lat": 46, "Long": aqi}}, None)
+                for line_number, aqi in enumerate((10, 20, 30, 40), start=1)]
+        result = ingest(rows, write, chunk_size=2, max_errors=10)
+        self.assertEqual((result['inserted'], result['invalid']), (2, 2))
+        self.assertEqual([error['line'] for error in result['errors']], [1, 2])
+
+
+    def test_get_tiles(self):
+        """
+        Tests bbox queries are served from cached tiles that ingestion invalidates
+        """
+        #test the tile cache is off with a per worker cache backend
+        self.assertFalse(self.app.config['TILE_CACHE_ENABLED'])
+        self.app.config['TILE_CACHE_ENABLED'] = True #the tests run in one process
+
+        user_with_write, token_with_write = self.get_user(write_access=1)
+        user_with_write.save()
+        for lat, long in ((0.5, 0.5), (0.5, 1.5), (1.5, 1.5)):
+            Historic.objects().insert(Historic(Date="2020-01-01", AQI=10, Category="Good", 
+                                                Defining_Parameter="PM10", Location=Location(Lat=lat, Long=long)))
+        query = f'?token={token_with_write}&start=2020-01-01&end=2020-01-01'
+
+        #test the rows are clipped to the box (the tiles hold the whole cells)
+        response = self.client.get(self.uri + query + '&bLat=0&tLat=0.9&lLong=0&rLong=1.9')
+        self.assertEqual([row['Location']['Long'] for row in response.get_json()], [0.5, 1.5])
+        self.assertEqual(tile_cache.stats()['misses'], 2)
+
+        #test a panned box reuses the cached tiles
+        response = self.client.get(self.uri + query + '&bLat=0.2&tLat=1.9&lLong=1&rLong=1.9')
+        self.assertEqual(len(response.get_json()), 2)
+        self.assertEqual(tile_cache.stats(), {'hits': 1, 'misses': 3, 'bypassed': 0})
+
+        #test posting data invalidates the tiles of its date and cell
+        new_row = {"Date": "2020-01-01", "AQI": 20, "Defining_Parameter": "PM10",
+                   "Location": {"Lat": 0.8, "Long": 1.2, "Site_Name": "SITE", "Full_AQSID": "1"}}
+        self.client.post(self.uri + f'?token={token_with_write}', 
+                         headers=self.get_api_headers(), data=json.dumps([new_row]))
+        response = self.client.get(self.uri + query + '&bLat=0&tLat=0.9&lLong=0&rLong=1.9')
+        self.assertEqual([row['AQI'] for row in response.get_json()], [10, 10, 20])
+
+        #test queries covering too many tiles bypass the cache
+        response = self.client.get(self.uri + f'?token={token_with_write}&start=2000-01-01&end=2020-01-01' 
+                                    + '&bLat=0&tLat=0.9&lLong=0&rLong=1.9')
+        self.assertEqual(len(response.get_json()), 3)
+        self.assertEqual(tile_cache.stats()['bypassed'], 1)
+
+
+    def test_workers(self):
+        """
+        Tests writes made through one worker change the data versions and responses of the others
+        """
+        disconnect()
+        other_worker = create_app('testing').test_client() #with its own (per worker) cache
+        disconnect()
+        connect('mongoenginetest', host='mongomock://localhost')
+        user_with_write, token_with_write = self.get_user(write_access=1)
+        user_with_write.save()
+        query = f'?token={token_with_write}&start=2020-01-01&end=2020-01-01&bLat=0&tLat=1&lLong=0&rLong=1'
+        response = self.client.get(self.uri + query)
+        self.assertEqual(response.get_json(), [])
+        etag = response.headers['ETag']
+
+        new_row = {"Date": "2020-01-01", "AQI": 20, "Defining_Parameter": "PM10",
+                   "Location": {"Lat": 0.5, "Long": 0.5, "Site_Name": "SITE", "Full_AQSID": "1"}}
+        other_worker.post(self.uri + f'?token={token_with_write}', 
+                          headers=self.get_api_headers(), data=json.dumps([new_row]))
+        response = self.client.get(self.uri + query, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, HttpStatus.ok_200.value)
+        self.assertEqual([row['Location']['Site_Name'] for row in response.get_json()], ["SITE"])
+
+
+    def test_summary(self):
+        """
+        Tests the '/historic-data/summary' endpoint reads rollups kept up to date by POST
+        """
+        user_with_write, token_with_write = self.get_user(write_access=1)
+        user_with_write.save()
+        rows = [{"Date": date, "AQI": aqi, "Defining_Parameter": "PM2.5",
+                 "Location": {"Lat": lat, "Long": 10.5, "Site_Name": "SITE", "Full_AQSID": "1"}}
+                for date, aqi, lat in (("2022-06-01", 10, 0.2), ("2022-06-01", 60, 0.7), ("2022-06-02", 200, 0.2), 
+                                       ("2022-06-02", 40, 5.5), ("2022-07-01", 30, 0.2))]
+        response = self.client.post(self.uri + f'?token={token_with_write}',
+                                    headers=self.get_api_headers(), data=json.dumps(rows))
+        self.assertEqual(response.status_code, HttpStatus.ok_200.value)
+        query = f'/summary?token={token_with_write}&start=2022-06-01&end=2022-07-31&bLat=0.5&tLat=0.9&lLong=10&rLong=11'
+
+        #test daily summaries of the cells overlapping the box (the 5.5 lat row is in another cell)
+        response = self.client.get(self.uri + query)
+        self.assertEqual(response.status_code, HttpStatus.ok_200.value)
+        days = response.get_json()
+        self.assertEqual([day['Date'] for day in days], ["2022-06-01", "2022-06-02", "2022-07-01"])
+        self.assertEqual((days[0]['Count'], days[0]['Min'], days[0]['Max'], days[0]['Mean']), (2, 10, 60, 35))
+        self.assertEqual(days[0]['Categories'], {"Good": 1, "Moderate": 1})
+        self.assertEqual(days[0]['Percentiles']['P50'], 10)
+
+        #test monthly summaries and that updated measurements are rolled up again
+        rows[0]['AQI'] = 100
+        response = self.client.post(self.uri + f'?token={token_with_write}',
+                                    headers=self.get_api_headers(), data=json.dumps(rows[:1]))
+        self.assertEqual(response.get_json()['updated'], 1)
+        #test equivalent queries share cache keys/ETags
+        response = self.client.get(self.uri + query)
+        equivalent = self.client.get(self.uri + query.replace('bLat=0.5', 'bLat=0.500000001').replace('rLong=11', 'rLong=11.0'))
+        self.assertEqual(equivalent.headers['ETag'], response.headers['ETag'])
+        self.assertEqual(response.get_json()[0]['Max'], 100)
+        response = self.client.get(self.uri + query + '&period=month')
+        months = response.get_json()
+        self.assertEqual([month['Date'] for month in months], ["2022-06", "2022-07"])
+        self.assertEqual((months[0]['Count'], months[0]['Min'], months[0]['Max']), (3, 60, 200))
+        self.assertEqual(months[0]['Percentiles'], {'P25': 60, 'P50': 100, 'P75': 200, 'P90': 200})
+
+        #test invalid queries are rejected
+        response = self.client.get(self.uri + query + '&period=year')
+        self.assertEqual(response.status_code, HttpStatus.bad_request_400.value)
+
+
+    def test_batch_validation(self):
+        """
+        Tests the batch validator used on POST returns the same data and errors as marshmallow
+        """
+        valid_data = {"Date": "2022-06-29", "AQI": 18, "Defining_Parameter": "PM2.5",
+                      "Location": {"Lat": 46.2406, "Long": -63.1306, "Site_Name": "CHARLOTTETOWN"}}
+        rows = [valid_data, dict(valid_data, AQI="18"), dict(valid_data, AQI=18.5, Extra=1), 
+                dict(valid_data, AQI=True), dict(valid_data, Defining_Parameter="PM1"), {}, "row",
+                dict(valid_data, Location={"Lat": "100", "Long": float("nan"), "City": 3}),
+                dict(valid_data, Location=dict(valid_data["Location"], Lat="45.5"))]
+        measurements, errors = measurement_validator.validate(rows)
+        with self.assertRaises(ValidationError) as context:
+            AQIMeasurementSchema(many=True).load(rows)
+        self.assertEqual(errors, context.exception.messages)
+        valid_rows = [row for i, row in enumerate(rows) if i not in errors]
+        self.assertEqual(measurements, AQIMeasurementSchema(many=True).load(valid_rows))
+
+
+    def test_bbox_polygon(self):
+        """
+        Tests the polygon used for $geoWithin bbox queries covers the whole bbox
+        """
+        polygon = bbox_polygon(38, 40, -80, -70)
+        ring = polygon['coordinates'][0]
+        self.assertEqual(ring[0], ring[-1])
+        self.assertTrue(min(lat for long, lat in ring) < 38 and max(lat for long, lat in ring) > 40)
+        self.assertTrue(min(long for long, lat in ring) < -80 and max(long for long, lat in ring) > -70)
+
+        #boxes that wrap around a pole or half the globe cannot be a single polygon
+        self.assertIsNone(bbox_polygon(-90, 90, -80, -70))
+        self.assertIsNone(bbox_polygon(38, 40, -180, 180))
\ No newline at end of file
@@ -1,75 +1,122 @@
-"""
-This file contains application tests for '/model-data' api resources
-"""
-from app.http_status import HttpStatus
-import json
-from general_test import GeneralTestCase
-
-class ModelDataTestCase(GeneralTestCase):
-
-    def setUp(self):
-        """
-        Initializes application in testing config
-        """
-        super().setUp()
-        self.uri = '/api/v1/model-data'
-    
-    def test_post(self):
-        """
-        Tests the POST method for the '/model-data' endpoint
-        """
-        valid_data = {
-            "Start": "2021-06-29",
-            "End": "2021-07-29",
-            "Location": {
-                    "Lat": 46.2406,    
-                    "Long": -63.1306 
-                    }
-        }
-        invalid_data = {'Invalid': -1, 'AQI': 'abc'}
-
-        #test data cannot be posted with no token
-        response = self.client.post(
-                                    self.uri, 
-                                    headers=self.get_api_headers(),
-                                    data=json.dumps([valid_data])
-                                    )
-        
-        self.assertEqual(response.status_code, HttpStatus.method_not_allowed_405.value)
-
-        #test data cannot be posted with invalid token
-        response = self.client.post(
-                                    self.uri+"?token=invalid",
-                                    headers=self.get_api_headers(),
-                                    data=json.dumps([valid_data])
-                                     )
-        
-        self.assertEqual(response.status_code, HttpStatus.method_not_allowed_405.value)
-
-        #test data cannot be posted with token without write access
-        user_without_write, token_without_write = self.get_user(write_access=0)
-        user_without_write.save()
-        response = self.client.post(    
-                                    self.uri+f'?token={token_without_write}',
-                                    headers=self.get_api_headers(),
-                                    data=json.dumps([valid_data])
-                                    )
-        self.assertEqual(response.status_code, HttpStatus.forbidden_403.value)
-
-        #test invalid data cannot be posted with valid token
-        
-        user_with_write, token_with_write = self.get_user(write_access=1)
-        user_with_write.save()
-        response = self.client.post(
-                                    self.uri+f'?token={token_with_write}', 
-                                    headers=self.get_api_headers(),
-                                    data=json.dumps([invalid_data])
-                                    )
-        self.assertEqual(response.status_code, HttpStatus.bad_request_400.value)
-        #test data can be posted and exists in db with a valid token
-        response = self.client.post(
-                                    self.uri+f'?token={token_with_write}', 
-                                    headers=self.get_api_headers(),
-                                    data=json.dumps([valid_data])
-                                    )
-        self.assertEqual(response.status_code, HttpStatus.ok_200.value)
\ No newline at end of file
+"""
+This file contains application tests for '/model-data' api resources
+"""
+from app.http_status import HttpStatus
+import json
+from app.models import HistoricBucket
+from app.buckets import rebuild_buckets
+from app.tiles import tile_cache
+from general_test import GeneralTestCase
+
+class ModelDataTestCase(GeneralTestCase):
+
+    def setUp(self):
+        """
+        Initializes application in testing config
+        """
+        super().setUp()
+        self.uri = '/api/v1/model-data'
+    
+    def test_post(self):
+        """
+        Tests the POST method for the '/model-data' endpoint
+        """
+        valid_data = {
+            "Start": "2021-06-29",
+            "End": "2021-07-29",
+            "Location": {
+                    "Lat": 46.2406,    
+                    "Long": -63.1306 
+                    }
+        }
+        invalid_data = {'Invalid': -1, 'AQI': 'abc'}
+
+        #test data cannot be posted with no token
+        response = self.client.post(
+                                    self.uri, 
+                                    headers=self.get_api_headers(),
+                                    data=json.dumps([valid_data])
+                                    )
+        
+        self.assertEqual(response.status_code, HttpStatus.method_not_allowed_405.value)
+
+        #test data cannot be posted with invalid token
+        response = self.client.post(
+                                    self.uri+"?token=invalid",
+                                    headers=self.get_api_headers(),
+                                    data=json.dumps([valid_data])
+                                     )
+        
+        self.assertEqual(response.status_code, HttpStatus.method_not_allowed_405.value)
+
+        #test data cannot be posted with token without write access
+        user_without_write, token_without_write = self.get_user(write_access=0)
+        user_without_write.save()
+        response = self.client.post(    
+                                    self.uri+f'?token={token_without_write}',
+                                    headers=self.get_api_headers(),
+                                    data=json.dumps([valid_data])
+                                    )
+        self.assertEqual(response.status_code, HttpStatus.forbidden_403.value)
+
+        #test invalid data cannot be posted with valid token
+        
+        user_with_write, token_with_write = self.get_user(write_access=1)
+        user_with_write.save()
+        response = self.client.post(
+                                    self.uri+f'?token={token_with_write}', 
+                                    headers=self.get_api_headers(),
+                                    data=json.dumps([invalid_data])
+                                    )
+        self.assertEqual(response.status_code, HttpStatus.bad_request_400.value)
+        #test data can be posted and exists in db with a valid token
+        response = self.client.post(
+                                    self.uri+f'?token={token_with_write}', 
+                                    headers=self.get_api_headers(),
+                                    data=json.dumps([valid_data])
+                                    )
+        self.assertEqual(response.status_code, HttpStatus.ok_200.value)
+
+    def test_buckets(self):
+        """
+        Tests series read from the monthly buckets match the ones read from the historic documents
+        """
+        user_with_write, token_with_write = self.get_user(write_access=1)
+        user_with_write.save()
+        rows = [{"Date": f"2021-{month:02d}-{day:02d}", "AQI": month * day, "Defining_Parameter": "OZONE",
+                 "Location": {"Lat": 46.2406, "Long": -63.1306, "Site_Name": "SITE", "Full_AQSID": "1"}}
+                for month in (6, 7) for day in range(1, 31)]
+        self.client.post(f'/api/v1/historic-data?token={token_with_write}', 
+                         headers=self.get_api_headers(), data=json.dumps(rows))
+        query = [{"Start": "2021-06-20", "End": "2021-07-10", "Location": {"Lat": 46.2406, "Long": -63.1306}}]
+        response = self.client.post(self.uri + f'?token={token_with_write}', 
+                                    headers=self.get_api_headers(), data=json.dumps(query))
+        expected = response.get_json()
+        self.assertEqual(len(expected), 21)
+
+        #test the buckets are built and kept up to date by POST
+        self.app.config['HISTORIC_BUCKETS'] = True
+        self.assertEqual(rebuild_buckets(), 2)
+        rows[20]['AQI'] = 300
+        self.client.post(f'/api/v1/historic-data?token={token_with_write}', 
+                         headers=self.get_api_headers(), data=json.dumps(rows[20:21]))
+        self.assertEqual(HistoricBucket.objects(Month="2021-06").first().AQI[20], 300)
+        expected[1].update(AQI=300, Category="Very Unhealthy")
+
+        response = self.client.post(self.uri + f'?token={token_with_write}', 
+                                    headers=self.get_api_headers(), data=json.dumps(query))
+        self.assertEqual(response.get_json(), expected)
+
+        #test boxes bypassing the tile cache are read from the buckets
+        self.app.config['TILE_CACHE_ENABLED'] = True
+        tile_cache.max_tiles = 0
+        response = self.client.get(f'/api/v1/historic-data?token={token_with_write}'
+                                   '&start=2021-06-20&end=2021-07-10&bLat=46&tLat=47&lLong=-64&rLong=-63')
+        self.assertEqual(response.get_json(), expected)
+        self.assertEqual(tile_cache.stats()['bypassed'], 1)
+
+        #test they are streamed (in month order) as ndjson
+        response = self.client.get(f'/api/v1/historic-data?token={token_with_write}&format=ndjson'
+                                   '&start=2021-06-20&end=2021-07-10&bLat=46&tLat=47&lLong=-64&rLong=-63&limit=true')
+        self.assertTrue(response.is_streamed)
+        self.assertEqual([json.loads(line) for line in response.data.decode().splitlines()], expected)
@@ -1,76 +1,161 @@
-"""
-This file contains application tests for '/predict' api resources
-"""
-from app.http_status import HttpStatus
-import json
-from general_test import GeneralTestCase
-
-
-class ModelPredictionTestCase(GeneralTestCase):
-
-    def setUp(self):
-        """
-        Initializes application in testing config
-        """
-        super().setUp()
-        self.uri = '/api/v1/predict'
-
-    def test_post(self):
-        """
-        Tests the POST method for the '/predict' endpoint
-        """
-        valid_data = {
-              "data": [[24 for i in range(30)], [25 for i in range(30)]]
-        }
-        invalid_data = {
-            "data": [['a' for i in range(30)]]
-        }
-
-        #test data cannot be posted with no token
-        response = self.client.post(
-                                    self.uri, 
-                                    headers=self.get_api_headers(),
-                                    data=json.dumps(valid_data)
-                                    )
-        
-        self.assertEqual(response.status_code, HttpStatus.method_not_allowed_405.value)
-
-        #test data cannot be posted with invalid token
-        response = self.client.post(
-                                    self.uri+"?token=invalid",
-                                    headers=self.get_api_headers(),
-                                    data=json.dumps(valid_data)
-                                     )
-        
-        self.assertEqual(response.status_code, HttpStatus.method_not_allowed_405.value)
-
-        #test data cannot be posted with token without write access
-        user_without_write, token_without_write = self.get_user(write_access=0)
-        user_without_write.save()
-        response = self.client.post(    
-                                    self.uri+f'?token={token_without_write}',
-                                    headers=self.get_api_headers(),
-                                    data=json.dumps(valid_data)
-                                    )
-        self.assertEqual(response.status_code, HttpStatus.forbidden_403.value)
-
-        #test invalid data cannot be posted with valid token
-        
-        user_with_write, token_with_write = self.get_user(write_access=1)
-        user_with_write.save()
-        response = self.client.post(
-                                    self.uri+f'?token={token_with_write}', 
-                                    headers=self.get_api_headers(),
-                                    data=json.dumps(invalid_data)
-                                    )
-        self.assertEqual(response.status_code, HttpStatus.bad_request_400.value)
-        #test data can be posted and exists in db with a valid token
-        response = self.client.post(
-                                    self.uri+f'?token={token_with_write}', 
-                                    headers=self.get_api_headers(),
-                                    data=json.dumps(valid_data)
-                                    )
-        self.assertEqual(response.status_code, HttpStatus.ok_200.value)
-
-        prediction_exists = 'Predictions' in response.get_json()
-        self.assertTrue(prediction_exists)
\ No newline at end of file
+"""
+This file contains application tests for '/predict' api resources
+"""
+from app.http_status import HttpStatus
+import json
+from general_test import GeneralTestCase
+from app.inference import BatchPredictor
+from app.model_runtime import KerasRuntime, NumpyRuntime, export_numpy
+from app.aqi import get_category, get_categories
+import tempfile
+import os
+from threading import Thread
+import numpy as np
+
+
+class ModelPredictionTestCase(GeneralTestCase):
+
+    def setUp(self):
+        """
+        Initializes application in testing config
+        """
+        super().setUp()
+        self.uri = '/api/v1/predict'
+
+    def test_post(self):
+        """
+        Tests the POST method for the '/predict' endpoint
+        """
+        valid_data = {
+              "data": [[24 for i in range(30)], [25 for i in range(30)]]
+        }
+        invalid_data = {
+            "data": [['a' for i in range(30)]]
+        }
+
+        #test data cannot be posted with no token
+        response = self.client.post(
+                                    self.uri, 
+                                    headers=self.get_api_headers(),
+                                    data=json.dumps(valid_data)
+                                    )
+        
+        self.assertEqual(response.status_code, HttpStatus.method_not_allowed_405.value)
+
+        #test data cannot be posted with invalid token
+        response = self.client.post(
+                                    self.uri+"?token=invalid",
+                                    headers=self.get_api_headers(),
+                                    data=json.dumps(valid_data)
+                                     )
+        
+        self.assertEqual(response.status_code, HttpStatus.method_not_allowed_405.value)
+
+        #test data cannot be posted with token without write access
+        user_without_write, token_without_write = self.get_user(write_access=0)
+        user_without_write.save()
+        response = self.client.post(    
+                                    self.uri+f'?token={token_without_write}',
+                                    headers=self.get_api_headers(),
+                                    data=json.dumps(valid_data)
+                                    )
+        self.assertEqual(response.status_code, HttpStatus.forbidden_403.value)
+
+        #test invalid data cannot be posted with valid token
+        
+        user_with_write, token_with_write = self.get_user(write_access=1)
+        user_with_write.save()
+        response = self.client.post(
+                                    self.uri+f'?token={token_with_write}', 
+                                    headers=self.get_api_headers(),
+                                    data=json.dumps(invalid_data)
+                                    )
+        self.assertEqual(response.status_code, HttpStatus.bad_request_400.value)
+        #test data can be posted and exists in db with a valid token
+        response = self.client.post(
+                                    self.uri+f'?token={token_with_write}', 
+                                    headers=self.get_api_headers(),
+                                    data=json.dumps(valid_data)
+                                    )
+        self.assertEqual(response.status_code, HttpStatus.ok_200.value)
+
+        prediction_exists = 'Predictions' in response.get_json()
+        self.assertTrue(prediction_exists)
+
+        #test every prediction is returned with its category
+        predictions, categories = response.get_json()['Predictions'], response.get_json()['Categories']
+        self.assertEqual(categories, get_categories(predictions))
+        self.assertEqual(np.shape(categories), np.shape(predictions))
+
+    def test_categories(self):
+        """
+        Tests batch category binning
+        """
+        values = [0, 50, 50.5, 51, 100, 101, 150, 151, 200, 201, 300, 301, 500, 1000]
+        self.assertEqual(get_categories(values), [get_category(aqi) for aqi in values])
+        self.assertEqual(get_categories(values)[:4], ["Good", "Good", "Moderate", "Moderate"])
+
+    def test_batching(self):
+        """
+        Tests concurrent predictions are coalesced into shared model calls
+        """
+        batch_sizes = []
+        def predict(inputs):
+            batch_sizes.append(len(inputs))
+            return inputs * 2
+
+        predictor = BatchPredictor(predict, max_batch=64, max_wait_ms=50)
+        results = {}
+        def call(i):
+            results[i] = predictor.predict(np.full((2, 30, 1), i))
+        threads = [Thread(target=call, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        #test every caller gets its own rows back
+        for i in range(8):
+            self.assertTrue((results[i] == 2 * i).all())
+            self.assertEqual(results[i].shape, (2, 30, 1))
+
+        #test calls were coalesced into fewer model calls
+        self.assertEqual(sum(batch_sizes), 16)
+        self.assertLess(len(batch_sizes), 8)
+        self.assertEqual(predictor.stats()['requests'], 8)
+
+    def test_inference_disabled(self):
+        """
+        Tests the '/predict' endpoint is unavailable when inference is disabled
+        """
+        self.app.config['INFERENCE_ENABLED'] = False
+        user_with_write, token_with_write = self.get_user(write_access=1)
+        user_with_write.save()
+        response = self.client.post(
+                                    self.uri+f'?token={token_with_write}', 
+                                    headers=self.get_api_headers(),
+                                    data=json.dumps({"data": [[24 for i in range(30)]]})
+                                    )
+        self.assertEqual(response.status_code, HttpStatus.service_unavailable_503.value)
+
+    def test_numpy_runtime_parity(self):
+        """
+        Tests models exported for the numpy runtime predict the same values as keras
+        """
+        import tensorflow as tf
+        layers = tf.keras.layers
+        models = [
+            [layers.LSTM(8), layers.Dense(1)],
+            [layers.GRU(8, return_sequences=True), layers.SimpleRNN(4), layers.Dense(3, activation='relu')],
+            [layers.LSTM(8, return_sequences=True), layers.Dropout(0.2), layers.Flatten(), layers.Dense(1)]
+        ]
+        inputs = np.random.default_rng(0).normal(size=(5, 30, 1)).astype('float32')
+        with tempfile.TemporaryDirectory() as directory:
+            for i, model_layers in enumerate(models):
+                keras_path = os.path.join(directory, f'model{i}.h5')
+                numpy_path = os.path.join(directory, f'model{i}.npz')
+                tf.keras.Sequential([tf.keras.Input((30, 1))] + model_layers).save(keras_path)
+                export_numpy(keras_path, numpy_path)
+
+                expected = KerasRuntime(keras_path).predict(inputs)
+                np.testing.assert_allclose(NumpyRuntime(numpy_path).predict(inputs), expected, atol=1e-5)
\ No newline at end of file
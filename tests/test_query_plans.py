@@ -0,0 +1,201 @@
+"""
+This file contains query plan regression checks. Every read the endpoints send to MongoDB is
+recorded and explained against the declared indexes (see indexes.py), failing if a plan scans
+a collection or examines far more index keys than it returns.
+mongomock does not plan queries, so these tests need a MongoDB server: MONGO_TEST_URI=mongodb://...
+(its 'openaqi-plan-test' database is dropped)
+"""
+import os
+import json
+import unittest
+from datetime import datetime, timedelta
+from pymongo import monitoring
+from mongoengine import connect, disconnect
+from app import create_app
+from app.models import User, Historic, HistoricBucket, Forecast, Current, Location, Prediction
+from app.indexes import create_indexes
+from app.rollups import rebuild_rollups
+from app.buckets import rebuild_buckets
+from app.usage import usage_recorder
+
+MAX_KEYS_PER_RESULT = 10 #index keys a plan may examine per returned document
+KEYS_SLACK = 100 #keys any plan may examine (e.g. skipped while seeking the next matching range)
+SESSION_FIELDS = ('lsid', '$db', '$clusterTime', '$readPreference', 'txnNumber', 'batchSize', 'cursor')
+
+
+class QueryRecorder(monitoring.CommandListener):
+    #records the reads sent to the server
+
+    def __init__(self):
+        self.commands = []
+
+    def started(self, event):
+        if event.command_name in ('find', 'aggregate', 'count', 'distinct'):
+            self.commands.append(dict(event.command))
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def plan_stages(plan):
+    """
+    Returns the names of every stage of an explained plan
+    """
+    stages = set()
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            stages.add(plan['stage'])
+        for value in plan.values():
+            stages |= plan_stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            stages |= plan_stages(value)
+    return stages
+
+
+def execution_stats(explain):
+    """
+    Returns the (first) executionStats of an explained find or aggregation
+    """
+    if isinstance(explain, dict):
+        if 'executionStats' in explain:
+            return explain['executionStats']
+        values = explain.values()
+    elif isinstance(explain, list):
+        values = explain
+    else:
+        return None
+    for value in values:
+        stats = execution_stats(value)
+        if stats is not None:
+            return stats
+    return None
+
+
+@unittest.skipUnless(os.environ.get('MONGO_TEST_URI'), 'query plans need a MongoDB server (MONGO_TEST_URI)')
+class QueryPlansTestCase(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Initializes application in testing config against the MongoDB server, with indexes and seeded data
+        """
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        disconnect()
+        self.recorder = QueryRecorder()
+        connect('openaqi-plan-test', host=os.environ['MONGO_TEST_URI'], event_listeners=[self.recorder])
+        self.db = Historic._get_db()
+        self.db.client.drop_database(self.db.name)
+        create_indexes()
+        self.client = self.app.test_client()
+        self.seed()
+
+    def tearDown(self):
+        usage_recorder.flush()
+        self.db.client.drop_database(self.db.name)
+        disconnect()
+        self.app_context.pop()
+
+    def seed(self):
+        #100 days of 50 stations spread over the USA, their forecasts and current values
+        self.token = 'token1'
+        User(Email='test@gmail.com', Token=self.token, Permission=1).save()
+        self.end = datetime(2022, 6, 30)
+        self.stations = [(30 + i % 10 * 2 + 0.5, -120 + i // 10 * 10 + 0.5) for i in range(50)]
+        historic = [Historic(Date=self.end - timedelta(days=day), AQI=day % 150, Category='Good',
+                             Location=Location(Lat=lat, Long=long, Coordinates=[long, lat]))
+                    for day in range(100) for lat, long in self.stations]
+        Historic.objects.insert(historic)
+        today = datetime.combine(datetime.utcnow().date(), datetime.min.time())
+        Forecast.objects.insert([Forecast(Date=today + timedelta(days=day), Predictions=[Prediction(
+                                            Days_in_Advance=day + 1, Pred_AQI=50, Pred_Category='Good')],
+                                          Location=Location(Lat=lat, Long=long, Coordinates=[long, lat]))
+                                 for day in range(-10, 7) for lat, long in self.stations])
+        Current.objects.insert([Current(Date=self.end, AQI=10, Category='Good',
+                                        Location=Location(Lat=lat, Long=long, Coordinates=[long, lat]))
+                                for lat, long in self.stations])
+        rebuild_rollups()
+        rebuild_buckets()
+
+    def assert_plans(self, requests, collections=None):
+        """
+        Sends the requests, then explains every filtered read they sent (to the given collections) and checks its plan
+        """
+        self.recorder.commands.clear()
+        for method, uri, data in requests:
+            response = self.client.open(uri, method=method, json=data)
+            self.assertEqual(response.status_code, 200, uri)
+        commands = [command for command in self.recorder.commands
+                        if command.get('filter') or command.get('query') or command.get('pipeline')]
+        if collections is not None:
+            commands = [command for command in commands if next(iter(command.values())) in collections]
+        self.assertTrue(commands)
+
+        for command in commands:
+            command = {key: value for key, value in command.items() if key not in SESSION_FIELDS}
+            if 'pipeline' in command:
+                command['cursor'] = {}
+            #whole collection reads (e.g. loading the station registry) are deliberate scans
+            if 'pipeline' in command and not any('$match' in stage and stage['$match'] for stage in command['pipeline']):
+                continue
+            explain = self.db.command('explain', command, verbosity='executionStats')
+            stats = execution_stats(explain)
+            description = json.dumps(command, default=str)
+            self.assertNotIn('COLLSCAN', plan_stages(explain.get('queryPlanner', explain)), description)
+            self.assertLessEqual(stats['totalKeysExamined'], stats['nReturned'] * MAX_KEYS_PER_RESULT + KEYS_SLACK,
+                                 description)
+
+    def test_read_plans(self):
+        """
+        Tests the reads of every GET endpoint (and /model-data) use an index, with and without geo queries
+        """
+        box = 'bLat=34&tLat=40&lLong=-110&rLong=-95'
+        for geo_queries in (False, True):
+            self.app.config['GEO_QUERIES'] = geo_queries
+            self.assert_plans([
+                ('GET', f'/api/v1/current?token={self.token}', None),
+                ('GET', f'/api/v1/historic-data?token={self.token}&start=2022-06-01&end=2022-06-30&{box}', None),
+                ('GET', f'/api/v1/historic-data?token={self.token}&start=2022-04-01&end=2022-06-30&{box}&fields=AQI', None),
+                ('GET', f'/api/v1/historic-data?token={self.token}&start=2022-04-01&end=2022-06-30&{box}&page_size=50', None),
+                ('GET', f'/api/v1/historic-data/summary?token={self.token}&start=2022-04-01&end=2022-06-30&{box}', None),
+                ('GET', f'/api/v1/forecasts?token={self.token}&{box}', None),
+                ('GET', f'/api/v1/forecasts?token={self.token}&{box}&fields=Predictions', None),
+                ('GET', f'/api/v1/current/nearest?token={self.token}&lat=39.95&long=-75.16', None),
+                ('GET', f'/api/v1/forecasts/nearest?token={self.token}&lat=39.95&long=-75.16', None),
+                ('POST', f'/api/v1/model-data?token={self.token}',
+                    [{'Start': '2022-06-01', 'End': '2022-06-30', 'Location': {'Lat': lat, 'Long': long}}
+                        for lat, long in self.stations[:5]]),
+            ])
+
+    def test_cached_read_plans(self):
+        """
+        Tests the reads filling the tile cache (see tiles.py) and the reads of the monthly buckets (see buckets.py) use an index
+        """
+        self.app.config['TILE_CACHE_ENABLED'] = True
+        self.app.config['HISTORIC_BUCKETS'] = True
+        small_box = 'bLat=34&tLat=36&lLong=-110&rLong=-105' #few enough tiles to be cached
+        large_box = 'bLat=34&tLat=40&lLong=-110&rLong=-95' #too many tiles, read from the buckets
+        self.assert_plans([
+            ('GET', f'/api/v1/historic-data?token={self.token}&start=2022-06-01&end=2022-06-30&{small_box}', None),
+            ('GET', f'/api/v1/forecasts?token={self.token}&{small_box}', None),
+            ('GET', f'/api/v1/historic-data?token={self.token}&start=2022-04-01&end=2022-06-30&{large_box}', None),
+            ('POST', f'/api/v1/model-data?token={self.token}',
+                [{'Start': '2022-06-01', 'End': '2022-06-30', 'Location': {'Lat': lat, 'Long': long}}
+                    for lat, long in self.stations[:5]]),
+        ], collections=[Historic._get_collection_name(), HistoricBucket._get_collection_name(), 
+                        Forecast._get_collection_name()])
+        #the tile loads and bucket reads were among the explained reads
+        collections = {next(iter(command.values())) for command in self.recorder.commands}
+        self.assertIn(HistoricBucket._get_collection_name(), collections)
+
+    def test_user_lookups(self):
+        """
+        Tests the token lookups of the token decorators (see token_cache.py) and the email lookups of '/new-user' use an index
+        """
+        self.assert_plans([
+            ('POST', f'/api/v1/new-user?token={self.token}', {'email': 'new@gmail.com'}),
+        ], collections=[User._get_collection_name()])
@@ -0,0 +1,116 @@
+"""
+This file contains application tests for '/stats' api resources
+"""
+from app.http_status import HttpStatus
+from app.models import User, Request
+from app.usage import usage_recorder
+from app.response_cache import response_cache
+from app import cache
+from threading import Thread
+import time
+from general_test import GeneralTestCase
+
+
+class StatsTestCase(GeneralTestCase):
+
+    def setUp(self):
+        """
+        Initializes application in testing config
+        """
+        super().setUp()
+        self.uri = '/api/v1/stats'
+
+    def test_get(self):
+        """
+        Tests the GET method for the '/stats' endpoint
+        """
+        #test stats cannot be read with token without write access
+        user_without_write, token_without_write = self.get_user(write_access=0)
+        user_without_write.save()
+        response = self.client.get(self.uri + f'?token={token_without_write}')
+        self.assertEqual(response.status_code, HttpStatus.forbidden_403.value)
+
+        #test stats can be read with a valid token
+        user_with_write, token_with_write = self.get_user(write_access=1)
+        user_with_write.save()
+        response = self.client.get(self.uri + f'?token={token_with_write}')
+        self.assertEqual(response.status_code, HttpStatus.ok_200.value)
+        self.assertEqual(response.get_json()['token_cache']['misses'], 2)
+
+        #test repeated tokens are served from the token cache
+        response = self.client.get(self.uri + f'?token={token_with_write}')
+        self.assertEqual(response.get_json()['token_cache']['hits'], 1)
+
+    def test_token_cache_invalidation(self):
+        """
+        Tests cached tokens are dropped when users are created or their permission changes
+        """
+        user, token = self.get_user(write_access=1)
+        uri = self.uri + f'?token={token}'
+
+        #test an unknown token is rejected (and remembered as invalid)
+        response = self.client.get(uri)
+        self.assertEqual(response.status_code, HttpStatus.method_not_allowed_405.value)
+
+        #test creating the user makes the token valid straight away
+        User.objects.insert(user)
+        response = self.client.get(uri)
+        self.assertEqual(response.status_code, HttpStatus.ok_200.value)
+
+        #test removing write access is seen straight away
+        user = User.objects(Token=token).first()
+        user.Permission = 0
+        user.save()
+        response = self.client.get(uri)
+        self.assertEqual(response.status_code, HttpStatus.forbidden_403.value)
+
+
+    def test_usage_recording(self):
+        """
+        Tests api usage is buffered and written to the requests collection in bulk
+        """
+        user, token = self.get_user(write_access=0)
+        user.save()
+        for i in range(3):
+            self.client.get(f'/api/v1/historic-data?token={token}')
+
+        usage_recorder.flush()
+        self.assertEqual(Request.objects(User_Token=token, Resource='/historic-data:GET').count(), 3)
+
+    def test_response_cache(self):
+        """
+        Tests concurrent misses of a key are computed once and expired values are served stale while recomputed
+        """
+        computed = []
+        def compute():
+            time.sleep(0.2)
+            computed.append(1)
+            return len(computed), True
+
+        def get():
+            with self.app.app_context():
+                results.append(response_cache.get_or_compute('key', compute, timeout=60))
+
+        #test only one of the concurrent requests computes the value
+        results = []
+        threads = [Thread(target=get) for i in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [1] * 5)
+        self.assertEqual(len(computed), 1)
+        self.assertEqual(response_cache.stats()['coalesced'], 4)
+
+        #test an expired value is served while another worker holds the lock
+        cache.set('key', {'value': 1, 'fresh_until': time.time() - 1})
+        cache.add('lock/key', 'other worker')
+        self.assertEqual(response_cache.get_or_compute('key', compute, timeout=60), 1)
+        self.assertEqual(response_cache.stats()['stale_hits'], 1)
+        self.assertEqual(len(computed), 1)
+
+        #test the value is recomputed once the lock is released
+        cache.delete('lock/key')
+        self.assertEqual(response_cache.get_or_compute('key', compute, timeout=60), 2)
+        self.assertEqual(response_cache.get_or_compute('key', compute, timeout=60), 2)
+        self.assertEqual(response_cache.stats()['hits'], 1)